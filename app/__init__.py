@@ -1,14 +1,54 @@
-from flask import Flask, render_template
-from flask_login import LoginManager, current_user
-from app.models import db, Usuario
-from app.config import Config
+from app.config import Config, config
 
-def create_app():
+# Flask, Flask-Login y los modelos (SQLAlchemy) se importan dentro de las
+# funciones: los scripts de línea de comandos que solo importan `app.config`
+# o `app.seed` no pagan ese costo hasta que realmente construyen la app.
+
+def __getattr__(name):
+    """Permite `from app import db` sin importar SQLAlchemy al cargar el paquete"""
+    if name == 'db':
+        from app.models import db
+        return db
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def create_app(config_name=None, register_blueprints=True, init_database=None):
+    """Construye la app. `init_database` (True/False) reemplaza a
+    INIT_DB_ON_STARTUP: las migraciones y los comandos que crean el esquema
+    por su cuenta pasan False."""
+    from flask import Flask
+    from flask_login import LoginManager, current_user
+    from app.models import db, Usuario
+    
     app = Flask(__name__)
-    app.config.from_object(Config)
+    app.config.from_object(config[config_name] if config_name else Config)
+    if init_database is not None:
+        app.config['INIT_DB_ON_STARTUP'] = init_database
     
-    # Inicializar extensiones
+    # Inicializar extensiones (con las opciones del perfil de engine)
+    from app.utils.database import (engine_options, configure_engines,
+                                    register_replica_bind, init_read_routing)
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config))
+    register_replica_bind(app.config)
     db.init_app(app)
+    configure_engines(app)
+    init_read_routing(app)
+    
+    # Contadores de carga por técnico, tiempos de respuesta e índice de
+    # búsqueda (se actualizan al guardar servicios)
+    from app.utils.scheduler import init_workload_tracking
+    from app.utils.service_search import init_service_search
+    from app.utils.service_stats import init_service_stats
+    init_workload_tracking()
+    init_service_stats()
+    init_service_search()
+    
+    # Teléfono normalizado de clientes (búsqueda por teléfono)
+    from app.utils.clients import init_client_tracking
+    init_client_tracking()
+    
+    # Versiones del catálogo (sincronización por cambios del service worker)
+    from app.utils.catalog import init_catalog_versions
+    init_catalog_versions()
     
     # Configurar Flask-Login
     login_manager = LoginManager()
@@ -63,7 +103,39 @@ def create_app():
             return current_user.rol
         return 'not_authenticated'
     
-    # Registrar Blueprints
+    # Compresión de respuestas y archivos estáticos con huella
+    from app.utils.assets import init_static_assets
+    from app.utils.compression import init_compression
+    init_compression(app)
+    init_static_assets(app)
+    
+    # Caché de bytecode de templates (ver app/utils/templates.py)
+    from app.utils.templates import init_template_cache, precompile_templates
+    init_template_cache(app)
+    
+    # Registrar Blueprints (los scripts de mantenimiento no los necesitan)
+    if register_blueprints:
+        _register_blueprints(app)
+        if app.config['PRECOMPILE_TEMPLATES']:
+            precompile_templates(app)
+    
+    # Registrar manejadores de errores
+    register_error_handlers(app)
+    
+    # Comandos de línea de comandos (flask init-db, flask refresh-replica)
+    register_cli_commands(app)
+    
+    # Crear tablas y datos iniciales solo si el modo de arranque lo pide.
+    # En gunicorn los workers arrancan sin esto y el esquema se crea con
+    # `flask --app run init-db` (ver Procfile).
+    if app.config['INIT_DB_ON_STARTUP']:
+        with app.app_context():
+            init_db(app)
+    
+    return app
+
+def _register_blueprints(app):
+    """Importar y registrar los blueprints de la aplicación"""
     from app.routes.auth import auth_bp
     from app.routes.main import main_bp
     from app.routes.productos import productos_bp
@@ -79,31 +151,141 @@ def create_app():
     app.register_blueprint(servicios_bp, url_prefix='/servicios')
     app.register_blueprint(admin_bp, url_prefix='/admin')
     app.register_blueprint(clientes_bp, url_prefix='/clientes')
+
+def init_db(app):
+    """Crear el directorio de la base de datos, las tablas y los datos iniciales"""
+    import os
+    from app.models import db
+    # Imprimir la ruta de la base de datos para depuración
+    print(f"Usando base de datos: {app.config['SQLALCHEMY_DATABASE_URI']}")
+    # Solo crear directorio si no es una base de datos en memoria
+    if ':memory:' not in app.config['SQLALCHEMY_DATABASE_URI']:
+        db_path = app.config['SQLALCHEMY_DATABASE_URI'].replace('sqlite:///', '')
+        db_dir = os.path.dirname(db_path)
+        if db_dir:  # Solo si hay un directorio para crear
+            print(f"Directorio de la base de datos: {db_dir}")
+            if not os.path.exists(db_dir):
+                print(f"Creando directorio: {db_dir}")
+                os.makedirs(db_dir, exist_ok=True)
+    db.create_all()
+    create_initial_data()
+
+def register_cli_commands(app):
+    """Registrar comandos de Flask CLI"""
+    import click
     
-    # Registrar manejadores de errores
-    register_error_handlers(app)
+    @app.cli.command('init-db')
+    def init_db_command():
+        """Crear el esquema y los datos iniciales de la base de datos"""
+        # Con INIT_DB_ON_STARTUP=1 create_app ya lo hizo al construir la app
+        if not app.config['INIT_DB_ON_STARTUP']:
+            init_db(app)
+        print("✅ Base de datos inicializada")
     
-    # Crear tablas y datos iniciales
-    with app.app_context():
-        # Imprimir la ruta de la base de datos para depuración
-        import os
-        print(f"Usando base de datos: {app.config['SQLALCHEMY_DATABASE_URI']}")
-        # Solo crear directorio si no es una base de datos en memoria
-        if ':memory:' not in app.config['SQLALCHEMY_DATABASE_URI']:
-            db_path = app.config['SQLALCHEMY_DATABASE_URI'].replace('sqlite:///', '')
-            db_dir = os.path.dirname(db_path)
-            if db_dir:  # Solo si hay un directorio para crear
-                print(f"Directorio de la base de datos: {db_dir}")
-                if not os.path.exists(db_dir):
-                    print(f"Creando directorio: {db_dir}")
-                    os.makedirs(db_dir, exist_ok=True)
-        db.create_all()
-        create_initial_data()
+    @app.cli.command('refresh-replica')
+    def refresh_replica_command():
+        """Refrescar la copia SQLite de solo lectura usada por los reportes"""
+        from app.utils.database import refresh_sqlite_replica
+        refresh_sqlite_replica(app)
+        print("✅ Réplica actualizada")
     
-    return app
+    @app.cli.command('rebuild-workload')
+    def rebuild_workload_command():
+        """Recalcular los contadores de servicios abiertos por técnico"""
+        from app.utils.scheduler import rebuild_technician_loads
+        loads = rebuild_technician_loads()
+        print(f"✅ Carga recalculada para {len(loads)} técnicos")
+    
+    @app.cli.command('rebuild-service-stats')
+    def rebuild_service_stats_command():
+        """Recalcular los histogramas de tiempos de respuesta de servicios"""
+        from app.utils.service_stats import rebuild_service_stats
+        finished = rebuild_service_stats()
+        print(f"✅ Tiempos de respuesta recalculados con {finished} servicios terminados")
+    
+    @app.cli.command('rebuild-search-index')
+    def rebuild_search_index_command():
+        """Reconstruir el índice de búsqueda de texto de servicios"""
+        from app.utils.service_search import rebuild_search_index
+        indexed = rebuild_search_index()
+        print(f"✅ Índice de búsqueda reconstruido con {indexed} servicios")
+    
+    @app.cli.command('rebuild-client-stats')
+    def rebuild_client_stats_command():
+        """Recalcular el resumen de compras por cliente desde las ventas"""
+        from app.utils.client_stats import rebuild_client_stats
+        count = rebuild_client_stats()
+        print(f"✅ Resumen de compras recalculado para {count} clientes")
+    
+    @app.cli.command('find-duplicate-clients')
+    @click.option('--merge', is_flag=True, help='Fusionar cada grupo en su cliente más antiguo')
+    def find_duplicate_clients_command(merge):
+        """Buscar clientes duplicados comparando solo dentro de cada bloque"""
+        from app.models import db, Cliente
+        from app.utils.client_dedup import duplicate_groups, duplicate_pairs, merge_clients
+        stats = {}
+        groups = duplicate_groups(list(duplicate_pairs(stats=stats)))
+        print(f"{stats['bloques']} bloques, {stats['comparaciones']} comparaciones, {len(groups)} grupos de duplicados")
+        for column, value, size in stats['omitidos']:
+            print(f"   Bloque omitido por tamaño: {column}={value!r} ({size} clientes)")
+        for group in groups:
+            nombres = dict(db.session.query(Cliente.id, Cliente.nombre).filter(Cliente.id.in_(group)))
+            print("   " + ", ".join(f"#{cliente_id} {nombres.get(cliente_id)}" for cliente_id in group))
+            if merge:
+                merge_clients(group[0], group[1:])
+                db.session.commit()
+        if merge:
+            print(f"✅ {len(groups)} grupos fusionados")
+    
+    @app.cli.command('import-records')
+    @click.argument('archivo', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--tipo', type=click.Choice(['celular', 'accesorio', 'usuario']), required=True,
+                  help='Tipo de registros del archivo')
+    @click.option('--validar', is_flag=True, help='Solo validar, sin guardar')
+    def import_records_command(archivo, tipo, validar):
+        """Importar celulares, accesorios o usuarios desde un CSV o JSON (se valida todo el lote)"""
+        from app.utils.bulk_import import import_records, read_records
+        from app.utils.validators import batch_summary
+        try:
+            records = read_records(archivo)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+        errors, saved = import_records(records, tipo, save=not validar)
+        summary = batch_summary(errors)
+        for error in summary['errores']:
+            print(f"   Registro {error['registro'] + 1}: {error['campo']}: {error['mensaje']}")
+        if summary['errores']:
+            raise click.ClickException(f"{len(records) - summary['validos']} de {len(records)} registros con "
+                                       f"errores; no se guardó ninguno")
+        if validar:
+            print(f"✅ {summary['validos']} registros válidos")
+        else:
+            print(f"✅ {saved} registros importados")
+    
+    @app.cli.command('download-vendor-assets')
+    def download_vendor_assets_command():
+        """Descargar las librerías de CDN a app/static/vendor para servirlas localmente"""
+        from app.utils.assets import download_vendor_assets
+        written = download_vendor_assets(app.static_folder)
+        print(f"✅ {len(written)} archivos descargados en {app.static_folder}/vendor")
+    
+    @app.cli.command('archive-sales')
+    @click.option('--months', type=int, default=None,
+                  help='Antigüedad mínima en meses (por defecto SALES_ARCHIVE_MONTHS)')
+    @click.option('--batch-size', type=int, default=None, help='Ventas por lote')
+    def archive_sales_command(months, batch_size):
+        """Mover las ventas cerradas antiguas a las tablas de archivo"""
+        from app.utils.archive import archive_sales
+        months = months if months is not None else app.config['SALES_ARCHIVE_MONTHS']
+        moved = archive_sales(months,
+                              batch_size=batch_size or app.config['SALES_ARCHIVE_BATCH_SIZE'],
+                              pause=app.config['SALES_ARCHIVE_PAUSE'],
+                              progress=lambda n: print(f"\r   {n} ventas archivadas", end='', flush=True))
+        print(f"\n✅ {moved} ventas con más de {months} meses movidas al archivo")
 
 def register_error_handlers(app):
     """Registrar manejadores de errores personalizados"""
+    from flask import render_template
     
     @app.errorhandler(404)
     def page_not_found(e):
@@ -116,6 +298,7 @@ def register_error_handlers(app):
 def create_initial_data():
     """Crear datos iniciales si no existen"""
     from werkzeug.security import generate_password_hash
+    from app.models import db, Usuario
     
     # Crear usuario admin si no existe
     admin = Usuario.query.filter_by(username='admin').first()
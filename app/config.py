@@ -10,6 +10,65 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or f'sqlite:///{db_path}'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # Modo de arranque: crear tablas y datos iniciales dentro de create_app.
+    # Con INIT_DB_ON_STARTUP=0 los workers solo construyen la app y el esquema
+    # se crea con `flask --app run init-db`.
+    INIT_DB_ON_STARTUP = os.environ.get('INIT_DB_ON_STARTUP', '1') == '1'
+    
+    # Perfil del engine: 'tuned' aplica WAL y pragmas al conectar en SQLite y
+    # configura el pool en PostgreSQL; 'default' usa las opciones de SQLAlchemy.
+    DB_ENGINE_PROFILE = os.environ.get('DB_ENGINE_PROFILE', 'tuned')
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',    # los lectores no bloquean al escritor
+        'synchronous': 'NORMAL',  # seguro con WAL; fsync solo en checkpoints
+        'cache_size': -20000,     # ~20 MB de caché de páginas por conexión
+        'mmap_size': 268435456,   # 256 MB de lecturas vía mmap
+        'busy_timeout': 5000,     # esperar 5 s por un lock antes de fallar
+        'temp_store': 'MEMORY',
+    }
+    # Pool de conexiones (PostgreSQL u otros servidores)
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+    DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 30))
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+    
+    # Réplica de solo lectura para reportes (réplica de PostgreSQL o copia
+    # SQLite refrescada con `flask refresh-replica`). Si su retraso supera
+    # REPLICA_MAX_LAG_SECONDS los reportes vuelven a la base principal.
+    REPLICA_DATABASE_URL = os.environ.get('REPLICA_DATABASE_URL')
+    REPLICA_MAX_LAG_SECONDS = int(os.environ.get('REPLICA_MAX_LAG_SECONDS', 300))
+    REPLICA_LAG_CHECK_INTERVAL = 10  # segundos entre comprobaciones de retraso
+    
+    # Archivo de ventas: `flask archive-sales` mueve las ventas cerradas con
+    # más de SALES_ARCHIVE_MONTHS meses a venta_archivo/detalle_venta_archivo
+    SALES_ARCHIVE_MONTHS = int(os.environ.get('SALES_ARCHIVE_MONTHS', 24))
+    SALES_ARCHIVE_BATCH_SIZE = 500
+    SALES_ARCHIVE_PAUSE = 0.05  # segundos entre lotes
+    
+    # Templates: caché de bytecode de Jinja en disco, compartida por los
+    # workers (vacío para desactivarla), y precompilación de todos los
+    # templates al crear la app en lugar de en la primera petición
+    TEMPLATE_CACHE_DIR = os.environ.get('TEMPLATE_CACHE_DIR', os.path.join(instance_path, 'jinja_cache'))
+    PRECOMPILE_TEMPLATES = os.environ.get('PRECOMPILE_TEMPLATES', '0') == '1'
+    
+    # Compresión de respuestas (brotli si está instalado, si no gzip) de los
+    # tipos de COMPRESS_MIMETYPES desde COMPRESS_MIN_SIZE bytes
+    COMPRESS_RESPONSES = os.environ.get('COMPRESS_RESPONSES', '1') == '1'
+    COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+    COMPRESS_MIMETYPES = frozenset({
+        'text/html', 'text/css', 'text/plain', 'text/javascript', 'application/javascript',
+        'application/json', 'application/manifest+json', 'image/svg+xml',
+    })
+    COMPRESS_GZIP_LEVEL = 6
+    COMPRESS_BROTLI_QUALITY = 5
+    
+    # Archivos estáticos: huella del contenido en el nombre (url_for) y caché
+    # inmutable de un año para esos nombres. USE_LOCAL_VENDOR usa las copias
+    # de static/vendor (flask download-vendor-assets) en lugar de la CDN.
+    STATIC_FINGERPRINTS = os.environ.get('STATIC_FINGERPRINTS', '1') == '1'
+    STATIC_IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+    USE_LOCAL_VENDOR = os.environ.get('USE_LOCAL_VENDOR', '1') == '1'
+    
     # Configuraciones adicionales
     PERMANENT_SESSION_LIFETIME = timedelta(hours=2)
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
@@ -29,6 +88,7 @@ class ProductionConfig(Config):
 class TestingConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///./test.db'
+    TEMPLATE_CACHE_DIR = None
 
 
 config = {
@@ -7,10 +7,18 @@ db = SQLAlchemy()
 class Cliente(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     nombre = db.Column(db.String(120), nullable=False)
+    email = db.Column(db.String(120))
     telefono = db.Column(db.String(20))
+    telefono_normalizado = db.Column(db.String(15), index=True)  # Solo dígitos (ver app/utils/clients.py)
+    nombre_fonetico = db.Column(db.String(60), index=True)  # Clave de duplicados (ver app/utils/clients.py)
     direccion = db.Column(db.Text)
     fecha_registro = db.Column(db.DateTime, default=datetime.utcnow)
     ventas = db.relationship('Venta', backref='cliente', lazy=True)
+    
+    # Listado por nombre (sin distinguir mayúsculas) y búsqueda por prefijo
+    __table_args__ = (
+        db.Index('ix_cliente_nombre', db.func.lower(nombre), id),
+    )
 
 class Usuario(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -45,6 +53,7 @@ class Celular(db.Model):
     especificaciones = db.Column(db.JSON)  # Almacena RAM, almacenamiento, color, etc.
     estado = db.Column(db.String(20), default='nuevo')  # nuevo, reacondicionado
     imei = db.Column(db.String(50), unique=True)
+    version_catalogo = db.Column(db.Integer, index=True)  # Último cambio (ver app/utils/catalog.py)
 
 class Accesorio(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -55,6 +64,7 @@ class Accesorio(db.Model):
     stock = db.Column(db.Integer, nullable=False)
     descripcion = db.Column(db.Text)
     codigo_producto = db.Column(db.String(50), unique=True)
+    version_catalogo = db.Column(db.Integer, index=True)  # Último cambio (ver app/utils/catalog.py)
 
 class ServicioTV(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -71,11 +81,17 @@ class Venta(db.Model):
     cliente_id = db.Column(db.Integer, db.ForeignKey('cliente.id'), nullable=True)
     cliente_nombre = db.Column(db.String(120), nullable=False)
     cliente_telefono = db.Column(db.String(20))
-    fecha_venta = db.Column(db.DateTime, default=datetime.utcnow)
+    fecha_venta = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     total = db.Column(db.Float, default=0.0)
     metodo_pago = db.Column(db.String(50))  # efectivo, tarjeta, transferencia
     estado = db.Column(db.String(20), default='completada')  # completada, cancelada
     detalles = db.relationship('DetalleVenta', backref='venta', lazy=True)
+    archivada = False
+    
+    # Historial y resumen de compras por cliente
+    __table_args__ = (
+        db.Index('ix_venta_cliente_fecha', 'cliente_id', 'fecha_venta'),
+    )
 
 class DetalleVenta(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -87,6 +103,37 @@ class DetalleVenta(db.Model):
     garantia = db.Column(db.String(100))  # Información de garantía si aplica
     notas = db.Column(db.Text)
 
+# Ventas cerradas antiguas movidas por `flask archive-sales` (ver
+# app/utils/archive.py). Mismas columnas que Venta y DetalleVenta.
+class VentaArchivo(db.Model):
+    id = db.Column(db.Integer, primary_key=True)  # Mismo id que tenía en venta
+    vendedor_id = db.Column(db.Integer, db.ForeignKey('usuario.id'), nullable=False)
+    cliente_id = db.Column(db.Integer, db.ForeignKey('cliente.id'), nullable=True)
+    cliente_nombre = db.Column(db.String(120), nullable=False)
+    cliente_telefono = db.Column(db.String(20))
+    fecha_venta = db.Column(db.DateTime, index=True)
+    total = db.Column(db.Float, default=0.0)
+    metodo_pago = db.Column(db.String(50))
+    estado = db.Column(db.String(20))
+    detalles = db.relationship('DetalleVentaArchivo', backref='venta', lazy=True)
+    vendedor = db.relationship('Usuario')
+    cliente = db.relationship('Cliente')
+    archivada = True
+    
+    __table_args__ = (
+        db.Index('ix_venta_archivo_cliente_fecha', 'cliente_id', 'fecha_venta'),
+    )
+
+class DetalleVentaArchivo(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    venta_id = db.Column(db.Integer, db.ForeignKey('venta_archivo.id'), nullable=False, index=True)
+    tipo_producto = db.Column(db.String(20))
+    producto_id = db.Column(db.Integer, nullable=False)
+    cantidad = db.Column(db.Integer, nullable=False)
+    precio_unitario = db.Column(db.Float, nullable=False)
+    garantia = db.Column(db.String(100))
+    notas = db.Column(db.Text)
+
 class Servicio(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     tipo = db.Column(db.String(50), nullable=False)  # reparación, mantenimiento, instalación
@@ -95,9 +142,94 @@ class Servicio(db.Model):
     cliente_telefono = db.Column(db.String(20))
     fecha_recepcion = db.Column(db.DateTime, default=datetime.utcnow)
     fecha_entrega_estimada = db.Column(db.DateTime)
-    estado = db.Column(db.String(20), default='pendiente')  # pendiente, en_proceso, completado
+    estado = db.Column(db.String(20), default='pendiente')  # ver SERVICE_STATES en app/utils/service_events.py
     costo = db.Column(db.Float)
     tecnico_id = db.Column(db.Integer, db.ForeignKey('usuario.id'))
-    notas_tecnicas = db.Column(db.Text)
+    notas_tecnicas = db.Column(db.Text)  # Histórico: las notas nuevas van a ServicioEvento
+    fecha_finalizacion = db.Column(db.DateTime)  # Al pasar a completado (o entregado)
+    
+    tecnico = db.relationship('Usuario', backref='servicios')
     
-    tecnico = db.relationship('Usuario', backref='servicios')
\ No newline at end of file
+    # Listados por estado (abiertos por defecto), técnico y fecha de recepción
+    __table_args__ = (
+        db.Index('ix_servicio_tecnico_estado_fecha', 'tecnico_id', 'estado', 'fecha_recepcion'),
+        db.Index('ix_servicio_estado_fecha', 'estado', 'fecha_recepcion'),
+    )
+
+class ServicioEvento(db.Model):
+    """Historial de un servicio técnico: solo se agregan filas (ver app/utils/service_events.py)"""
+    id = db.Column(db.Integer, primary_key=True)
+    servicio_id = db.Column(db.Integer, db.ForeignKey('servicio.id'), nullable=False)
+    fecha = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    tipo = db.Column(db.String(20), nullable=False)  # creacion, estado, nota, diagnostico, cancelacion
+    usuario_id = db.Column(db.Integer, db.ForeignKey('usuario.id'))
+    estado_anterior = db.Column(db.String(20))
+    estado_nuevo = db.Column(db.String(20))
+    texto = db.Column(db.Text)
+    
+    servicio = db.relationship('Servicio', backref=db.backref('eventos', lazy='dynamic',
+                                                              cascade='all, delete-orphan'))
+    usuario = db.relationship('Usuario')
+    
+    __table_args__ = (
+        db.Index('ix_servicio_evento_servicio_fecha', 'servicio_id', 'fecha'),
+    )
+
+class BackfillProgreso(db.Model):
+    """Punto de control de un backfill por lotes (ver app/utils/backfill.py)"""
+    nombre = db.Column(db.String(100), primary_key=True)
+    ultimo_id = db.Column(db.Integer, nullable=False, default=0)  # Última clave primaria procesada
+    procesadas = db.Column(db.Integer, nullable=False, default=0)
+    modificadas = db.Column(db.Integer, nullable=False, default=0)
+    fecha_inicio = db.Column(db.DateTime, default=datetime.utcnow)
+    fecha_actualizacion = db.Column(db.DateTime, default=datetime.utcnow)
+    fecha_fin = db.Column(db.DateTime)
+
+class CargaTecnico(db.Model):
+    """Servicios abiertos por técnico, mantenido al guardar cada Servicio (ver app/utils/scheduler.py)"""
+    tecnico_id = db.Column(db.Integer, db.ForeignKey('usuario.id'), primary_key=True)
+    abiertos = db.Column(db.Integer, nullable=False, default=0)  # pendiente + en_progreso
+
+class TiempoServicio(db.Model):
+    """Histograma de tiempos de respuesta de servicios terminados, mantenido al
+    guardar cada Servicio (ver app/utils/service_stats.py)"""
+    dimension = db.Column(db.String(20), primary_key=True)  # total, tecnico, tipo
+    clave = db.Column(db.String(100), primary_key=True)  # id del técnico o tipo de servicio
+    cubo = db.Column(db.Integer, primary_key=True)  # índice en TURNAROUND_BUCKETS; -1 = fuera de plazo
+    cantidad = db.Column(db.Integer, nullable=False, default=0)
+
+class ClienteResumen(db.Model):
+    """Historial de compras resumido por cliente (ventas completadas, también
+    las archivadas), mantenido por process_sale y cancel_sale (ver
+    app/utils/client_stats.py)"""
+    cliente_id = db.Column(db.Integer, db.ForeignKey('cliente.id'), primary_key=True)
+    compras = db.Column(db.Integer, nullable=False, default=0)
+    total_gastado = db.Column(db.Float, nullable=False, default=0.0)
+    primera_compra = db.Column(db.DateTime)
+    ultima_compra = db.Column(db.DateTime, index=True)
+    marca_favorita_id = db.Column(db.Integer, db.ForeignKey('marca.id'))
+    
+    cliente = db.relationship('Cliente', backref=db.backref('resumen', uselist=False, cascade='all, delete-orphan'))
+    marca_favorita = db.relationship('Marca')
+
+class ClienteMarca(db.Model):
+    """Unidades compradas por cliente y marca (para la marca favorita)"""
+    cliente_id = db.Column(db.Integer, db.ForeignKey('cliente.id'), primary_key=True)
+    marca_id = db.Column(db.Integer, db.ForeignKey('marca.id'), primary_key=True)
+    unidades = db.Column(db.Integer, nullable=False, default=0)
+    
+    cliente = db.relationship('Cliente', backref=db.backref('marcas', cascade='all, delete-orphan'))
+
+class CatalogoVersion(db.Model):
+    """Contador de versiones del catálogo (una sola fila): cada flush que
+    cambia celulares o accesorios lo incrementa (ver app/utils/catalog.py)"""
+    id = db.Column(db.Integer, primary_key=True)
+    valor = db.Column(db.Integer, nullable=False, default=0)
+
+class CatalogoBaja(db.Model):
+    """Productos eliminados del catálogo, para que los clientes que
+    sincronizan por cambios los borren de su copia local"""
+    id = db.Column(db.Integer, primary_key=True)
+    tipo = db.Column(db.String(20), nullable=False)  # celular, accesorio
+    producto_id = db.Column(db.Integer, nullable=False)
+    version = db.Column(db.Integer, nullable=False, index=True)
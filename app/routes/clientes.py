@@ -1,14 +1,31 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
 from flask_login import login_required, current_user
-from app.models import db, Cliente
+from sqlalchemy import update
+from app.models import db, Cliente, VentaArchivo
+from app.utils.archive import client_sales_page
+from app.utils.client_dedup import client_duplicates, merge_clients
+from app.utils.client_stats import RFM_SEGMENTS, DEFAULT_SEGMENT, rfm_segments
+from app.utils.clients import client_page
+from app.utils.database import read_session
 
 clientes_bp = Blueprint('clientes', __name__)
 
+CLIENTS_PER_PAGE = 25
+SALES_HISTORY_PER_PAGE = 10
+RFM_SEGMENT_NAMES = [name for name, _ in RFM_SEGMENTS] + [DEFAULT_SEGMENT]
+
 @clientes_bp.route('/')
 @login_required
 def lista_clientes():
-    clientes = Cliente.query.order_by(Cliente.nombre).all()
-    return render_template('clientes.html', clientes=clientes)
+    # Paginado por nombre; `q` busca por prefijo de nombre o de teléfono
+    q = (request.args.get('q') or '').strip()
+    try:
+        clientes = client_page(q, request.args.get('despues'), per_page=CLIENTS_PER_PAGE)
+    except ValueError:
+        flash('Página inválida', 'error')
+        return redirect(url_for('clientes.lista_clientes'))
+    filtros = {'q': q} if q else {}
+    return render_template('clientes.html', clientes=clientes, filtros=filtros)
 
 @clientes_bp.route('/', methods=['POST'])
 @login_required
@@ -66,9 +83,116 @@ def actualizar_cliente(id):
 def eliminar_cliente(id):
     cliente = Cliente.query.get_or_404(id)
     try:
+        # Las ventas conservan el nombre y el teléfono; las activas las
+        # desvincula la relación Cliente.ventas, las archivadas esta consulta
+        db.session.execute(update(VentaArchivo).where(VentaArchivo.cliente_id == cliente.id)
+                           .values(cliente_id=None))
         db.session.delete(cliente)
         db.session.commit()
         return jsonify({'success': True})
     except Exception as e:
         db.session.rollback()
-        return jsonify({'error': str(e)}), 400
\ No newline at end of file
+        return jsonify({'error': str(e)}), 400
+
+@clientes_bp.route('/<int:id>/duplicados', methods=['GET'])
+@login_required
+def duplicados_cliente(id):
+    """Posibles duplicados del cliente (mismo teléfono o nombre parecido)"""
+    cliente = Cliente.query.get_or_404(id)
+    return jsonify({'duplicados': [{
+        'id': candidato.id,
+        'nombre': candidato.nombre,
+        'email': candidato.email,
+        'telefono': candidato.telefono,
+        'puntaje': round(puntaje, 2),
+    } for candidato, puntaje in client_duplicates(cliente)]})
+
+@clientes_bp.route('/<int:id>/fusionar', methods=['POST'])
+@login_required
+def fusionar_clientes(id):
+    """Fusiona los clientes {"duplicados": [ids]} en este, moviendo sus ventas"""
+    if current_user.rol not in ['admin', 'gerente']:
+        return jsonify({'error': 'No tienes permisos para fusionar clientes'}), 403
+    
+    data = request.get_json(silent=True) or {}
+    try:
+        ids = [int(i) for i in data.get('duplicados', [])]
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Lista de duplicados inválida'}), 400
+    if not ids:
+        return jsonify({'error': 'Lista de duplicados vacía'}), 400
+    
+    try:
+        ventas = merge_clients(id, ids)
+        db.session.commit()
+        return jsonify({'success': True, 'ventas_movidas': ventas})
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 404
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+
+@clientes_bp.route('/<int:id>/historial', methods=['GET'])
+@login_required
+def historial_cliente(id):
+    """Resumen de compras del cliente y sus ventas (también las archivadas,
+    que el resumen cuenta), de la más reciente a la más antigua, paginadas
+    por cursor (`despues`)"""
+    cliente = Cliente.query.get_or_404(id)
+    try:
+        ventas = client_sales_page(cliente.id, request.args.get('despues'), per_page=SALES_HISTORY_PER_PAGE)
+    except ValueError:
+        return jsonify({'error': 'Cursor inválido'}), 400
+    
+    resumen = cliente.resumen
+    return jsonify({
+        'cliente': {'id': cliente.id, 'nombre': cliente.nombre},
+        'resumen': {
+            'compras': resumen.compras if resumen else 0,
+            'total_gastado': float(resumen.total_gastado) if resumen else 0.0,
+            'primera_compra': resumen.primera_compra.isoformat() if resumen and resumen.primera_compra else None,
+            'ultima_compra': resumen.ultima_compra.isoformat() if resumen and resumen.ultima_compra else None,
+            'marca_favorita': resumen.marca_favorita.nombre if resumen and resumen.marca_favorita else None,
+        },
+        'ventas': [{
+            'id': venta.id,
+            'fecha_venta': venta.fecha_venta.isoformat() if venta.fecha_venta else None,
+            'total': float(venta.total or 0),
+            'metodo_pago': venta.metodo_pago,
+            'estado': venta.estado,
+            'archivada': venta.archivada,
+        } for venta in ventas.items],
+        'siguiente': ventas.next_cursor,
+    })
+
+@clientes_bp.route('/rfm', methods=['GET'])
+@login_required
+def rfm_clientes():
+    """Clientes ordenados por recencia, frecuencia y valor, con su segmento.
+    `segmento` filtra por uno de RFM_SEGMENT_NAMES; `limite` (máx. 500)."""
+    if current_user.rol not in ['admin', 'gerente']:
+        return jsonify({'error': 'No tienes permisos para ver reportes'}), 403
+    
+    segmento = request.args.get('segmento') or None
+    if segmento and segmento not in RFM_SEGMENT_NAMES:
+        return jsonify({'error': f'Segmento inválido: {segmento}'}), 400
+    limite = min(max(request.args.get('limite', 50, type=int), 1), 500)
+    
+    # Reporte de solo lectura: puede ir a la réplica
+    clientes = rfm_segments(segmento, limite, session=read_session())
+    return jsonify({
+        'segmentos': RFM_SEGMENT_NAMES,
+        'clientes': [{
+            'id': c['cliente_id'],
+            'nombre': c['nombre'],
+            'telefono': c['telefono'],
+            'compras': c['compras'],
+            'total_gastado': float(c['total_gastado']),
+            'ultima_compra': c['ultima_compra'].isoformat() if c['ultima_compra'] else None,
+            'marca_favorita': c['marca_favorita'],
+            'rfm': [c['r'], c['f'], c['m']],
+            'segmento': c['segmento'],
+            'en_segmento': c['en_segmento'],
+        } for c in clientes],
+    })
@@ -1,7 +1,8 @@
-from flask import Blueprint, render_template
+from flask import Blueprint, jsonify, render_template
 from flask_login import login_required
 from app.models import db, Celular, Accesorio, Venta, Servicio
 from datetime import datetime
+from app.utils.assets import precache_urls
 from app.utils.dashboard import get_dashboard_stats
 
 main_bp = Blueprint('main', __name__)
@@ -10,4 +11,11 @@ main_bp = Blueprint('main', __name__)
 @login_required
 def index():
     stats = get_dashboard_stats()
-    return render_template('index.html', **stats)
\ No newline at end of file
+    return render_template('index.html', **stats)
+
+@main_bp.route('/sw-precache.json')
+def sw_precache():
+    """Estáticos que el service worker guarda al instalarse (ver static/sw.js)"""
+    response = jsonify({'urls': precache_urls()})
+    response.cache_control.no_cache = True
+    return response
@@ -2,6 +2,8 @@ from flask import Blueprint, render_template, request, redirect, url_for, flash,
 from flask_login import login_required, current_user
 from app.models import db, Celular, Accesorio, Marca, Categoria, ServicioTV
 from app.utils.validators import validate_product_data
+from app.utils.catalog import catalog_changes, search_products, LOOKUP_LIMIT
+from app.utils.database import read_session
 from functools import wraps
 
 productos_bp = Blueprint('productos', __name__)
@@ -474,8 +476,11 @@ def estadisticas():
         flash('No tienes permisos para ver estadísticas', 'error')
         return redirect(url_for('main.index'))
     
+    # Reporte de solo lectura: puede ir a la réplica
+    session = read_session()
+    
     # Estadísticas de celulares
-    celulares_por_marca = db.session.query(
+    celulares_por_marca = session.query(
         Marca.nombre, 
         db.func.count(Celular.id).label('cantidad'),
         db.func.sum(Celular.stock).label('stock_total'),
@@ -483,7 +488,7 @@ def estadisticas():
     ).join(Celular).group_by(Marca.id, Marca.nombre).all()
     
     # Estadísticas de accesorios
-    accesorios_por_categoria = db.session.query(
+    accesorios_por_categoria = session.query(
         Categoria.nombre,
         db.func.count(Accesorio.id).label('cantidad'),
         db.func.sum(Accesorio.stock).label('stock_total'),
@@ -491,20 +496,20 @@ def estadisticas():
     ).join(Accesorio).group_by(Categoria.id, Categoria.nombre).all()
     
     # Productos con bajo stock
-    celulares_bajo_stock = Celular.query.filter(Celular.stock < 5).all()
-    accesorios_bajo_stock = Accesorio.query.filter(Accesorio.stock < 10).all()
+    celulares_bajo_stock = session.query(Celular).filter(Celular.stock < 5).all()
+    accesorios_bajo_stock = session.query(Accesorio).filter(Accesorio.stock < 10).all()
     
     # Totales generales
-    total_celulares = Celular.query.count()
-    total_accesorios = Accesorio.query.count()
+    total_celulares = session.query(Celular).count()
+    total_accesorios = session.query(Accesorio).count()
     valor_total_inventario = (
-        db.session.query(db.func.sum(Celular.precio * Celular.stock)).scalar() or 0 +
-        db.session.query(db.func.sum(Accesorio.precio * Accesorio.stock)).scalar() or 0
+        session.query(db.func.sum(Celular.precio * Celular.stock)).scalar() or 0 +
+        session.query(db.func.sum(Accesorio.precio * Accesorio.stock)).scalar() or 0
     )
     
     # Obtener marcas y categorías para el JavaScript
-    marcas = Marca.query.order_by(Marca.nombre).all()
-    categorias = Categoria.query.order_by(Categoria.nombre).all()
+    marcas = session.query(Marca).order_by(Marca.nombre).all()
+    categorias = session.query(Categoria).order_by(Categoria.nombre).all()
     
     return render_template('estadisticas_productos.html',
                          celulares_por_marca=celulares_por_marca,
@@ -586,4 +591,23 @@ def estadisticas_categoria(categoria_id):
         'stock_total': stock_total,
         'valor_total': float(valor_total),
         'por_marca': marcas_stats
-    })
\ No newline at end of file
+    })
+
+@productos_bp.route('/api/catalogo')
+@login_required
+def catalogo_cambios():
+    """Cambios de precio, stock y productos desde una versión del catálogo
+    (?desde=N; sin versión, el catálogo completo). Lo usa el service worker
+    para mantener su copia local."""
+    desde = request.args.get('desde', 0, type=int)
+    response = jsonify(catalog_changes(desde))
+    response.cache_control.no_store = True
+    return response
+
+@productos_bp.route('/api/buscar')
+@login_required
+def buscar_productos():
+    """Productos con stock que coinciden con ?q= (el service worker responde
+    esta misma ruta desde su copia local del catálogo)"""
+    limite = request.args.get('limite', LOOKUP_LIMIT, type=int)
+    return jsonify({'productos': search_products(request.args.get('q', ''), limite), 'origen': 'servidor'})
@@ -1,11 +1,21 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
 from flask_login import login_required, current_user
+from sqlalchemy.orm import joinedload
 from app.models import db, Servicio, Usuario
 from app.utils.validators import validate_service_data
+from app.utils.database import read_session
+from app.utils.archive import parse_date_range
+from app.utils.pagination import KeysetPage, keyset_paginate
+from app.utils.scheduler import OPEN_STATES, assign_pending, claim_job, next_job, suggest_technician, technician_loads
+from app.utils.service_events import SERVICE_STATES, change_state, event_json, record_event, timeline
+from app.utils.service_search import search_services
+from app.utils.service_stats import turnaround_report
 from datetime import datetime, date
 
 servicios_bp = Blueprint('servicios', __name__)
 
+SERVICES_PER_PAGE = 15
+
 @servicios_bp.route('/tecnicos', methods=['GET', 'POST'])
 @login_required
 def servicios_tecnicos():
@@ -28,6 +38,11 @@ def servicios_tecnicos():
                     flash('Formato de fecha inválido', 'error')
                     return redirect(url_for('servicios.servicios_tecnicos'))
             
+            # "auto": el técnico con menos servicios abiertos
+            tecnico_id = data.get('tecnico_id')
+            if tecnico_id == 'auto':
+                tecnico_id = suggest_technician()
+            
             servicio = Servicio(
                 tipo=data['tipo'],
                 descripcion=data['descripcion'],
@@ -35,12 +50,14 @@ def servicios_tecnicos():
                 cliente_telefono=data['cliente_telefono'],
                 fecha_entrega_estimada=fecha_entrega,
                 costo=float(data['costo']),
-                tecnico_id=int(data['tecnico_id']) if data.get('tecnico_id') else None,
-                notas_tecnicas=data.get('notas_tecnicas', ''),
+                tecnico_id=int(tecnico_id) if tecnico_id else None,
                 estado='pendiente'
             )
             
             db.session.add(servicio)
+            record_event(servicio, 'creacion', estado_nuevo='pendiente')
+            if data.get('notas_tecnicas'):
+                record_event(servicio, 'nota', data['notas_tecnicas'])
             db.session.commit()
             flash('Servicio técnico registrado exitosamente', 'success')
             
@@ -50,34 +67,157 @@ def servicios_tecnicos():
         
         return redirect(url_for('servicios.servicios_tecnicos'))
     
-    # Obtener servicios con paginación
-    page = request.args.get('page', 1, type=int)
-    per_page = 15
-    
-    query = Servicio.query
-    
-    # Filtros
-    estado_filter = request.args.get('estado')
-    if estado_filter:
-        query = query.filter_by(estado=estado_filter)
-    
+    # Por defecto solo servicios abiertos, paginados por cursor
     tecnico_filter = request.args.get('tecnico_id', type=int)
-    if tecnico_filter:
-        query = query.filter_by(tecnico_id=tecnico_filter)
-    
-    servicios = query.order_by(Servicio.fecha_recepcion.desc()).paginate(
-        page=page, per_page=per_page, error_out=False
-    )
+    try:
+        servicios, filtros = _service_page(request.args, tecnico_filter)
+    except ValueError:
+        flash('Página inválida', 'error')
+        return redirect(url_for('servicios.servicios_tecnicos'))
     
+    return _render_service_list(servicios, filtros, tecnico_filter)
+
+def _render_service_list(servicios, filtros, tecnico_filter=None, solo_propios=False):
+    """Página del listado con lo que usan los filtros y los modales.
+    `solo_propios`: listado de un técnico (sin filtro por técnico)."""
     tecnicos = Usuario.query.filter_by(rol='tecnico').order_by(Usuario.nombre).all()
-    estados = ['pendiente', 'en_progreso', 'completado', 'entregado', 'cancelado']
+    cargas = technician_loads()
     
     return render_template('servicios_tecnicos.html',
                          servicios=servicios,
                          tecnicos=tecnicos,
-                         estados=estados,
-                         estado_filter=estado_filter,
-                         tecnico_filter=tecnico_filter)
+                         cargas=cargas,
+                         estados=SERVICE_STATES,
+                         filtros=filtros,
+                         estado_filter=filtros['estado'],
+                         tecnico_filter=tecnico_filter,
+                         solo_propios=solo_propios)
+
+def _service_page(args, tecnico_id=None):
+    """Página de servicios con los filtros de `args`: estado ('abiertos' por
+    defecto, 'todos' o un estado), rango de fechas (desde/hasta), texto a
+    buscar (q) y cursor ('despues'). Con `q` los resultados van por relevancia
+    y el cursor lleva el puntaje del último. Devuelve (página, filtros para
+    los enlaces). ValueError si el cursor no es válido."""
+    q = (args.get('q') or '').strip()
+    estado = args.get('estado') or ('todos' if q else 'abiertos')
+    estados = OPEN_STATES if estado == 'abiertos' else None if estado == 'todos' else (estado,)
+    desde, hasta = parse_date_range(args)
+    
+    filtros = {'estado': estado}
+    if tecnico_id and args.get('tecnico_id'):
+        filtros['tecnico_id'] = tecnico_id
+    filtros.update({name: args[name] for name in ('q', 'desde', 'hasta') if args.get(name)})
+    
+    if q:
+        resultados, next_cursor = search_services(q, estados, tecnico_id, desde, hasta,
+                                                  cursor=args.get('despues'), per_page=SERVICES_PER_PAGE)
+        page = KeysetPage([servicio for servicio, _ in resultados], next_cursor, args.get('despues'),
+                          fragments={servicio.id: fragmento for servicio, fragmento in resultados})
+        return page, filtros
+    
+    query = Servicio.query.options(joinedload(Servicio.tecnico))
+    if estados:
+        query = query.filter(Servicio.estado.in_(estados))
+    if tecnico_id:
+        query = query.filter(Servicio.tecnico_id == tecnico_id)
+    if desde:
+        query = query.filter(Servicio.fecha_recepcion >= desde)
+    if hasta:
+        query = query.filter(Servicio.fecha_recepcion < hasta)
+    
+    page = keyset_paginate(query, Servicio.fecha_recepcion, Servicio.id,
+                           cursor=args.get('despues'), per_page=SERVICES_PER_PAGE)
+    return page, filtros
+
+def _service_list_json(args, tecnico_id=None):
+    try:
+        page, filtros = _service_page(args, tecnico_id)
+    except ValueError:
+        return jsonify({'error': 'Cursor inválido'}), 400
+    return jsonify({
+        'servicios': [{
+            'id': servicio.id,
+            'tipo': servicio.tipo,
+            'descripcion': servicio.descripcion,
+            'cliente_nombre': servicio.cliente_nombre,
+            'cliente_telefono': servicio.cliente_telefono,
+            'estado': servicio.estado,
+            'costo': float(servicio.costo) if servicio.costo is not None else None,
+            'fecha_recepcion': servicio.fecha_recepcion.isoformat(),
+            'fecha_entrega_estimada': servicio.fecha_entrega_estimada.isoformat() if servicio.fecha_entrega_estimada else None,
+            'tecnico_id': servicio.tecnico_id,
+            'tecnico_nombre': servicio.tecnico.nombre if servicio.tecnico else None,
+            'fragmento': page.fragments.get(servicio.id),
+        } for servicio in page.items],
+        'filtros': filtros,
+        'siguiente': page.next_cursor,
+    })
+
+@servicios_bp.route('/api/tecnicos')
+@login_required
+def api_servicios_tecnicos():
+    """Listado de servicios en JSON (PWA): mismos filtros y cursor que /tecnicos"""
+    return _service_list_json(request.args, request.args.get('tecnico_id', type=int))
+
+@servicios_bp.route('/api/mis-servicios')
+@login_required
+def api_mis_servicios():
+    """Servicios del técnico conectado en JSON (PWA)"""
+    if current_user.rol != 'tecnico':
+        return jsonify({'error': 'Solo para técnicos'}), 403
+    return _service_list_json(request.args, current_user.id)
+
+@servicios_bp.route('/tecnicos/asignar-pendientes', methods=['POST'])
+@login_required
+def asignar_pendientes():
+    """Asigna los servicios pendientes sin técnico al menos cargado"""
+    if current_user.rol not in ['admin', 'gerente']:
+        flash('No tienes permisos para asignar servicios', 'error')
+        return redirect(url_for('servicios.servicios_tecnicos'))
+    
+    try:
+        asignados = assign_pending()
+        flash(f'{len(asignados)} servicios asignados', 'success')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Error al asignar servicios: {str(e)}', 'error')
+    
+    return redirect(url_for('servicios.servicios_tecnicos'))
+
+@servicios_bp.route('/tecnicos/siguiente')
+@login_required
+def siguiente_servicio():
+    """Siguiente trabajo del técnico: su pendiente más prioritario o una sugerencia sin asignar"""
+    if current_user.rol != 'tecnico':
+        return jsonify({'error': 'Solo para técnicos'}), 403
+    
+    servicio, asignado = next_job(current_user.id)
+    if servicio is None:
+        return jsonify({'servicio': None})
+    
+    return jsonify({
+        'asignado': asignado,
+        'servicio': {
+            'id': servicio.id,
+            'tipo': servicio.tipo,
+            'descripcion': servicio.descripcion,
+            'cliente_nombre': servicio.cliente_nombre,
+            'fecha_recepcion': servicio.fecha_recepcion.isoformat(),
+            'fecha_entrega_estimada': servicio.fecha_entrega_estimada.isoformat() if servicio.fecha_entrega_estimada else None,
+        }
+    })
+
+@servicios_bp.route('/tecnicos/<int:id>/tomar', methods=['POST'])
+@login_required
+def tomar_servicio(id):
+    """El técnico actual toma un servicio pendiente sin asignar"""
+    if current_user.rol != 'tecnico':
+        return jsonify({'error': 'Solo para técnicos'}), 403
+    
+    if not claim_job(id, current_user.id):
+        return jsonify({'error': 'El servicio ya fue asignado'}), 409
+    return jsonify({'message': 'Servicio asignado'})
 
 @servicios_bp.route('/tecnicos/<int:id>/actualizar', methods=['POST'])
 @login_required
@@ -87,15 +227,17 @@ def actualizar_servicio(id):
     try:
         data = request.form.to_dict()
         
-        # Actualizar campos básicos
+        # Actualizar campos básicos (el cambio de estado queda en el historial)
         if 'estado' in data:
-            servicio.estado = data['estado']
+            change_state(servicio, data['estado'])
         
         if 'tecnico_id' in data and data['tecnico_id']:
             servicio.tecnico_id = int(data['tecnico_id'])
         
-        if 'notas_tecnicas' in data:
-            servicio.notas_tecnicas = data['notas_tecnicas']
+        # Nota nueva en el historial
+        nota = data.get('nota', data.get('notas_tecnicas'))
+        if nota:
+            record_event(servicio, 'nota', nota)
         
         if 'costo' in data and data['costo']:
             servicio.costo = float(data['costo'])
@@ -110,10 +252,6 @@ def actualizar_servicio(id):
                 flash('Formato de fecha inválido', 'error')
                 return redirect(url_for('servicios.servicios_tecnicos'))
         
-        # Actualizar fecha de finalización si se marca como completado
-        if servicio.estado == 'completado' and not servicio.fecha_finalizacion:
-            servicio.fecha_finalizacion = datetime.utcnow()
-        
         db.session.commit()
         flash('Servicio actualizado exitosamente', 'success')
         
@@ -145,6 +283,32 @@ def detalles_servicio(id):
         'solucion': getattr(servicio, 'solucion', '') or ''
     })
 
+@servicios_bp.route('/tecnicos/<int:id>/eventos')
+@login_required
+def eventos_servicio(id):
+    """Historial del servicio en JSON, del más reciente al más antiguo, paginado por cursor"""
+    Servicio.query.get_or_404(id)
+    try:
+        page = timeline(id, cursor=request.args.get('despues'),
+                        per_page=min(request.args.get('por_pagina', 20, type=int), 100))
+    except ValueError:
+        return jsonify({'error': 'Cursor inválido'}), 400
+    return jsonify({'eventos': [event_json(evento) for evento in page.items],
+                    'siguiente': page.next_cursor})
+
+@servicios_bp.route('/tecnicos/<int:id>/eventos', methods=['POST'])
+@login_required
+def agregar_nota(id):
+    """Agrega una nota al historial del servicio"""
+    servicio = Servicio.query.get_or_404(id)
+    data = request.get_json(silent=True) or request.form
+    texto = (data.get('texto') or '').strip()
+    if not texto:
+        return jsonify({'error': 'La nota está vacía'}), 400
+    evento = record_event(servicio, 'nota', texto)
+    db.session.commit()
+    return jsonify(event_json(evento)), 201
+
 @servicios_bp.route('/tecnicos/<int:id>/diagnostico', methods=['POST'])
 @login_required
 def actualizar_diagnostico(id):
@@ -163,12 +327,17 @@ def actualizar_diagnostico(id):
         if hasattr(servicio, 'solucion'):
             servicio.solucion = request.form.get('solucion', '')
         
-        servicio.notas_tecnicas = request.form.get('notas_tecnicas', '')
+        # Diagnóstico, solución y notas quedan como un evento del historial
+        partes = [(etiqueta, request.form.get(campo, '').strip())
+                  for etiqueta, campo in (('Diagnóstico', 'diagnostico'), ('Solución', 'solucion'),
+                                          ('Notas', 'notas_tecnicas'))]
+        texto = '\n'.join(f"{etiqueta}: {valor}" for etiqueta, valor in partes if valor)
+        if texto:
+            record_event(servicio, 'diagnostico', texto)
         
         # Si se proporciona una solución, cambiar estado a en_progreso
-        if (hasattr(servicio, 'solucion') and servicio.solucion and 
-            servicio.estado == 'pendiente'):
-            servicio.estado = 'en_progreso'
+        if request.form.get('solucion') and servicio.estado == 'pendiente':
+            change_state(servicio, 'en_progreso')
         
         db.session.commit()
         flash('Diagnóstico actualizado exitosamente', 'success')
@@ -189,11 +358,7 @@ def cancelar_servicio(id):
         return redirect(url_for('servicios.servicios_tecnicos'))
     
     try:
-        servicio.estado = 'cancelado'
-        servicio.notas_tecnicas += f"\n[CANCELADO] {datetime.now().strftime('%Y-%m-%d %H:%M')} - Servicio cancelado"
-        
-        if request.form.get('motivo_cancelacion'):
-            servicio.notas_tecnicas += f" - Motivo: {request.form.get('motivo_cancelacion')}"
+        change_state(servicio, 'cancelado', request.form.get('motivo_cancelacion'), tipo='cancelacion')
         
         db.session.commit()
         flash('Servicio cancelado exitosamente', 'success')
@@ -212,11 +377,13 @@ def mis_servicios():
         flash('Acceso denegado', 'error')
         return redirect(url_for('main.index'))
     
-    servicios = Servicio.query.filter_by(
-        tecnico_id=current_user.id
-    ).order_by(Servicio.fecha_recepcion.desc()).all()
+    try:
+        servicios, filtros = _service_page(request.args, current_user.id)
+    except ValueError:
+        flash('Página inválida', 'error')
+        return redirect(url_for('servicios.mis_servicios'))
     
-    return render_template('servicios_tecnicos.html', servicios=servicios)
+    return _render_service_list(servicios, filtros, current_user.id, solo_propios=True)
 
 @servicios_bp.route('/reportes')
 @login_required
@@ -226,14 +393,15 @@ def reportes_servicios():
         flash('No tienes permisos para ver reportes', 'error')
         return redirect(url_for('servicios.servicios_tecnicos'))
     
-    # Estadísticas básicas
-    total_servicios = Servicio.query.count()
-    servicios_pendientes = Servicio.query.filter_by(estado='pendiente').count()
-    servicios_en_progreso = Servicio.query.filter_by(estado='en_progreso').count()
-    servicios_completados = Servicio.query.filter_by(estado='completado').count()
+    # Reporte de solo lectura: puede ir a la réplica
+    session = read_session()
+    
+    # Servicios por estado en una sola consulta agrupada
+    por_estado = dict(session.query(Servicio.estado, db.func.count(Servicio.id))
+                      .group_by(Servicio.estado).all())
     
     # Servicios por técnico
-    tecnicos_stats = db.session.query(
+    tecnicos_stats = session.query(
         Usuario.nombre,
         db.func.count(Servicio.id).label('total_servicios'),
         db.func.avg(Servicio.costo).label('costo_promedio')
@@ -241,12 +409,17 @@ def reportes_servicios():
      .filter(Usuario.rol == 'tecnico')\
      .group_by(Usuario.id, Usuario.nombre).all()
     
-    return render_template('reportes.html',
-                         total_servicios=total_servicios,
-                         servicios_pendientes=servicios_pendientes,
-                         servicios_en_progreso=servicios_en_progreso,
-                         servicios_completados=servicios_completados,
-                         tecnicos_stats=tecnicos_stats)
+    # Percentiles de tiempo de respuesta precalculados (tabla tiempo_servicio)
+    tiempos = turnaround_report(session)
+    
+    return render_template('reportes_servicios.html',
+                         total_servicios=sum(por_estado.values()),
+                         servicios_pendientes=por_estado.get('pendiente', 0),
+                         servicios_en_progreso=por_estado.get('en_progreso', 0),
+                         servicios_completados=por_estado.get('completado', 0),
+                         por_estado=por_estado,
+                         tecnicos_stats=tecnicos_stats,
+                         tiempos=tiempos)
 
 @servicios_bp.route('/servicio_tecnico/<int:id>', methods=['GET'])
 @login_required
@@ -291,13 +464,14 @@ def actualizar_servicio_api(id):
         if 'descripcion' in data:
             servicio.descripcion = data['descripcion']
         if 'estado' in data:
-            servicio.estado = data['estado']
+            change_state(servicio, data['estado'])
         if 'costo' in data and data['costo']:
             servicio.costo = float(data['costo'])
         if 'tecnico_id' in data:
             servicio.tecnico_id = int(data['tecnico_id']) if data['tecnico_id'] else None
-        if 'notas_tecnicas' in data:
-            servicio.notas_tecnicas = data['notas_tecnicas']
+        nota = data.get('nota', data.get('notas_tecnicas'))
+        if nota:
+            record_event(servicio, 'nota', nota)
         
         # Actualizar fecha de entrega si se proporciona
         if 'fecha_entrega_estimada' in data and data['fecha_entrega_estimada']:
@@ -314,13 +488,12 @@ def actualizar_servicio_api(id):
             except ValueError as e:
                 return jsonify({'error': f'Formato de fecha inválido: {str(e)}'}), 400
         
-        # Si se marca como completado, actualizar fecha de finalización
-        if servicio.estado == 'completado' and not servicio.fecha_finalizacion:
-            servicio.fecha_finalizacion = datetime.utcnow()
-        
         db.session.commit()
         return jsonify({'message': 'Servicio técnico actualizado exitosamente'})
         
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
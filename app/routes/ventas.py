@@ -1,7 +1,9 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
 from flask_login import login_required, current_user
+from datetime import timedelta
 from app.models import db, Venta, DetalleVenta, Celular, Accesorio, ServicioTV
-from app.utils.sales import process_sale, get_sale_details, cancel_sale
+from app.utils.archive import get_sale, paginate_sales, parse_date_range
+from app.utils.sales import process_sale, get_sale_details, cancel_sale, get_sales_summary
 
 ventas_bp = Blueprint('ventas', __name__)
 
@@ -11,11 +13,14 @@ def lista_ventas():
     page = request.args.get('page', 1, type=int)
     per_page = 20
     
-    ventas = Venta.query.order_by(Venta.fecha_venta.desc()).paginate(
-        page=page, per_page=per_page, error_out=False
-    )
+    # Las ventas archivadas se consultan solo con "Incluir archivo" o si el
+    # rango de fechas llega hasta ellas
+    desde, hasta = parse_date_range(request.args)
+    incluir_archivo = request.args.get('archivo') == '1'
+    ventas = paginate_sales(page, per_page, desde, hasta, include_archive=incluir_archivo)
+    filtros = {k: request.args[k] for k in ('desde', 'hasta', 'archivo') if request.args.get(k)}
     
-    return render_template('ventas.html', ventas=ventas)
+    return render_template('ventas.html', ventas=ventas, filtros=filtros)
 
 @ventas_bp.route('/nueva', methods=['GET', 'POST'])
 @login_required
@@ -46,7 +51,9 @@ def nueva_venta():
 @login_required
 def detalles_venta(id):
     try:
-        venta = Venta.query.get_or_404(id)
+        venta = get_sale(id)
+        if venta is None:
+            return jsonify({'error': 'Venta no encontrada'}), 404
         detalles = get_sale_details(venta)
         
         # Datos basados en el modelo real
@@ -59,6 +66,7 @@ def detalles_venta(id):
             'metodo_pago': venta.metodo_pago or 'No especificado',
             'estado': venta.estado or 'No especificado',
             'total': float(venta.total) if venta.total else 0.0,
+            'archivada': venta.archivada,
             'detalles': detalles or []
         }
         
@@ -71,6 +79,15 @@ def detalles_venta(id):
         # Otros errores
         return jsonify({'error': f'Error al obtener detalles de venta: {str(e)}'}), 500
 
+@ventas_bp.route('/api/resumen')
+@login_required
+def resumen_ventas():
+    """Resumen de ventas completadas en el rango ?desde=AAAA-MM-DD&hasta=AAAA-MM-DD"""
+    desde, hasta = parse_date_range(request.args)
+    resumen = get_sales_summary(desde, hasta - timedelta(microseconds=1) if hasta else None)
+    resumen['periodo'] = {k: request.args.get(k) for k in ('desde', 'hasta')}
+    return jsonify(resumen)
+
 @ventas_bp.route('/<int:id>/cancelar', methods=['POST'])
 @login_required
 def cancelar_venta(id):
@@ -1,15 +1,19 @@
 from datetime import datetime, date
-from werkzeug.security import generate_password_hash
-# Ajusta estos imports según tu estructura de archivos
-from app import create_app, db  # O como tengas configurado tu app
-from models import Usuario, Marca, Categoria, Celular, Accesorio, ServicioTV
 
-# Crear la app
-app = create_app('development')  # O el config que uses
+# La app, los modelos y werkzeug se importan al ejecutar el seed, no al
+# importar el módulo: así `import app.seed` no construye la app ni abre la BD.
 
-def create_seed_data():
+def _create_seed_app():
+    """Crea una app sin blueprints, suficiente para trabajar con los modelos"""
+    from app import create_app
+    return create_app('development', register_blueprints=False)
+
+def create_seed_data(app=None):
     """Crea datos iniciales para la base de datos"""
+    from werkzeug.security import generate_password_hash
+    from app.models import db, Usuario, Marca, Categoria, Celular, Accesorio, ServicioTV
     
+    app = app or _create_seed_app()
     with app.app_context():
         # Limpiar tablas existentes (opcional)
         db.drop_all()
@@ -97,7 +101,7 @@ def create_seed_data():
                     'color': 'Negro'
                 },
                 estado='nuevo',
-                imei='123456789012345'
+                imei='123456789012354'
             ),
             Celular(
                 modelo='iPhone 15',
@@ -112,7 +116,7 @@ def create_seed_data():
                     'color': 'Azul'
                 },
                 estado='nuevo',
-                imei='123456789012346'
+                imei='123456789012362'
             ),
             Celular(
                 modelo='Redmi Note 13',
@@ -232,8 +236,11 @@ def create_seed_data():
         print(f"📂 Categorías: {len(categorias)}")
         print(f"📺 Servicios TV: {len(servicios_tv)}")
 
-def reset_database():
+def reset_database(app=None):
     """Elimina y recrea toda la base de datos"""
+    from app.models import db
+    
+    app = app or _create_seed_app()
     with app.app_context():
         db.drop_all()
         db.create_all()
@@ -1,30 +1,47 @@
 // Service Worker para la aplicación de Tienda de Celulares
+//
+// Páginas: primero la red (con tiempo límite) y, si no responde, la caché.
+// Catálogo: copia local en IndexedDB que se actualiza por cambios
+// (/productos/api/catalogo?desde=<versión>) y responde las búsquedas de
+// productos (/productos/api/buscar) sin ir al servidor.
 
-const CACHE_NAME = 'celulares-app-v1';
-const urlsToCache = [
-  '/',
-  '/static/manifest.json',
-  'https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css',
-  'https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.0.0/css/all.min.css',
-  'https://code.jquery.com/jquery-3.6.0.min.js',
-  'https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/js/bootstrap.bundle.min.js'
-];
+const CACHE_NAME = 'celulares-app-v3';
+// Lista de estáticos del mismo origen (con huella) que piden las páginas;
+// la genera el servidor con precache_urls() en app/utils/assets.py
+const PRECACHE_URL = '/sw-precache.json';
+
+// Milisegundos de espera a la red antes de servir la copia en caché
+const NETWORK_TIMEOUT_MS = 4000;
+
+// Archivos estáticos con huella (nombre.<hash>.ext): su contenido no cambia
+const FINGERPRINTED_RE = /^\/static\/.+\.[0-9a-f]{10}\.[A-Za-z0-9]+$/;
+
+// Catálogo local
+const CATALOG_DB = 'catalogo';
+const CATALOG_DB_VERSION = 1;
+const CATALOG_URL = '/productos/api/catalogo';
+const LOOKUP_PATH = '/productos/api/buscar';
+const SYNC_INTERVAL_MS = 30000;
+const LOOKUP_LIMIT = 20;
+const MAX_LOOKUP_LIMIT = 50;
 
 // Instalación del Service Worker
 self.addEventListener('install', event => {
   event.waitUntil(
     caches.open(CACHE_NAME)
-      .then(cache => {
-        console.log('Cache opened');
-        return cache.addAll(urlsToCache);
-      })
+      .then(cache => fetch(PRECACHE_URL, { cache: 'no-store' })
+        .then(response => response.json())
+        // Cada archivo por separado: uno que falle no impide la instalación
+        // (las páginas lo guardan en la caché cuando lo piden)
+        .then(lista => Promise.all(lista.urls.map(url => cache.add(url).catch(() => undefined)))))
+      .catch(() => undefined)
   );
 });
 
 // Activación del Service Worker
 self.addEventListener('activate', event => {
   const cacheWhitelist = [CACHE_NAME];
-  event.waitUntil(
+  event.waitUntil(Promise.all([
     caches.keys().then(cacheNames => {
       return Promise.all(
         cacheNames.map(cacheName => {
@@ -33,28 +50,230 @@ self.addEventListener('activate', event => {
           }
         })
       );
-    })
-  );
+    }),
+    syncCatalog(true)
+  ]));
+});
+
+// Las páginas piden una sincronización al cargar
+self.addEventListener('message', event => {
+  if (event.data === 'sincronizar-catalogo') {
+    event.waitUntil(syncCatalog(false));
+  }
 });
 
-// Estrategia de caché: Network First, fallback to cache
 self.addEventListener('fetch', event => {
-  event.respondWith(
-    fetch(event.request)
-      .then(response => {
-        // Si la respuesta es válida, clonarla y almacenarla en caché
-        if (event.request.method === 'GET' && response && response.status === 200) {
-          const responseToCache = response.clone();
-          caches.open(CACHE_NAME)
-            .then(cache => {
-              cache.put(event.request, responseToCache);
-            });
-        }
-        return response;
-      })
-      .catch(() => {
-        // Si la red falla, intentar servir desde caché
-        return caches.match(event.request);
-      })
-  );
-});
\ No newline at end of file
+  const request = event.request;
+  if (request.method !== 'GET') {
+    return;
+  }
+  const url = new URL(request.url);
+  if (url.origin === self.location.origin) {
+    if (url.pathname === LOOKUP_PATH) {
+      event.respondWith(lookup(event, url));
+      return;
+    }
+    if (url.pathname === '/logout') {
+      // La copia del catálogo es de la sesión: se borra al salir
+      event.waitUntil(clearCatalog());
+      return;
+    }
+    if (url.pathname.includes('/api/')) {
+      // Datos en vivo: no se guardan en la caché de páginas
+      return;
+    }
+    if (FINGERPRINTED_RE.test(url.pathname)) {
+      event.respondWith(cacheFirst(request));
+      return;
+    }
+    if (request.mode === 'navigate') {
+      event.waitUntil(syncCatalog(false));
+    }
+  }
+  event.respondWith(networkFirst(request));
+});
+
+// Estrategia de caché: Network First con tiempo límite, fallback to cache
+function networkFirst(request) {
+  const network = fetch(request).then(response => {
+    // Si la respuesta es válida, clonarla y almacenarla en caché
+    if (response && response.status === 200) {
+      const responseToCache = response.clone();
+      caches.open(CACHE_NAME).then(cache => cache.put(request, responseToCache));
+    }
+    return response;
+  });
+  const timeout = new Promise(resolve => setTimeout(resolve, NETWORK_TIMEOUT_MS, null));
+  return Promise.race([network, timeout])
+    .then(response => response || caches.match(request).then(cached => cached || network))
+    .catch(() => caches.match(request).then(cached => cached || network));
+}
+
+function cacheFirst(request) {
+  return caches.match(request).then(cached => cached || fetch(request).then(response => {
+    if (response && response.status === 200) {
+      const responseToCache = response.clone();
+      caches.open(CACHE_NAME).then(cache => cache.put(request, responseToCache));
+    }
+    return response;
+  }));
+}
+
+// --- Catálogo local (IndexedDB) ---
+
+let catalogDb = null;
+let syncing = null;
+let lastSync = 0;
+
+function requestResult(request) {
+  return new Promise((resolve, reject) => {
+    request.onsuccess = () => resolve(request.result);
+    request.onerror = () => reject(request.error);
+  });
+}
+
+function transactionDone(tx) {
+  return new Promise((resolve, reject) => {
+    tx.oncomplete = () => resolve();
+    tx.onerror = tx.onabort = () => reject(tx.error);
+  });
+}
+
+function openCatalog() {
+  if (!catalogDb) {
+    const request = indexedDB.open(CATALOG_DB, CATALOG_DB_VERSION);
+    request.onupgradeneeded = () => {
+      // productos: clave "tipo:id"; meta: versión, marcas y hora de la última sincronización
+      request.result.createObjectStore('productos', { keyPath: 'clave' });
+      request.result.createObjectStore('meta', { keyPath: 'nombre' });
+    };
+    catalogDb = requestResult(request).catch(error => {
+      catalogDb = null;
+      throw error;
+    });
+  }
+  return catalogDb;
+}
+
+function readMeta(db, nombre, valorPorDefecto) {
+  return requestResult(db.transaction('meta').objectStore('meta').get(nombre))
+    .then(registro => (registro ? registro.valor : valorPorDefecto));
+}
+
+function applyChanges(db, cambios) {
+  // Una sola transacción: la copia queda en la versión anterior o en la nueva.
+  // Las bajas van antes que los productos por si un id se reutilizó.
+  const tx = db.transaction(['productos', 'meta'], 'readwrite');
+  const productos = tx.objectStore('productos');
+  const meta = tx.objectStore('meta');
+  if (cambios.completo) {
+    productos.clear();
+  }
+  cambios.bajas.forEach(baja => productos.delete(`${baja.tipo}:${baja.id}`));
+  cambios.celulares.concat(cambios.accesorios).forEach(producto => {
+    productos.put(Object.assign({ clave: `${producto.tipo}:${producto.id}` }, producto));
+  });
+  meta.put({ nombre: 'version', valor: cambios.version });
+  meta.put({ nombre: 'marcas', valor: cambios.marcas });
+  meta.put({ nombre: 'sincronizado', valor: Date.now() });
+  return transactionDone(tx);
+}
+
+// Pide los cambios desde la versión local (como mucho una vez cada
+// SYNC_INTERVAL_MS, salvo force). Devuelve true si la copia se actualizó.
+function syncCatalog(force) {
+  if (syncing) {
+    return syncing;
+  }
+  if (!force && Date.now() - lastSync < SYNC_INTERVAL_MS) {
+    return Promise.resolve(false);
+  }
+  lastSync = Date.now();
+  syncing = openCatalog()
+    .then(db => readMeta(db, 'version', 0).then(version =>
+      fetch(`${CATALOG_URL}?desde=${version}`, { credentials: 'same-origin', cache: 'no-store' })
+        .then(response => {
+          // Sin sesión el servidor redirige al login: la respuesta no es JSON
+          const contentType = response.headers.get('Content-Type') || '';
+          if (!response.ok || !contentType.includes('application/json')) {
+            return false;
+          }
+          return response.json().then(cambios => applyChanges(db, cambios)).then(() => true);
+        })))
+    .catch(() => false)
+    .finally(() => {
+      syncing = null;
+    });
+  return syncing;
+}
+
+function clearCatalog() {
+  lastSync = 0;
+  return openCatalog().then(db => {
+    const tx = db.transaction(['productos', 'meta'], 'readwrite');
+    tx.objectStore('productos').clear();
+    tx.objectStore('meta').clear();
+    return transactionDone(tx);
+  }).catch(() => undefined);
+}
+
+// Misma búsqueda que search_products() en app/utils/catalog.py: productos
+// con stock cuyo nombre, marca o código contienen todas las palabras
+function searchCatalog(productos, marcas, q, limit) {
+  const words = (q || '').toLowerCase().split(/\s+/).filter(Boolean);
+  const celulares = [];
+  const accesorios = [];
+  productos.forEach(producto => {
+    if (producto.stock <= 0) {
+      return;
+    }
+    const marca = marcas[producto.marca_id] || '';
+    const campos = producto.tipo === 'celular'
+      ? [producto.modelo, marca]
+      : [producto.nombre, marca, producto.codigo_producto || ''];
+    const texto = campos.join('\n').toLowerCase();
+    if (!words.every(word => texto.includes(word))) {
+      return;
+    }
+    const resultado = {
+      tipo: producto.tipo,
+      id: producto.id,
+      nombre: producto.tipo === 'celular' ? `${marca} ${producto.modelo}` : producto.nombre,
+      marca: marca,
+      precio: producto.precio,
+      stock: producto.stock
+    };
+    (producto.tipo === 'celular' ? celulares : accesorios).push([campos, resultado]);
+  });
+  const compare = (a, b) => (a < b ? -1 : a > b ? 1 : 0);
+  celulares.sort((a, b) => compare(a[0][1], b[0][1]) || compare(a[0][0], b[0][0]));
+  accesorios.sort((a, b) => compare(a[0][0], b[0][0]));
+  return celulares.slice(0, limit).concat(accesorios.slice(0, limit)).slice(0, limit).map(item => item[1]);
+}
+
+function lookup(event, url) {
+  // La copia local responde al instante y se pone al día en segundo plano
+  event.waitUntil(syncCatalog(false));
+  const limit = Math.max(1, Math.min(parseInt(url.searchParams.get('limite'), 10) || LOOKUP_LIMIT,
+                                     MAX_LOOKUP_LIMIT));
+  return openCatalog()
+    .then(db => readMeta(db, 'sincronizado', null).then(sincronizado => {
+      if (!sincronizado) {
+        // Todavía no hay copia local: responde el servidor
+        return fetch(event.request);
+      }
+      return Promise.all([
+        requestResult(db.transaction('productos').objectStore('productos').getAll()),
+        readMeta(db, 'marcas', {}),
+        readMeta(db, 'version', 0)
+      ]).then(([productos, marcas, version]) => new Response(
+        JSON.stringify({
+          productos: searchCatalog(productos, marcas, url.searchParams.get('q'), limit),
+          origen: 'local',
+          version: version
+        }),
+        { headers: { 'Content-Type': 'application/json' } }
+      ));
+    }))
+    .catch(() => fetch(event.request));
+}
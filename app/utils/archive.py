@@ -0,0 +1,155 @@
+# app/utils/archive.py
+"""Archivo de ventas antiguas: traslado por lotes y lecturas que lo incluyen solo si hace falta"""
+import heapq
+import time
+from datetime import datetime, timedelta
+from itertools import islice
+from flask_sqlalchemy.pagination import Pagination
+from sqlalchemy import func, insert, select
+from app.models import db, Venta, DetalleVenta, VentaArchivo, DetalleVentaArchivo
+from app.utils.pagination import KeysetPage, encode_cursor, keyset_paginate
+
+# Estados en los que una venta ya no cambia y se puede archivar
+CLOSED_SALE_STATES = ('completada', 'cancelada')
+
+def months_ago(date, months):
+    """Misma fecha `months` meses antes (el día se ajusta al fin de mes)"""
+    month = date.month - 1 - months
+    year = date.year + month // 12
+    month = month % 12 + 1
+    for day in (date.day, 30, 29, 28):
+        try:
+            return date.replace(year=year, month=month, day=day)
+        except ValueError:
+            continue
+
+def archive_sales(months, batch_size=500, pause=0.05, now=None, progress=None):
+    """Mueve las ventas cerradas anteriores a `months` meses al archivo.
+    
+    Cada lote (ventas con sus detalles) se copia y se borra en una sola
+    transacción, en orden de id y con una pausa entre lotes. Devuelve el
+    número de ventas archivadas.
+    """
+    cutoff = months_ago(now or datetime.utcnow(), months)
+    venta, detalle = Venta.__table__, DetalleVenta.__table__
+    venta_archivo, detalle_archivo = VentaArchivo.__table__, DetalleVentaArchivo.__table__
+    
+    # Nunca se archiva la venta de id más alto: en SQLite el siguiente id es
+    # MAX(id) + 1 y vaciar la tabla haría que se repitieran ids ya archivados
+    newest = select(func.max(venta.c.id)).scalar_subquery()
+    pending = (select(venta.c.id)
+               .where(venta.c.fecha_venta < cutoff,
+                      venta.c.estado.in_(CLOSED_SALE_STATES),
+                      venta.c.id < newest)
+               .order_by(venta.c.id)
+               .limit(batch_size))
+    
+    moved = 0
+    while True:
+        with db.engine.begin() as conn:
+            ids = [row[0] for row in conn.execute(pending)]
+            if not ids:
+                break
+            conn.execute(insert(venta_archivo).from_select(
+                [c.name for c in venta.c], select(*venta.c).where(venta.c.id.in_(ids))))
+            conn.execute(insert(detalle_archivo).from_select(
+                [c.name for c in detalle.c], select(*detalle.c).where(detalle.c.venta_id.in_(ids))))
+            conn.execute(detalle.delete().where(detalle.c.venta_id.in_(ids)))
+            conn.execute(venta.delete().where(venta.c.id.in_(ids)))
+        moved += len(ids)
+        if progress:
+            progress(moved)
+        time.sleep(pause)
+    return moved
+
+def archived_until(session=None):
+    """Fecha de la venta archivada más reciente (None si el archivo está vacío)"""
+    return (session or db.session).query(func.max(VentaArchivo.fecha_venta)).scalar()
+
+def needs_archive(start_date, session=None):
+    """Indica si un rango que empieza en `start_date` (None: sin límite) llega al archivo"""
+    until = archived_until(session)
+    return until is not None and (start_date is None or start_date <= until)
+
+def sale_models(start_date=None, session=None):
+    """Modelos a consultar para un rango de fechas: Venta y, si hace falta, VentaArchivo"""
+    return [Venta, VentaArchivo] if needs_archive(start_date, session) else [Venta]
+
+def filter_dates(query, model, start_date=None, end_date=None):
+    if start_date:
+        query = query.filter(model.fecha_venta >= start_date)
+    if end_date:
+        query = query.filter(model.fecha_venta < end_date)
+    return query
+
+def get_sale(venta_id):
+    """Venta por id, esté activa o archivada (None si no existe)"""
+    return db.session.get(Venta, venta_id) or db.session.get(VentaArchivo, venta_id)
+
+class SalesPagination(Pagination):
+    """Paginación de ventas por fecha descendente (`query`) que incluye las
+    archivadas (`archive_query`, None si el rango pedido no llega al archivo).
+    
+    Solo se archivan ventas cerradas, así que una venta abierta antigua
+    sigue activa mientras otras más nuevas ya están archivadas: las dos
+    consultas se mezclan por (fecha, id). Cada página lee de cada una las
+    filas hasta su final, por eso el archivo solo se incluye si se pide.
+    """
+    
+    def _query_items(self):
+        query, archive_query = self._query_args['query'], self._query_args['archive_query']
+        if archive_query is None:
+            return query.limit(self.per_page).offset(self._query_offset).all()
+        end = self._query_offset + self.per_page
+        merged = heapq.merge(query.limit(end).all(), archive_query.limit(end).all(),
+                             key=lambda venta: (venta.fecha_venta, venta.id), reverse=True)
+        return list(islice(merged, self._query_offset, end))
+    
+    def _query_count(self):
+        total = self._query_args['query'].order_by(None).count()
+        archive_query = self._query_args['archive_query']
+        if archive_query is not None:
+            total += archive_query.order_by(None).count()
+        return total
+
+def paginate_sales(page, per_page, start_date=None, end_date=None, include_archive=False):
+    """Página de ventas activas. Las archivadas se agregan solo si se piden
+    (`include_archive`) o si el rango empieza antes del fin del archivo: sin
+    filtro, el listado no cuenta todo el archivo en cada página."""
+    models = sale_models(start_date) if start_date or include_archive else [Venta]
+    queries = [filter_dates(model.query, model, start_date, end_date)
+               .order_by(model.fecha_venta.desc(), model.id.desc()) for model in models]
+    return SalesPagination(page=page, per_page=per_page, error_out=False,
+                           query=queries[0], archive_query=queries[1] if len(queries) > 1 else None)
+
+def client_sales_page(cliente_id, cursor=None, per_page=10):
+    """Ventas de un cliente (activas y archivadas) de la más reciente a la
+    más antigua, paginadas por cursor (fecha, id) sobre ix_venta_cliente_fecha
+    e ix_venta_archivo_cliente_fecha. Cada tabla aporta hasta per_page filas
+    después del cursor y se mezclan por fecha: una venta abierta antigua
+    sigue activa mientras otras más nuevas ya están archivadas.
+    ValueError si el cursor no es válido."""
+    pages = [keyset_paginate(model.query.filter(model.cliente_id == cliente_id), model.fecha_venta, model.id,
+                             cursor=cursor, per_page=per_page)
+             for model in sale_models()]
+    merged = sorted((venta for page in pages for venta in page.items),
+                    key=lambda venta: (venta.fecha_venta, venta.id), reverse=True)
+    items = merged[:per_page]
+    next_cursor = None
+    if len(merged) > per_page or any(page.has_next for page in pages):
+        next_cursor = encode_cursor(items[-1].fecha_venta, items[-1].id)
+    return KeysetPage(items, next_cursor, cursor)
+
+def parse_date_range(args):
+    """Rango [desde, hasta] (AAAA-MM-DD) de los parámetros de la petición.
+    
+    Devuelve (inicio, fin exclusivo); None donde no se indicó o no es válido.
+    """
+    def parse(name):
+        try:
+            return datetime.strptime(args.get(name, ''), '%Y-%m-%d')
+        except ValueError:
+            return None
+    
+    start, end = parse('desde'), parse('hasta')
+    return start, end + timedelta(days=1) if end else None
@@ -0,0 +1,154 @@
+# app/utils/assets.py
+"""Archivos estáticos con huella en el nombre y copias locales de las
+librerías de CDN.
+
+`url_for('static', filename='manifest.json')` genera
+`/static/manifest.<hash>.json`, con los primeros caracteres del SHA-256 del
+contenido. Un nombre con huella nunca cambia de contenido, así que se sirve
+con `Cache-Control: immutable` y un año de validez; al modificar el archivo
+cambia la huella y los navegadores piden la URL nueva. Los nombres sin
+huella (sw.js, enlaces escritos a mano) se sirven como antes.
+"""
+import hashlib
+import os
+import re
+from flask import current_app, url_for
+
+# nombre.<huella>.ext
+FINGERPRINT_LENGTH = 10
+FINGERPRINTED_RE = re.compile(r'^(?P<stem>.+)\.(?P<hash>[0-9a-f]{%d})(?P<ext>\.[A-Za-z0-9]+)$' % FINGERPRINT_LENGTH)
+
+# El service worker debe conservar su URL para poder actualizarse
+UNVERSIONED_FILES = frozenset({'sw.js'})
+# Service workers servidos desde /static que controlan toda la app (scope '/')
+ROOT_SCOPE_WORKERS = frozenset({'sw.js'})
+
+# Librerías de CDN: ruta local dentro de static/vendor -> URL de la CDN.
+# `flask --app run download-vendor-assets` las descarga; si la copia local
+# existe, vendor_url() la usa (con huella) en lugar de la CDN.
+VENDOR_DIR = 'vendor'
+VENDOR_ASSETS = {
+    'bootstrap/css/bootstrap.min.css': 'https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css',
+    'bootstrap/js/bootstrap.bundle.min.js':
+        'https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/js/bootstrap.bundle.min.js',
+    'jquery/jquery.min.js': 'https://code.jquery.com/jquery-3.6.0.min.js',
+    'fontawesome/css/all.min.css': 'https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.0.0/css/all.min.css',
+}
+# Fuentes que all.min.css carga con rutas relativas (../webfonts/)
+VENDOR_FONTS = {
+    f'fontawesome/webfonts/{font}': f'https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.0.0/webfonts/{font}'
+    for font in ('fa-solid-900.woff2', 'fa-regular-400.woff2', 'fa-brands-400.woff2',
+                 'fa-v4compatibility.woff2')
+}
+
+class StaticAssets:
+    """Huellas de los archivos de la carpeta static. Se calculan la primera
+    vez que se pide cada archivo y se recalculan si cambia su fecha o tamaño."""
+    
+    def __init__(self, folder):
+        self.folder = folder
+        self._fingerprints = {}
+    
+    def path(self, filename):
+        return os.path.join(self.folder, *filename.split('/'))
+    
+    def fingerprint(self, filename):
+        """Huella del archivo, o None si no existe o no se versiona"""
+        if filename in UNVERSIONED_FILES or '.' not in os.path.basename(filename):
+            return None
+        try:
+            stat = os.stat(self.path(filename))
+        except OSError:
+            return None
+        key = (stat.st_mtime_ns, stat.st_size)
+        cached = self._fingerprints.get(filename)
+        if cached is None or cached[0] != key:
+            digest = hashlib.sha256()
+            with open(self.path(filename), 'rb') as f:
+                for chunk in iter(lambda: f.read(65536), b''):
+                    digest.update(chunk)
+            cached = self._fingerprints[filename] = (key, digest.hexdigest()[:FINGERPRINT_LENGTH])
+        return cached[1]
+    
+    def versioned(self, filename):
+        """Nombre con huella (el mismo nombre si no se versiona)"""
+        fingerprint = self.fingerprint(filename)
+        if fingerprint is None:
+            return filename
+        stem, ext = os.path.splitext(filename)
+        return f'{stem}.{fingerprint}{ext}'
+    
+    def resolve(self, filename):
+        """(archivo real, si la huella es la actual) de un nombre pedido"""
+        match = FINGERPRINTED_RE.match(filename)
+        if match is None or os.path.exists(self.path(filename)):
+            return filename, False
+        original = match.group('stem') + match.group('ext')
+        return original, self.fingerprint(original) == match.group('hash')
+
+def _assets():
+    return current_app.extensions['static_assets']
+
+def _add_fingerprint(endpoint, values):
+    # url_defaults: se aplica a cada url_for('static', filename=...)
+    if endpoint == 'static' and 'filename' in values and current_app.config['STATIC_FINGERPRINTS']:
+        values['filename'] = _assets().versioned(values['filename'])
+
+def serve_static(filename):
+    """Vista de /static: los nombres con huella vigente llevan caché inmutable"""
+    original, current = _assets().resolve(filename)
+    if not current:
+        response = current_app.send_static_file(original)
+        if original in ROOT_SCOPE_WORKERS:
+            response.headers['Service-Worker-Allowed'] = '/'
+        return response
+    max_age = current_app.config['STATIC_IMMUTABLE_MAX_AGE']
+    response = current_app.send_static_file(original)
+    response.cache_control.public = True
+    response.cache_control.max_age = max_age
+    response.cache_control.immutable = True
+    response.cache_control.no_cache = None
+    return response
+
+def vendor_url(name):
+    """URL de una librería de VENDOR_ASSETS: la copia local si existe, si no la CDN"""
+    local = f'{VENDOR_DIR}/{name}'
+    if current_app.config['USE_LOCAL_VENDOR'] and os.path.isfile(_assets().path(local)):
+        return url_for('static', filename=local)
+    return VENDOR_ASSETS[name]
+
+def precache_urls():
+    """URL del mismo origen que base.html pide en cada página, para que el
+    service worker las guarde al instalarse: el manifest, el ícono y las
+    librerías y fuentes de static/vendor que existan (con la misma huella
+    que usan las páginas). Las URL de la CDN no se incluyen: si una falla,
+    la instalación no debe fallar con ella."""
+    urls = [url_for('static', filename='manifest.json'), url_for('static', filename='icons/icon-192x192.svg')]
+    urls += [url for url in map(vendor_url, VENDOR_ASSETS) if url.startswith('/')]
+    if current_app.config['USE_LOCAL_VENDOR']:
+        # all.min.css pide las fuentes por ruta relativa, sin huella
+        urls += [f'{current_app.static_url_path}/{VENDOR_DIR}/{name}' for name in VENDOR_FONTS
+                 if os.path.isfile(_assets().path(f'{VENDOR_DIR}/{name}'))]
+    return urls
+
+def download_vendor_assets(folder, opener=None):
+    """Descarga VENDOR_ASSETS y VENDOR_FONTS a static/vendor. Devuelve los archivos escritos."""
+    import urllib.request
+    opener = opener or urllib.request.urlopen
+    written = []
+    for name, url in {**VENDOR_ASSETS, **VENDOR_FONTS}.items():
+        path = os.path.join(folder, VENDOR_DIR, *name.split('/'))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with opener(url) as response:
+            data = response.read()
+        with open(path, 'wb') as f:
+            f.write(data)
+        written.append(path)
+    return written
+
+def init_static_assets(app):
+    """Reemplaza la vista de /static y agrega las huellas a url_for"""
+    app.extensions['static_assets'] = StaticAssets(app.static_folder)
+    app.url_defaults(_add_fingerprint)
+    app.view_functions['static'] = serve_static
+    app.add_template_global(vendor_url)
@@ -0,0 +1,174 @@
+# app/utils/backfill.py
+"""Backfills de datos por lotes: ordenados por clave primaria, con pausas y reanudables"""
+import importlib
+import math
+import time
+from datetime import datetime
+from sqlalchemy import func, select
+from app.models import db, BackfillProgreso
+
+# Backfills disponibles para `migrate_db.py backfill`, por nombre
+BACKFILLS = {}
+
+# Módulos que definen backfills con @register_backfill
+BACKFILL_MODULES = ('app.utils.service_events', 'app.utils.clients', 'app.utils.client_linking')
+
+def register_backfill(cls):
+    """Decorador que registra un backfill por su nombre"""
+    BACKFILLS[cls.name] = cls
+    return cls
+
+def load_backfills():
+    """Importa los módulos de BACKFILL_MODULES y devuelve BACKFILLS"""
+    for module in BACKFILL_MODULES:
+        importlib.import_module(module)
+    return BACKFILLS
+
+def print_progress(done, total, elapsed):
+    """Muestra avance, velocidad y tiempo restante en la terminal"""
+    rate = done / elapsed if elapsed else 0
+    eta = (total - done) / rate if rate else 0
+    percent = 100 * done / total if total else 100
+    end = '\n' if done >= total else ''
+    print(f"\r   {done}/{total} filas ({percent:.0f}%), {rate:.0f} filas/s, "
+          f"faltan ~{eta:.0f} s   ", end=end, flush=True)
+
+class Backfill:
+    """Base de un backfill.
+    
+    Recorre `table` en lotes de `batch_size` filas ordenadas por clave
+    primaria y duerme `pause` segundos entre lotes para no acaparar la base
+    de datos. Cada lote se confirma en su propia transacción junto con el
+    punto de control (BackfillProgreso), así que si el proceso se interrumpe
+    se reanuda desde el último lote confirmado.
+    
+    Las subclases definen `name`, `table`, `process()` y, si no todas las
+    filas necesitan cambios, `where()`.
+    """
+    name = None
+    description = ''
+    table = None
+    batch_size = 500
+    pause = 0.05
+    
+    def __init__(self, batch_size=None, pause=None):
+        if batch_size is not None:
+            self.batch_size = batch_size
+        if pause is not None:
+            self.pause = pause
+    
+    @property
+    def pk(self):
+        return self.table.primary_key.columns.values()[0]
+    
+    def where(self):
+        """Condición de las filas pendientes (None: todas)"""
+        return None
+    
+    def process(self, conn, ids):
+        """Actualiza las filas `ids`. Devuelve el número de filas modificadas."""
+        raise NotImplementedError
+    
+    def _filtered(self, query, after_id):
+        query = query.where(self.pk > after_id)
+        condition = self.where()
+        return query if condition is None else query.where(condition)
+    
+    def next_ids(self, conn, after_id):
+        query = self._filtered(select(self.pk), after_id).order_by(self.pk).limit(self.batch_size)
+        return [row[0] for row in conn.execute(query)]
+    
+    def remaining(self, conn, after_id):
+        query = self._filtered(select(func.count()).select_from(self.table), after_id)
+        return conn.execute(query).scalar()
+
+def _progress_table():
+    return BackfillProgreso.__table__
+
+def get_checkpoint(conn, name):
+    """Fila de BackfillProgreso del backfill (None si nunca se ejecutó)"""
+    table = _progress_table()
+    return conn.execute(select(table).where(table.c.nombre == name)).first()
+
+def reset_checkpoint(name, engine=None):
+    """Borra el punto de control para volver a empezar desde el principio"""
+    table = _progress_table()
+    with (engine or db.engine).begin() as conn:
+        conn.execute(table.delete().where(table.c.nombre == name))
+
+def run_backfill(backfill, engine=None, progress=print_progress, max_batches=None):
+    """Ejecuta (o reanuda) un backfill. Devuelve el estado final del punto de control."""
+    engine = engine or db.engine
+    table = _progress_table()
+    with engine.begin() as conn:
+        state = get_checkpoint(conn, backfill.name)
+        if state is None:
+            conn.execute(table.insert().values(nombre=backfill.name, ultimo_id=0, procesadas=0,
+                                               modificadas=0, fecha_inicio=datetime.utcnow(),
+                                               fecha_actualizacion=datetime.utcnow()))
+            state = get_checkpoint(conn, backfill.name)
+        if state.fecha_fin is not None:
+            return state
+        total = state.procesadas + backfill.remaining(conn, state.ultimo_id)
+    
+    after_id, done, changed = state.ultimo_id, state.procesadas, state.modificadas
+    started = time.perf_counter()
+    resumed_from = done
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        with engine.begin() as conn:
+            ids = backfill.next_ids(conn, after_id)
+            values = {'fecha_actualizacion': datetime.utcnow()}
+            if ids:
+                changed += backfill.process(conn, ids) or 0
+                after_id = ids[-1]
+                done += len(ids)
+                values.update(ultimo_id=after_id, procesadas=done, modificadas=changed)
+            else:
+                values['fecha_fin'] = datetime.utcnow()
+            conn.execute(table.update().where(table.c.nombre == backfill.name).values(**values))
+        if not ids:
+            break
+        batches += 1
+        if progress:
+            # Velocidad y tiempo restante de esta ejecución (sin lo ya reanudado)
+            progress(done - resumed_from, max(total, done) - resumed_from, time.perf_counter() - started)
+        time.sleep(backfill.pause)
+    
+    with engine.connect() as conn:
+        return get_checkpoint(conn, backfill.name)
+
+def estimate_backfill(backfill, engine=None, sample_batches=3):
+    """Simulación: ejecuta unos lotes de muestra en una transacción que se
+    deshace y estima cuánto tardaría el backfill completo"""
+    engine = engine or db.engine
+    timings = []
+    changed = 0
+    sampled = 0
+    with engine.connect() as conn:
+        try:
+            state = get_checkpoint(conn, backfill.name)
+            after_id = state.ultimo_id if state is not None else 0
+            rows = backfill.remaining(conn, after_id)
+            for _ in range(sample_batches):
+                start = time.perf_counter()
+                ids = backfill.next_ids(conn, after_id)
+                if not ids:
+                    break
+                changed += backfill.process(conn, ids) or 0
+                timings.append(time.perf_counter() - start)
+                sampled += len(ids)
+                after_id = ids[-1]
+        finally:
+            conn.rollback()
+    
+    batches = math.ceil(rows / backfill.batch_size)
+    batch_seconds = sum(timings) / len(timings) if timings else 0
+    return {
+        'rows': rows,
+        'batches': batches,
+        'sampled_rows': sampled,
+        'sampled_changed': changed,
+        'batch_seconds': batch_seconds,
+        'estimated_seconds': batches * batch_seconds + max(batches - 1, 0) * backfill.pause,
+    }
@@ -0,0 +1,59 @@
+# app/utils/bulk_import.py
+"""Importación de celulares, accesorios o usuarios desde un archivo CSV o
+JSON (`flask import-records`). Todo el lote se valida con validate_batch
+antes de escribir: si algún registro tiene errores no se guarda ninguno."""
+import csv
+import json
+import os
+from werkzeug.security import generate_password_hash
+from app.models import db, Accesorio, Celular, Usuario
+from app.utils.validators import RECORD_CHECKS, normalize_imei, validate_batch
+
+IMPORT_KINDS = tuple(RECORD_CHECKS)
+
+def read_records(path):
+    """Registros (dicts) de un archivo .json (lista de objetos) o .csv (con encabezados)"""
+    if os.path.splitext(path)[1].lower() == '.json':
+        with open(path, encoding='utf-8') as f:
+            records = json.load(f)
+        if not isinstance(records, list) or not all(isinstance(record, dict) for record in records):
+            raise ValueError('El archivo JSON debe contener una lista de objetos')
+        return records
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        return list(csv.DictReader(f))
+
+def _optional(data, field):
+    value = data.get(field)
+    if value is None:
+        return None
+    return str(value).strip() or None
+
+def _celular(data):
+    return Celular(modelo=str(data['modelo']).strip(), marca_id=int(data['marca_id']), precio=float(data['precio']),
+                   stock=int(data['stock']), descripcion=_optional(data, 'descripcion'),
+                   especificaciones={field: _optional(data, field)
+                                     for field in ('ram', 'almacenamiento', 'color', 'pantalla')},
+                   estado=_optional(data, 'estado') or 'nuevo', imei=normalize_imei(data['imei']))
+
+def _accesorio(data):
+    return Accesorio(nombre=str(data['nombre']).strip(), marca_id=int(data['marca_id']),
+                     categoria_id=int(data['categoria_id']), precio=float(data['precio']), stock=int(data['stock']),
+                     descripcion=_optional(data, 'descripcion'), codigo_producto=str(data['codigo_producto']).strip())
+
+def _usuario(data):
+    return Usuario(username=str(data['username']).strip(), password=generate_password_hash(data['password']),
+                   nombre=str(data['nombre']).strip(), rol=data['rol'], telefono=_optional(data, 'telefono'),
+                   direccion=_optional(data, 'direccion'))
+
+BUILDERS = {'celular': _celular, 'accesorio': _accesorio, 'usuario': _usuario}
+
+def import_records(records, kind, save=True):
+    """Valida `records` del tipo `kind` y, si todos son válidos y `save`,
+    los guarda en una sola transacción. Devuelve (errores de validate_batch,
+    registros guardados)."""
+    errors = validate_batch(records, kind)
+    if not save or any(errors):
+        return errors, 0
+    db.session.add_all([BUILDERS[kind](data) for data in records])
+    db.session.commit()
+    return errors, len(records)
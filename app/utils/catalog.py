@@ -0,0 +1,117 @@
+# app/utils/catalog.py
+"""Versiones del catálogo (celulares y accesorios) para la sincronización
+por cambios de la copia local del service worker.
+
+Cada flush que crea, modifica o elimina productos incrementa el contador
+catalogo_version y guarda el valor nuevo en version_catalogo de los
+productos cambiados (o en catalogo_baja, si se eliminaron). Un cliente que
+ya tiene la versión N pide /productos/api/catalogo?desde=N y recibe solo lo
+que cambió después. El UPDATE del contador bloquea su fila hasta el commit,
+así que las versiones se asignan en el orden en que se confirman.
+"""
+from sqlalchemy import event, func, or_, select, update
+from sqlalchemy.orm import Session
+from app.models import db, Accesorio, CatalogoBaja, CatalogoVersion, Celular, Marca
+
+CATALOG_TYPES = {Celular: 'celular', Accesorio: 'accesorio'}
+COUNTER_ID = 1
+
+# Resultados de una búsqueda de productos (/productos/api/buscar)
+LOOKUP_LIMIT = 20
+MAX_LOOKUP_LIMIT = 50
+
+def _next_version(conn):
+    table = CatalogoVersion.__table__
+    result = conn.execute(update(table).where(table.c.id == COUNTER_ID).values(valor=table.c.valor + 1))
+    if not result.rowcount:
+        conn.execute(table.insert().values(id=COUNTER_ID, valor=1))
+        return 1
+    return conn.execute(select(table.c.valor).where(table.c.id == COUNTER_ID)).scalar_one()
+
+def _track_catalog(session, flush_context, instances):
+    # before_flush: la versión se asigna a los objetos antes de escribirlos
+    changed = [obj for obj in session.new if type(obj) in CATALOG_TYPES]
+    changed += [obj for obj in session.dirty if type(obj) in CATALOG_TYPES and session.is_modified(obj)]
+    deleted = [obj for obj in session.deleted if type(obj) in CATALOG_TYPES]
+    if not changed and not deleted:
+        return
+    version = _next_version(session.connection())
+    for obj in changed:
+        obj.version_catalogo = version
+    for obj in deleted:
+        session.add(CatalogoBaja(tipo=CATALOG_TYPES[type(obj)], producto_id=obj.id, version=version))
+
+def init_catalog_versions():
+    """Asigna version_catalogo al guardar celulares y accesorios (idempotente)"""
+    if not event.contains(Session, 'before_flush', _track_catalog):
+        event.listen(Session, 'before_flush', _track_catalog)
+
+def current_version(session=None):
+    session = session or db.session
+    return session.execute(select(CatalogoVersion.valor).where(CatalogoVersion.id == COUNTER_ID)).scalar() or 0
+
+def _celular_row(celular):
+    return {'tipo': 'celular', 'id': celular.id, 'marca_id': celular.marca_id, 'modelo': celular.modelo,
+            'precio': celular.precio, 'stock': celular.stock, 'estado': celular.estado,
+            'version': celular.version_catalogo or 0}
+
+def _accesorio_row(accesorio):
+    return {'tipo': 'accesorio', 'id': accesorio.id, 'marca_id': accesorio.marca_id, 'nombre': accesorio.nombre,
+            'categoria_id': accesorio.categoria_id, 'codigo_producto': accesorio.codigo_producto,
+            'precio': accesorio.precio, 'stock': accesorio.stock, 'version': accesorio.version_catalogo or 0}
+
+def catalog_changes(desde=0, session=None):
+    """Cambios del catálogo posteriores a la versión `desde`.
+
+    Con desde=0 (o una versión que el servidor no conoce) devuelve el
+    catálogo completo con completo=True: el cliente debe reemplazar su copia.
+    Si no, devuelve los productos creados o modificados y las bajas. La
+    versión se lee antes que los productos: un cambio confirmado mientras
+    tanto puede llegar otra vez en la próxima sincronización, pero no perderse.
+    """
+    session = session or db.session
+    version = current_version(session)
+    completo = desde <= 0 or desde > version
+    celulares = session.query(Celular.id, Celular.marca_id, Celular.modelo, Celular.precio, Celular.stock,
+                              Celular.estado, Celular.version_catalogo)
+    accesorios = session.query(Accesorio.id, Accesorio.marca_id, Accesorio.nombre, Accesorio.categoria_id,
+                               Accesorio.codigo_producto, Accesorio.precio, Accesorio.stock,
+                               Accesorio.version_catalogo)
+    bajas = []
+    if not completo:
+        celulares = celulares.filter(Celular.version_catalogo > desde)
+        accesorios = accesorios.filter(Accesorio.version_catalogo > desde)
+        bajas = [{'tipo': tipo, 'id': producto_id} for tipo, producto_id in
+                 session.query(CatalogoBaja.tipo, CatalogoBaja.producto_id)
+                 .filter(CatalogoBaja.version > desde).order_by(CatalogoBaja.version)]
+    return {
+        'version': version,
+        'completo': completo,
+        'celulares': [_celular_row(row) for row in celulares],
+        'accesorios': [_accesorio_row(row) for row in accesorios],
+        'bajas': bajas,
+        'marcas': {str(marca_id): nombre for marca_id, nombre in session.query(Marca.id, Marca.nombre)},
+    }
+
+def search_products(q, limit=LOOKUP_LIMIT, session=None):
+    """Productos con stock cuyo nombre, marca o código contienen todas las
+    palabras de `q` (sin distinguir mayúsculas). Es la misma búsqueda que el
+    service worker resuelve con la copia local (static/sw.js)."""
+    session = session or db.session
+    limit = max(1, min(limit, MAX_LOOKUP_LIMIT))
+    words = [f'%{word}%' for word in (q or '').lower().split()]
+    celulares = session.query(Celular.id, Celular.modelo, Celular.precio, Celular.stock, Marca.nombre) \
+        .join(Marca, Celular.marca_id == Marca.id).filter(Celular.stock > 0)
+    accesorios = session.query(Accesorio.id, Accesorio.nombre, Accesorio.precio, Accesorio.stock, Marca.nombre) \
+        .join(Marca, Accesorio.marca_id == Marca.id).filter(Accesorio.stock > 0)
+    for word in words:
+        celulares = celulares.filter(or_(func.lower(Celular.modelo).like(word), func.lower(Marca.nombre).like(word)))
+        accesorios = accesorios.filter(or_(func.lower(Accesorio.nombre).like(word),
+                                           func.lower(Marca.nombre).like(word),
+                                           func.lower(Accesorio.codigo_producto).like(word)))
+    results = [{'tipo': 'celular', 'id': id, 'nombre': f'{marca} {modelo}', 'marca': marca,
+                'precio': precio, 'stock': stock}
+               for id, modelo, precio, stock, marca in celulares.order_by(Marca.nombre, Celular.modelo).limit(limit)]
+    results += [{'tipo': 'accesorio', 'id': id, 'nombre': nombre, 'marca': marca, 'precio': precio, 'stock': stock}
+                for id, nombre, precio, stock, marca in accesorios.order_by(Accesorio.nombre).limit(limit)]
+    return results[:limit]
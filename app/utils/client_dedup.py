@@ -0,0 +1,150 @@
+# app/utils/client_dedup.py
+"""Detección y fusión de clientes duplicados.
+
+Cada cliente tiene dos claves de bloque indexadas: el teléfono normalizado y
+la clave fonética del nombre (ver app/utils/clients.py). Solo se comparan
+clientes que comparten un bloque, así que una pasada completa lee los bloques
+repetidos en orden de índice y hace comparaciones dentro de cada uno, en
+lugar de comparar todos contra todos.
+"""
+from difflib import SequenceMatcher
+from itertools import combinations, groupby
+from sqlalchemy import func, or_, select, update
+from app.models import db, Cliente, Venta, VentaArchivo
+from app.utils.client_stats import refresh_client_stats
+from app.utils.clients import plain_name
+
+# Claves de bloque: columnas indexadas de cliente
+BLOCKING_KEYS = ('telefono_normalizado', 'nombre_fonetico')
+
+# Puntaje mínimo (0 a 1) para proponer dos clientes como duplicados
+DUPLICATE_THRESHOLD = 0.8
+
+# Bloques más grandes no se comparan (teléfonos de relleno como 0000000 o
+# nombres muy comunes sin más datos): se informan para revisarlos aparte
+MAX_BLOCK_SIZE = 200
+
+# Columnas de cliente que usa la comparación
+_COLUMNS = ('id', 'nombre', 'email', 'telefono_normalizado', 'nombre_fonetico')
+
+# Columnas que el cliente que queda completa con las de los duplicados
+MERGE_FILL_ATTRIBUTES = ('email', 'telefono', 'direccion')
+
+def match_score(a, b):
+    """Puntaje de que `a` y `b` (con las columnas de _COLUMNS) sean el mismo
+    cliente: similitud de nombres (mayor si suenan igual), reforzada si
+    coincide el teléfono o el email. Dos teléfonos distintos sin el mismo
+    email descartan el par; un teléfono compartido solo no basta, porque en
+    una familia suele ser el mismo."""
+    same_email = bool(a['email']) and (a['email'] or '').lower() == (b['email'] or '').lower()
+    both_phones = a['telefono_normalizado'] and b['telefono_normalizado']
+    same_phone = both_phones and a['telefono_normalizado'] == b['telefono_normalizado']
+    if both_phones and not same_phone and not same_email:
+        # Descartado sin comparar nombres: es el caso más común dentro de un bloque
+        return 0.0
+    name = SequenceMatcher(None, plain_name(a['nombre']), plain_name(b['nombre'])).ratio()
+    if a['nombre_fonetico'] and a['nombre_fonetico'] == b['nombre_fonetico']:
+        name = (1 + name) / 2
+    if same_phone:
+        return 0.3 + 0.7 * name
+    if both_phones:
+        return 0.5 * name + 0.4
+    return 0.9 * name + (0.1 if same_email else 0)
+
+def _block_rows(column):
+    """Clientes cuyos valores de `column` se repiten, ordenados por bloque"""
+    table = Cliente.__table__
+    key = table.c[column]
+    repeated = select(key).where(key.isnot(None)).group_by(key).having(func.count() > 1)
+    query = select(*(table.c[name] for name in _COLUMNS)).where(key.in_(repeated)).order_by(key, table.c.id)
+    return db.session.execute(query).mappings()
+
+def duplicate_pairs(threshold=DUPLICATE_THRESHOLD, max_block_size=MAX_BLOCK_SIZE, stats=None):
+    """Genera (id_menor, id_mayor, puntaje) de los pares de posibles
+    duplicados. `stats` (dict) recibe bloques, comparaciones y bloques
+    omitidos por tamaño."""
+    stats = stats if stats is not None else {}
+    stats.update(bloques=0, comparaciones=0, omitidos=[])
+    for position, column in enumerate(BLOCKING_KEYS):
+        earlier = BLOCKING_KEYS[:position]
+        for value, rows in groupby(_block_rows(column), key=lambda row: row[column]):
+            block = [dict(row) for row in rows]
+            if len(block) > max_block_size:
+                stats['omitidos'].append((column, value, len(block)))
+                continue
+            stats['bloques'] += 1
+            for a, b in combinations(block, 2):
+                # El par ya se comparó en el bloque de una clave anterior
+                if any(a[key] is not None and a[key] == b[key] for key in earlier):
+                    continue
+                stats['comparaciones'] += 1
+                score = match_score(a, b)
+                if score >= threshold:
+                    yield a['id'], b['id'], score
+
+def duplicate_groups(pairs):
+    """Agrupa los pares en conjuntos de duplicados (componentes conexas).
+    Devuelve listas de ids ordenadas, con el cliente más antiguo primero."""
+    parent = {}
+    
+    def find(item):
+        parent.setdefault(item, item)
+        while parent[item] != item:
+            parent[item] = parent[parent[item]]
+            item = parent[item]
+        return item
+    
+    for a, b, _ in pairs:
+        root_a, root_b = find(a), find(b)
+        if root_a != root_b:
+            parent[max(root_a, root_b)] = min(root_a, root_b)
+    groups = {}
+    for item in parent:
+        groups.setdefault(find(item), []).append(item)
+    return sorted(sorted(group) for group in groups.values())
+
+def client_duplicates(cliente, threshold=DUPLICATE_THRESHOLD, limit=MAX_BLOCK_SIZE):
+    """Posibles duplicados de un cliente: [(cliente, puntaje)] del más al
+    menos parecido. Solo lee sus bloques, con los índices de cada clave."""
+    conditions = [getattr(Cliente, column) == getattr(cliente, column)
+                  for column in BLOCKING_KEYS if getattr(cliente, column)]
+    if not conditions:
+        return []
+    candidates = Cliente.query.filter(or_(*conditions), Cliente.id != cliente.id) \
+        .order_by(Cliente.id).limit(limit).all()
+    row = {name: getattr(cliente, name) for name in _COLUMNS}
+    scored = [(candidate, match_score(row, {name: getattr(candidate, name) for name in _COLUMNS}))
+              for candidate in candidates]
+    return sorted([item for item in scored if item[1] >= threshold], key=lambda item: -item[1])
+
+def merge_clients(survivor_id, duplicate_ids):
+    """Fusiona los clientes `duplicate_ids` en `survivor_id`: sus ventas (y
+    las archivadas) pasan al que queda, que completa email, teléfono y
+    dirección vacíos con los de los duplicados y recalcula su resumen de
+    compras, y los duplicados se borran.
+    No confirma la transacción. Devuelve el número de ventas movidas.
+    ValueError si algún cliente no existe."""
+    ids = sorted(set(duplicate_ids) - {survivor_id})
+    survivor = db.session.get(Cliente, survivor_id)
+    duplicates = Cliente.query.filter(Cliente.id.in_(ids)).order_by(Cliente.id).all() if ids else []
+    if survivor is None or len(duplicates) != len(ids):
+        raise ValueError('Cliente no encontrado')
+    
+    for attr in MERGE_FILL_ATTRIBUTES:
+        if not getattr(survivor, attr):
+            value = next((getattr(d, attr) for d in duplicates if getattr(d, attr)), None)
+            if value:
+                setattr(survivor, attr, value)
+    moved = 0
+    for model in (Venta, VentaArchivo):
+        result = db.session.execute(update(model).where(model.cliente_id.in_(ids))
+                                    .values(cliente_id=survivor_id)
+                                    .execution_options(synchronize_session='fetch'))
+        moved += result.rowcount
+    # Resumen de compras: el que queda suma las ventas recibidas
+    refresh_client_stats([survivor_id] + ids)
+    for duplicate in duplicates:
+        # Ventas y resumen ya actualizados: no volver a tocarlos al borrar
+        db.session.expire(duplicate, ['ventas', 'resumen', 'marcas'])
+        db.session.delete(duplicate)
+    return moved
@@ -0,0 +1,113 @@
+# app/utils/client_linking.py
+"""Vinculación de ventas históricas con clientes.
+
+Las ventas guardadas antes de `cliente_id` solo tienen `cliente_nombre` y
+`cliente_telefono`. Estos backfills recorren por lotes las que no tienen
+cliente y las asocian: primero por teléfono normalizado y, si no hay, por
+nombre (mismas palabras sin acentos, buscado con el índice de la clave
+fonética). Las que no coinciden con nadie crean su cliente, todos los del
+lote en un solo INSERT. Después, las consultas por cliente usan el índice
+de cliente_id en lugar de comparar textos.
+"""
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.orm import Session
+from app.models import Cliente, Venta, VentaArchivo
+from app.utils.backfill import Backfill, register_backfill
+from app.utils.client_stats import refresh_client_stats
+from app.utils.clients import phonetic_key, plain_name
+from app.utils.validators import normalize_phone
+
+# Nombres de mostrador: sin teléfono, la venta queda sin cliente
+GENERIC_NAMES = frozenset(plain_name(nombre) for nombre in (
+    'Cliente', 'Cliente general', 'Consumidor final', 'Público general', 'Mostrador',
+    'No especificado', 'Sin nombre', 'Varios'))
+
+def sale_phone(telefono):
+    """Teléfono normalizado de una venta, o None si falta o es de relleno (0000000)"""
+    normalizado = normalize_phone(telefono) if telefono else None
+    return normalizado if normalizado and len(set(normalizado)) > 1 else None
+
+def _same_person(client, phone):
+    # Con el mismo nombre, dos teléfonos distintos son dos personas
+    return not (phone and client['telefono_normalizado'] and client['telefono_normalizado'] != phone)
+
+class SaleClientBackfill(Backfill):
+    """Asocia las ventas de `table` sin cliente_id con su cliente y recalcula
+    el resumen de compras de los clientes afectados"""
+    
+    def where(self):
+        return self.table.c.cliente_id.is_(None)
+    
+    def _known_clients(self, conn, phones, keys):
+        cliente = Cliente.__table__
+        columns = (cliente.c.id, cliente.c.nombre, cliente.c.telefono_normalizado)
+        by_phone, by_name = {}, {}
+        if phones:
+            for row in conn.execute(select(*columns).where(cliente.c.telefono_normalizado.in_(phones))
+                                    .order_by(cliente.c.id)).mappings():
+                by_phone.setdefault(row['telefono_normalizado'], dict(row))
+        if keys:
+            for row in conn.execute(select(*columns).where(cliente.c.nombre_fonetico.in_(keys))
+                                    .order_by(cliente.c.id)).mappings():
+                by_name.setdefault(plain_name(row['nombre']), []).append(dict(row))
+        return by_phone, by_name
+    
+    def process(self, conn, ids):
+        venta = self.table
+        rows = conn.execute(select(venta.c.id, venta.c.cliente_nombre, venta.c.cliente_telefono,
+                                   venta.c.fecha_venta).where(venta.c.id.in_(ids))).all()
+        sales = []
+        for venta_id, nombre, telefono, fecha in rows:
+            phone, name = sale_phone(telefono), plain_name(nombre)
+            if phone or (name and name not in GENERIC_NAMES):
+                sales.append((venta_id, nombre, telefono, fecha, phone, name))
+        by_phone, by_name = self._known_clients(
+            conn, {sale[4] for sale in sales if sale[4]}, {phonetic_key(sale[1]) for sale in sales} - {None})
+        
+        # Los clientes nuevos entran en los mismos índices: otra venta del
+        # lote con ese teléfono o nombre los reutiliza
+        links, created = [], []
+        for venta_id, nombre, telefono, fecha, phone, name in sales:
+            client = by_phone.get(phone) if phone else None
+            if client is None and name not in GENERIC_NAMES:
+                client = next((c for c in by_name.get(name, ()) if _same_person(c, phone)), None)
+            if client is None:
+                client = {'nombre': nombre, 'telefono': telefono if phone else None, 'telefono_normalizado': phone,
+                          'nombre_fonetico': phonetic_key(nombre), 'fecha_registro': fecha}
+                created.append(client)
+                by_name.setdefault(name, []).append(client)
+                if phone:
+                    by_phone[phone] = client
+            elif fecha and client.get('fecha_registro') and fecha < client['fecha_registro']:
+                # Cliente nuevo: registrado en su primera compra
+                client['fecha_registro'] = fecha
+            links.append((venta_id, client))
+        
+        if created:
+            # El INSERT no pasa por los listeners del modelo: las claves ya van calculadas
+            cliente = Cliente.__table__
+            values = [{key: client[key] for key in ('nombre', 'telefono', 'telefono_normalizado',
+                                                    'nombre_fonetico', 'fecha_registro')}
+                      for client in created]
+            inserted = conn.execute(cliente.insert().returning(cliente.c.id, sort_by_parameter_order=True), values)
+            for client, (cliente_id,) in zip(created, inserted):
+                client['id'] = cliente_id
+        if links:
+            conn.execute(update(venta).where(venta.c.id == bindparam('venta_id'))
+                         .values(cliente_id=bindparam('vinculo')),
+                         [{'venta_id': venta_id, 'vinculo': client['id']} for venta_id, client in links])
+            with Session(bind=conn) as session:
+                refresh_client_stats(sorted({client['id'] for _, client in links}), session=session)
+        return len(links)
+
+@register_backfill
+class SaleClientLinkBackfill(SaleClientBackfill):
+    name = 'venta-cliente'
+    description = 'Asociar las ventas sin cliente_id con su cliente (por teléfono y nombre)'
+    table = Venta.__table__
+
+@register_backfill
+class ArchivedSaleClientLinkBackfill(SaleClientBackfill):
+    name = 'venta-archivo-cliente'
+    description = 'Asociar las ventas archivadas sin cliente_id con su cliente (por teléfono y nombre)'
+    table = VentaArchivo.__table__
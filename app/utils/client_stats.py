@@ -0,0 +1,201 @@
+# app/utils/client_stats.py
+"""Historial de compras por cliente: cantidad de compras, total gastado,
+última compra y marca favorita en cliente_resumen, actualizados por
+process_sale y cancel_sale para no recorrer la tabla de ventas, y la
+segmentación RFM (recencia, frecuencia, valor) calculada desde ese resumen"""
+from collections import Counter
+from sqlalchemy import case, func, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from app.models import (db, Accesorio, Celular, Cliente, ClienteMarca, ClienteResumen, DetalleVenta,
+                        DetalleVentaArchivo, Marca, Venta, VentaArchivo)
+
+# Productos con marca: tipo de detalle -> modelo
+BRANDED_PRODUCTS = {'celular': Celular, 'accesorio': Accesorio}
+
+# Segmentos RFM por puntajes de 1 a 5 (5 = más reciente / más compras / más
+# gasto). Se asigna el primero que cumple; el resto son "ocasionales".
+RFM_SEGMENTS = (
+    ('campeones', lambda r, f, m: (r >= 4) & (f >= 4) & (m >= 4)),
+    ('leales', lambda r, f, m: (r >= 3) & (f >= 4)),
+    ('nuevos', lambda r, f, m: (r >= 4) & (f <= 2)),
+    ('en_riesgo', lambda r, f, m: (r <= 2) & (f >= 3)),
+    ('perdidos', lambda r, f, m: (r <= 2) & (f <= 2)),
+)
+DEFAULT_SEGMENT = 'ocasionales'
+
+# INSERT ... ON CONFLICT DO UPDATE por dialecto: dos primeras ventas
+# simultáneas de un cliente no chocan con la clave primaria del resumen
+UPSERT_INSERTS = {'sqlite': sqlite.insert, 'postgresql': postgresql.insert}
+
+def sale_brands(detalles):
+    """Unidades por marca de los detalles de una venta (una consulta por tipo de producto)"""
+    units = Counter()
+    for tipo, model in BRANDED_PRODUCTS.items():
+        cantidades = Counter()
+        for detalle in detalles:
+            if detalle.tipo_producto == tipo:
+                cantidades[detalle.producto_id] += detalle.cantidad
+        if cantidades:
+            for producto_id, marca_id in db.session.query(model.id, model.marca_id) \
+                    .filter(model.id.in_(list(cantidades))):
+                if marca_id is not None:
+                    units[marca_id] += cantidades[producto_id]
+    return units
+
+def _purchase_dates(cliente_id):
+    """(primera, última) venta completada del cliente (índice por cliente_id)"""
+    ranges = [db.session.query(func.min(model.fecha_venta), func.max(model.fecha_venta))
+              .filter(model.cliente_id == cliente_id, model.estado == 'completada').one()
+              for model in (Venta, VentaArchivo)]
+    firsts = [first for first, _ in ranges if first is not None]
+    lasts = [last for _, last in ranges if last is not None]
+    return min(firsts, default=None), max(lasts, default=None)
+
+def _refresh_favorite(cliente_id):
+    table = ClienteMarca.__table__
+    favorite = db.session.execute(select(table.c.marca_id)
+                                  .where(table.c.cliente_id == cliente_id, table.c.unidades > 0)
+                                  .order_by(table.c.unidades.desc(), table.c.marca_id).limit(1)).scalar()
+    db.session.execute(update(ClienteResumen.__table__)
+                       .where(ClienteResumen.__table__.c.cliente_id == cliente_id)
+                       .values(marca_favorita_id=favorite))
+
+def _upsert(table, values, keys, changes):
+    """Inserta `values` o, si la fila ya existe, le aplica `changes` (una
+    sola sentencia en SQLite y PostgreSQL; UPDATE y luego INSERT en otros)"""
+    insert = UPSERT_INSERTS.get(db.session.get_bind().dialect.name)
+    if insert is not None:
+        db.session.execute(insert(table).values(**values).on_conflict_do_update(index_elements=keys, set_=changes))
+        return
+    result = db.session.execute(update(table).where(*(table.c[key] == values[key] for key in keys))
+                                .values(**changes))
+    if not result.rowcount:
+        db.session.execute(table.insert().values(**values))
+
+def _apply_brand_deltas(cliente_id, units, sign):
+    table = ClienteMarca.__table__
+    for marca_id, cantidad in units.items():
+        if sign > 0:
+            _upsert(table, {'cliente_id': cliente_id, 'marca_id': marca_id, 'unidades': cantidad},
+                    ['cliente_id', 'marca_id'], {'unidades': table.c.unidades + cantidad})
+        else:
+            db.session.execute(update(table).where(table.c.cliente_id == cliente_id, table.c.marca_id == marca_id)
+                               .values(unidades=table.c.unidades - cantidad))
+    if units:
+        _refresh_favorite(cliente_id)
+
+def record_client_sale(venta, brands=None):
+    """Suma una venta completada al resumen de su cliente (sin confirmar).
+    `brands` son las unidades por marca si ya se conocen."""
+    if venta.cliente_id is None:
+        return
+    table = ClienteResumen.__table__
+    fecha = venta.fecha_venta
+    total = venta.total or 0
+    _upsert(table, {'cliente_id': venta.cliente_id, 'compras': 1, 'total_gastado': total,
+                    'primera_compra': fecha, 'ultima_compra': fecha}, ['cliente_id'], {
+        'compras': table.c.compras + 1,
+        'total_gastado': table.c.total_gastado + total,
+        'primera_compra': case((table.c.primera_compra.is_(None) | (table.c.primera_compra > fecha), fecha),
+                               else_=table.c.primera_compra),
+        'ultima_compra': case((table.c.ultima_compra.is_(None) | (table.c.ultima_compra < fecha), fecha),
+                              else_=table.c.ultima_compra)})
+    _apply_brand_deltas(venta.cliente_id, brands if brands is not None else sale_brands(venta.detalles), 1)
+
+def revert_client_sale(venta):
+    """Resta una venta cancelada del resumen de su cliente (sin confirmar).
+    Llamar después de cambiar el estado: la última compra se recalcula sin ella."""
+    if venta.cliente_id is None:
+        return
+    table = ClienteResumen.__table__
+    db.session.flush()
+    primera, ultima = _purchase_dates(venta.cliente_id)
+    db.session.execute(update(table).where(table.c.cliente_id == venta.cliente_id).values(
+        compras=table.c.compras - 1,
+        total_gastado=table.c.total_gastado - (venta.total or 0),
+        primera_compra=primera, ultima_compra=ultima))
+    _apply_brand_deltas(venta.cliente_id, sale_brands(venta.detalles), -1)
+
+def refresh_client_stats(cliente_ids=None, session=None):
+    """Recalcula el resumen de los clientes indicados (o de todos) desde las
+    ventas y ventas archivadas, con consultas agrupadas en `session`
+    (db.session si no se indica). No confirma.
+    Devuelve el número de clientes con compras."""
+    session = session or db.session
+    resumen, marcas = ClienteResumen.__table__, ClienteMarca.__table__
+    summary = {}
+    units = Counter()
+    for model, detail_model in ((Venta, DetalleVenta), (VentaArchivo, DetalleVentaArchivo)):
+        query = session.query(model.cliente_id, func.count(model.id), func.sum(model.total),
+                              func.min(model.fecha_venta), func.max(model.fecha_venta)) \
+            .filter(model.cliente_id.isnot(None), model.estado == 'completada')
+        if cliente_ids is not None:
+            query = query.filter(model.cliente_id.in_(cliente_ids))
+        for cliente_id, compras, total, primera, ultima in query.group_by(model.cliente_id):
+            row = summary.setdefault(cliente_id, {'cliente_id': cliente_id, 'compras': 0, 'total_gastado': 0.0,
+                                                  'primera_compra': None, 'ultima_compra': None,
+                                                  'marca_favorita_id': None})
+            row['compras'] += compras
+            row['total_gastado'] += total or 0
+            row['primera_compra'] = min(filter(None, (row['primera_compra'], primera)), default=None)
+            row['ultima_compra'] = max(filter(None, (row['ultima_compra'], ultima)), default=None)
+        for tipo, product_model in BRANDED_PRODUCTS.items():
+            query = session.query(model.cliente_id, product_model.marca_id, func.sum(detail_model.cantidad)) \
+                .join(detail_model, detail_model.venta_id == model.id) \
+                .join(product_model, product_model.id == detail_model.producto_id) \
+                .filter(model.cliente_id.isnot(None), model.estado == 'completada',
+                        detail_model.tipo_producto == tipo, product_model.marca_id.isnot(None))
+            if cliente_ids is not None:
+                query = query.filter(model.cliente_id.in_(cliente_ids))
+            for cliente_id, marca_id, cantidad in query.group_by(model.cliente_id, product_model.marca_id):
+                units[(cliente_id, marca_id)] += cantidad or 0
+    
+    for (cliente_id, marca_id), cantidad in sorted(units.items(), key=lambda item: (-item[1], item[0])):
+        if cliente_id in summary and summary[cliente_id]['marca_favorita_id'] is None:
+            summary[cliente_id]['marca_favorita_id'] = marca_id
+    for table in (resumen, marcas):
+        delete = table.delete()
+        if cliente_ids is not None:
+            delete = delete.where(table.c.cliente_id.in_(cliente_ids))
+        session.execute(delete)
+    if summary:
+        session.execute(resumen.insert(), list(summary.values()))
+    if units:
+        session.execute(marcas.insert(), [{'cliente_id': c, 'marca_id': m, 'unidades': n}
+                                          for (c, m), n in units.items()])
+    return len(summary)
+
+def rebuild_client_stats():
+    """Recalcula cliente_resumen y cliente_marca desde cero"""
+    count = refresh_client_stats()
+    db.session.commit()
+    return count
+
+def _score(column):
+    # Quintil por distribución acumulada: los empates reciben el mismo puntaje
+    dist = func.cume_dist().over(order_by=column)
+    return case((dist <= 0.2, 1), (dist <= 0.4, 2), (dist <= 0.6, 3), (dist <= 0.8, 4), else_=5)
+
+def rfm_segments(segmento=None, limit=50, session=None):
+    """Clientes con compras del mayor al menor puntaje RFM, con su segmento
+    y el total de clientes de ese segmento (`en_segmento`). Una sola
+    consulta sobre cliente_resumen (una fila por cliente), sin leer las
+    ventas."""
+    session = session or db.session
+    resumen = ClienteResumen.__table__
+    scored = select(resumen, _score(resumen.c.ultima_compra).label('r'), _score(resumen.c.compras).label('f'),
+                    _score(resumen.c.total_gastado).label('m')) \
+        .where(resumen.c.compras > 0).subquery()
+    segment = case(*((rule(scored.c.r, scored.c.f, scored.c.m), name) for name, rule in RFM_SEGMENTS),
+                   else_=DEFAULT_SEGMENT)
+    segmented = select(scored, segment.label('segmento')).subquery()
+    counted = select(segmented, func.count().over(partition_by=segmented.c.segmento).label('en_segmento')) \
+        .subquery()
+    query = select(counted, Cliente.nombre, Cliente.telefono, Marca.nombre.label('marca_favorita')) \
+        .join(Cliente, Cliente.id == counted.c.cliente_id) \
+        .outerjoin(Marca, Marca.id == counted.c.marca_favorita_id)
+    if segmento:
+        query = query.where(counted.c.segmento == segmento)
+    query = query.order_by((counted.c.r + counted.c.f + counted.c.m).desc(), counted.c.total_gastado.desc(),
+                           counted.c.cliente_id).limit(limit)
+    return [dict(row) for row in session.execute(query).mappings()]
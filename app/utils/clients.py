@@ -0,0 +1,155 @@
+# app/utils/clients.py
+"""Clientes: teléfono normalizado (solo dígitos) y clave fonética del
+nombre, ambos indexados, y listado paginado con búsqueda por prefijo de
+nombre o de teléfono"""
+import re
+import unicodedata
+from functools import lru_cache
+from sqlalchemy import bindparam, event, func, select, update
+from app.models import Cliente
+from app.utils.backfill import Backfill, register_backfill
+from app.utils.pagination import keyset_paginate_by_key
+from app.utils.validators import normalize_phone
+
+# Una búsqueda es de teléfono si solo tiene dígitos y separadores
+PHONE_QUERY_RE = re.compile(r'^\+?[\d\s\-\(\)]+$')
+NON_DIGITS_RE = re.compile(r'\D')
+
+# Dígitos mínimos para buscar por teléfono (con menos, se busca por nombre)
+MIN_PHONE_DIGITS = 3
+
+# Mayor carácter posible: cierra el rango de una búsqueda por prefijo
+PREFIX_END = '\U0010ffff'
+
+# Clave fonética: reglas de pronunciación del español aplicadas en orden.
+# Las letras ya convertidas quedan en mayúsculas para no volver a aplicarles
+# otra regla; las vocales después de la primera letra se descartan.
+PHONETIC_RULES = (
+    (re.compile(r'ch'), 'C'),
+    (re.compile(r'll'), 'Y'),
+    (re.compile(r'qu'), 'K'),
+    (re.compile(r'gu(?=[ei])'), 'G'),
+    (re.compile(r'g(?=[ei])'), 'J'),
+    (re.compile(r'c(?=[ei])'), 'S'),
+    (re.compile(r'[ckq]'), 'K'),
+    (re.compile(r'[sz]'), 'S'),
+    (re.compile(r'[bvw]'), 'B'),
+    (re.compile(r'y(?![aeiou])'), 'I'),
+    (re.compile(r'x'), 'KS'),
+    (re.compile(r'h'), ''),
+)
+NON_LETTERS_RE = re.compile(r'[^a-z]+')
+REPEATED_RE = re.compile(r'(.)\1+')
+VOWELS_RE = re.compile(r'[AEIOU]')
+PHONETIC_KEY_LENGTH = 60
+
+@lru_cache(maxsize=65536)
+def plain_name(nombre):
+    """Nombre en minúsculas, sin acentos ni signos, con las palabras en orden"""
+    text = unicodedata.normalize('NFKD', nombre or '').encode('ascii', 'ignore').decode().lower()
+    return ' '.join(sorted(NON_LETTERS_RE.sub(' ', text).split()))
+
+def _phonetic_word(word):
+    for pattern, replacement in PHONETIC_RULES:
+        word = pattern.sub(replacement, word)
+    word = REPEATED_RE.sub(r'\1', word.upper())
+    return word[:1] + VOWELS_RE.sub('', word[1:])
+
+def phonetic_key(nombre):
+    """Clave fonética del nombre: "Gonzales Xiomara" y "Xiomara González" dan la misma"""
+    words = sorted(_phonetic_word(word) for word in plain_name(nombre).split())
+    return ' '.join(word for word in words if word)[:PHONETIC_KEY_LENGTH] or None
+
+def client_sort_key():
+    """Orden del listado; coincide con el índice ix_cliente_nombre"""
+    return func.lower(Cliente.nombre)
+
+def _normalize_client_phone(target, value, oldvalue, initiator):
+    target.telefono_normalizado = normalize_phone(value) if value else None
+
+def _client_phonetic_key(target, value, oldvalue, initiator):
+    target.nombre_fonetico = phonetic_key(value)
+
+def init_client_tracking():
+    """Calcula telefono_normalizado y nombre_fonetico al asignar el teléfono
+    y el nombre de un cliente (idempotente)"""
+    if not event.contains(Cliente.telefono, 'set', _normalize_client_phone):
+        event.listen(Cliente.telefono, 'set', _normalize_client_phone)
+        event.listen(Cliente.nombre, 'set', _client_phonetic_key)
+
+def find_client_by_phone(telefono):
+    """Cliente más antiguo con ese teléfono (comparado normalizado), o None"""
+    normalizado = normalize_phone(telefono) if telefono else None
+    if not normalizado:
+        return None
+    return Cliente.query.filter_by(telefono_normalizado=normalizado).order_by(Cliente.id).first()
+
+def phone_query(query):
+    """Dígitos de la búsqueda si parece un teléfono, None si no"""
+    if not PHONE_QUERY_RE.match(query):
+        return None
+    digits = NON_DIGITS_RE.sub('', query)
+    return digits if len(digits) >= MIN_PHONE_DIGITS else None
+
+def _prefix_filter(column, prefix):
+    # Rango en lugar de LIKE: usa el índice en SQLite y PostgreSQL
+    return (column >= prefix) & (column < prefix.concat(PREFIX_END))
+
+def search_clients(query=None):
+    """Clientes cuyo nombre empieza por `query` (sin distinguir mayúsculas)
+    o, si son dígitos, cuyo teléfono normalizado empieza por ellos"""
+    query = (query or '').strip()
+    clientes = Cliente.query
+    digits = phone_query(query)
+    if digits:
+        return clientes.filter(_prefix_filter(Cliente.telefono_normalizado, bindparam('telefono', digits)))
+    if query:
+        return clientes.filter(_prefix_filter(client_sort_key(), func.lower(bindparam('nombre', query))))
+    return clientes
+
+def client_page(query=None, cursor=None, per_page=25):
+    """Página de search_clients(query) por nombre. ValueError si el cursor no es válido."""
+    return keyset_paginate_by_key(search_clients(query), client_sort_key(), Cliente.id,
+                                  cursor=cursor, per_page=per_page)
+
+@register_backfill
+class ClientPhoneBackfill(Backfill):
+    """Calcula telefono_normalizado de los clientes guardados antes de la
+    columna. Los teléfonos que no pasan validate_phone quedan en NULL."""
+    name = 'cliente-telefono-normalizado'
+    description = 'Calcular telefono_normalizado de los clientes existentes'
+    table = Cliente.__table__
+    
+    def where(self):
+        return self.table.c.telefono.isnot(None) & self.table.c.telefono_normalizado.is_(None)
+    
+    def process(self, conn, ids):
+        cliente = self.table
+        rows = conn.execute(select(cliente.c.id, cliente.c.telefono).where(cliente.c.id.in_(ids))).all()
+        values = [{'cliente_id': cliente_id, 'normalizado': normalize_phone(telefono)}
+                  for cliente_id, telefono in rows]
+        values = [value for value in values if value['normalizado']]
+        if values:
+            conn.execute(update(cliente).where(cliente.c.id == bindparam('cliente_id'))
+                         .values(telefono_normalizado=bindparam('normalizado')), values)
+        return len(values)
+
+@register_backfill
+class ClientPhoneticKeyBackfill(Backfill):
+    """Calcula nombre_fonetico de los clientes guardados antes de la columna"""
+    name = 'cliente-nombre-fonetico'
+    description = 'Calcular nombre_fonetico de los clientes existentes'
+    table = Cliente.__table__
+    
+    def where(self):
+        return self.table.c.nombre_fonetico.is_(None)
+    
+    def process(self, conn, ids):
+        cliente = self.table
+        rows = conn.execute(select(cliente.c.id, cliente.c.nombre).where(cliente.c.id.in_(ids))).all()
+        values = [{'cliente_id': cliente_id, 'clave': phonetic_key(nombre)} for cliente_id, nombre in rows]
+        values = [value for value in values if value['clave']]
+        if values:
+            conn.execute(update(cliente).where(cliente.c.id == bindparam('cliente_id'))
+                         .values(nombre_fonetico=bindparam('clave')), values)
+        return len(values)
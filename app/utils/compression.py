@@ -0,0 +1,95 @@
+# app/utils/compression.py
+"""Compresión de respuestas (brotli o gzip) según Accept-Encoding.
+
+Se comprimen las respuestas de texto (HTML, JSON, CSS, JS, SVG) de al menos
+COMPRESS_MIN_SIZE bytes; por debajo de ese tamaño la compresión no ahorra
+lo que cuesta. Brotli se usa si el paquete `brotli` está instalado y el
+cliente lo acepta; si no, gzip. Los archivos estáticos se comprimen una vez
+por versión (ETag) y codificación y se guardan en memoria.
+"""
+import gzip
+from flask import current_app, request
+
+try:
+    import brotli
+except ImportError:  # Opcional: sin él solo se usa gzip
+    brotli = None
+
+# Archivos estáticos ya comprimidos: (etag, codificación) -> bytes
+_static_cache = {}
+STATIC_CACHE_ENTRIES = 256
+
+def available_encodings():
+    """Codificaciones soportadas, en orden de preferencia"""
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+def choose_encoding(accept_encoding):
+    """Mejor codificación aceptada por el cliente (None: sin comprimir)"""
+    accepted = {}
+    for part in (accept_encoding or '').split(','):
+        coding, _, params = part.strip().partition(';')
+        quality = 1.0
+        if params.strip().startswith('q='):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        if coding:
+            accepted[coding.strip().lower()] = quality
+    for encoding in available_encodings():
+        if accepted.get(encoding, accepted.get('*', 0)) > 0:
+            return encoding
+    return None
+
+def compress(data, encoding, config):
+    if encoding == 'br':
+        return brotli.compress(data, quality=config['COMPRESS_BROTLI_QUALITY'])
+    return gzip.compress(data, compresslevel=config['COMPRESS_GZIP_LEVEL'], mtime=0)
+
+def _compressible(response, config):
+    if response.status_code < 200 or response.status_code in (204, 206, 304):
+        return False
+    if 'Content-Encoding' in response.headers or response.mimetype not in config['COMPRESS_MIMETYPES']:
+        return False
+    # Las respuestas generadas por partes se envían tal cual
+    return response.direct_passthrough or not response.is_streamed
+
+def compress_response(response):
+    """after_request: comprime la respuesta si el cliente lo acepta"""
+    config = current_app.config
+    if not config['COMPRESS_RESPONSES'] or not _compressible(response, config):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding(request.headers.get('Accept-Encoding'))
+    if encoding is None:
+        return response
+    
+    static = response.direct_passthrough
+    etag, _ = response.get_etag()
+    if static:
+        # Archivo enviado con send_file: se lee completo (son archivos chicos)
+        response.direct_passthrough = False
+    data = response.get_data()
+    if len(data) < config['COMPRESS_MIN_SIZE']:
+        return response
+    if static and etag:
+        key = (etag, encoding)
+        body = _static_cache.get(key)
+        if body is None:
+            if len(_static_cache) >= STATIC_CACHE_ENTRIES:
+                _static_cache.clear()
+            body = _static_cache[key] = compress(data, encoding, config)
+    else:
+        body = compress(data, encoding, config)
+    
+    response.set_data(body)
+    response.headers['Content-Encoding'] = encoding
+    response.headers.pop('Accept-Ranges', None)
+    if etag:
+        # Otra representación del mismo recurso: ETag débil (los 304 siguen funcionando)
+        response.set_etag(etag, weak=True)
+    return response
+
+def init_compression(app):
+    """Registra la compresión como último paso de cada respuesta"""
+    app.after_request(compress_response)
@@ -1,14 +1,17 @@
 from app.models import db, Celular, Accesorio, Venta, Servicio
 from datetime import datetime, date
 from sqlalchemy import func
+from app.utils.database import read_session
 
 def get_dashboard_stats():
     """Obtiene estadísticas para el dashboard"""
+    # Consultas de solo lectura: pueden ir a la réplica
+    session = read_session()
     
     # Contadores básicos
     try:
-        celulares_count = Celular.query.count()
-        accesorios_count = Accesorio.query.count()
+        celulares_count = session.query(Celular).count()
+        accesorios_count = session.query(Accesorio).count()
     except Exception as e:
         # Solución temporal si hay problemas con la base de datos
         celulares_count = 0
@@ -17,7 +20,7 @@ def get_dashboard_stats():
     # Ventas de hoy
     today = date.today()
     try:
-        ventas_hoy = Venta.query.filter(
+        ventas_hoy = session.query(Venta).filter(
             Venta.fecha_venta >= today,
             Venta.estado == 'completada'
         ).count()
@@ -27,7 +30,7 @@ def get_dashboard_stats():
     
     # Total de ventas de hoy
     try:
-        total_ventas_hoy = db.session.query(func.sum(Venta.total)).filter(
+        total_ventas_hoy = session.query(func.sum(Venta.total)).filter(
             Venta.fecha_venta >= today,
             Venta.estado == 'completada'
         ).scalar() or 0
@@ -37,15 +40,15 @@ def get_dashboard_stats():
     
     # Productos con bajo stock
     try:
-        celulares_bajo_stock = Celular.query.filter(Celular.stock < 5).all()
-        accesorios_bajo_stock = Accesorio.query.filter(Accesorio.stock < 10).all()
+        celulares_bajo_stock = session.query(Celular).filter(Celular.stock < 5).all()
+        accesorios_bajo_stock = session.query(Accesorio).filter(Accesorio.stock < 10).all()
     except Exception as e:
         celulares_bajo_stock = []
         accesorios_bajo_stock = []
     
     # Servicios pendientes
     try:
-        servicios_pendientes = Servicio.query.filter_by(estado='pendiente').all()
+        servicios_pendientes = session.query(Servicio).filter_by(estado='pendiente').all()
     except Exception as e:
         servicios_pendientes = []
     
@@ -72,7 +75,7 @@ def get_monthly_sales():
     first_day = today.replace(day=1)
     
     try:
-        ventas_mes = db.session.query(func.sum(Venta.total)).filter(
+        ventas_mes = read_session().query(func.sum(Venta.total)).filter(
             Venta.fecha_venta >= first_day,
             Venta.estado == 'completada'
         ).scalar() or 0
@@ -91,8 +94,9 @@ def get_top_selling_products(limit=5):
 def get_low_stock_alert():
     """Obtiene alertas de stock bajo"""
     alerts = []
+    session = read_session()
     
-    celulares_bajo_stock = Celular.query.filter(Celular.stock < 5).all()
+    celulares_bajo_stock = session.query(Celular).filter(Celular.stock < 5).all()
     for celular in celulares_bajo_stock:
         alerts.append({
             'tipo': 'celular',
@@ -101,7 +105,7 @@ def get_low_stock_alert():
             'nivel': 'critico' if celular.stock < 2 else 'bajo'
         })
     
-    accesorios_bajo_stock = Accesorio.query.filter(Accesorio.stock < 10).all()
+    accesorios_bajo_stock = session.query(Accesorio).filter(Accesorio.stock < 10).all()
     for accesorio in accesorios_bajo_stock:
         alerts.append({
             'tipo': 'accesorio',
@@ -0,0 +1,214 @@
+# app/utils/database.py
+"""Utilidades de conexión a la base de datos (engines, pools, procesos)"""
+import sqlite3
+import time
+from flask import current_app, g
+from sqlalchemy import event, inspect, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+from app.models import db
+
+# Bind de Flask-SQLAlchemy usado para la réplica de lectura
+REPLICA_BIND = 'replica'
+
+# Tabla que `refresh_sqlite_replica` escribe en la copia con la hora del refresco
+REPLICA_MARKER_TABLE = 'replica_estado'
+
+# Retraso de una réplica de PostgreSQL: 0 si está al día o no es una réplica
+PG_REPLICA_LAG_SQL = """
+SELECT CASE
+    WHEN NOT pg_is_in_recovery() THEN 0
+    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+END
+"""
+
+# Resultado de la última comprobación de retraso por engine: (instante, al_día)
+_replica_status = {}
+
+def engine_options(config):
+    """Opciones de create_engine para el perfil configurado.
+    
+    En SQLite el pool lo elige SQLAlchemy; en servidores (PostgreSQL) se fijan
+    tamaño, overflow, timeout, reciclaje y pre-ping del pool.
+    """
+    if config.get('DB_ENGINE_PROFILE') != 'tuned':
+        return {}
+    url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+    if url.get_backend_name() == 'sqlite':
+        return {}
+    return {
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': True,
+    }
+
+def sqlite_pragmas_listener(pragmas):
+    """Crea un listener de 'connect' que aplica los pragmas a cada conexión nueva"""
+    statements = [f"PRAGMA {name}={value}" for name, value in pragmas.items()]
+    
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for statement in statements:
+            cursor.execute(statement)
+        cursor.close()
+    
+    return set_pragmas
+
+def configure_engines(app):
+    """Registra los pragmas de SQLite en todos los engines de la app"""
+    if app.config.get('DB_ENGINE_PROFILE') != 'tuned':
+        return
+    listener = sqlite_pragmas_listener(app.config['SQLITE_PRAGMAS'])
+    with app.app_context():
+        for engine in db.engines.values():
+            if engine.dialect.name == 'sqlite':
+                event.listen(engine, 'connect', listener)
+
+def dispose_engines(app):
+    """Descarta las conexiones del pool heredadas de un proceso padre.
+    
+    Con `preload_app` gunicorn construye la app en el master y luego hace
+    fork: los workers no deben reutilizar los sockets/archivos abiertos por
+    el master. `close=False` deja intactas las conexiones del padre y solo
+    hace que el hijo empiece con un pool vacío.
+    """
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+
+def register_replica_bind(config):
+    """Agrega la réplica de REPLICA_DATABASE_URL a SQLALCHEMY_BINDS"""
+    url = config.get('REPLICA_DATABASE_URL')
+    if url:
+        config['SQLALCHEMY_BINDS'] = {**config.get('SQLALCHEMY_BINDS', {}), REPLICA_BIND: url}
+
+def init_read_routing(app):
+    """Cierra al final de cada contexto la sesión de lectura abierta por read_session()"""
+    
+    @app.teardown_appcontext
+    def close_read_session(exception=None):
+        session = g.pop('read_session', None)
+        if session is not None:
+            session.close()
+
+def replica_lag(engine):
+    """Segundos de retraso de la réplica, o None si no se puede determinar"""
+    try:
+        with engine.connect() as conn:
+            if engine.dialect.name == 'postgresql':
+                lag = conn.execute(text(PG_REPLICA_LAG_SQL)).scalar()
+                return None if lag is None else float(lag)
+            refreshed = conn.execute(text(
+                f"SELECT actualizado FROM {REPLICA_MARKER_TABLE} WHERE id = 1"
+            )).scalar()
+            return None if refreshed is None else time.time() - refreshed
+    except SQLAlchemyError:
+        return None
+
+def replica_engine():
+    """Engine de la réplica si existe y está al día; None para usar la principal"""
+    engine = db.engines.get(REPLICA_BIND)
+    if engine is None:
+        return None
+    
+    now = time.monotonic()
+    checked_at, fresh = _replica_status.get(engine, (None, False))
+    if checked_at is None or now - checked_at >= current_app.config['REPLICA_LAG_CHECK_INTERVAL']:
+        lag = replica_lag(engine)
+        fresh = lag is not None and lag <= current_app.config['REPLICA_MAX_LAG_SECONDS']
+        if not fresh:
+            current_app.logger.warning('Réplica atrasada o no disponible (retraso: %s s); '
+                                       'usando la base principal', lag)
+        _replica_status[engine] = (now, fresh)
+    return engine if fresh else None
+
+def read_session():
+    """Sesión para consultas de solo lectura (reportes).
+    
+    Usa la réplica cuando está configurada y al día; si no, devuelve
+    db.session. No se debe usar para escribir.
+    """
+    engine = replica_engine()
+    if engine is None:
+        return db.session
+    if 'read_session' not in g:
+        g.read_session = Session(bind=engine)
+    return g.read_session
+
+def previous_value(obj, attr):
+    """Valor de un atributo antes de los cambios pendientes del objeto (None si
+    el objeto es nuevo). Para listeners de flush; ver keep_previous_values."""
+    history = inspect(obj).attrs[attr].history
+    if history.deleted:
+        return history.deleted[0]
+    return getattr(obj, attr) if not history.added else None
+
+def _keep_previous_value(target, value, oldvalue, initiator):
+    """Sin efecto: con active_history=True SQLAlchemy carga el valor anterior
+    al asignar, aunque el objeto esté expirado, y queda en el historial"""
+    return value
+
+def keep_previous_values(*attributes):
+    """Conserva en el historial el valor anterior de estos atributos aunque el
+    objeto esté expirado (idempotente)"""
+    for attr in attributes:
+        if not event.contains(attr, 'set', _keep_previous_value):
+            event.listen(attr, 'set', _keep_previous_value, active_history=True, retval=True)
+
+def refresh_sqlite_replica(app):
+    """Copia la base SQLite principal sobre la réplica con la API de backup de SQLite"""
+    with app.app_context():
+        engines = db.engines
+        if REPLICA_BIND not in engines:
+            raise RuntimeError('REPLICA_DATABASE_URL no está configurada')
+        if engines[None].dialect.name != 'sqlite' or engines[REPLICA_BIND].dialect.name != 'sqlite':
+            raise RuntimeError('El refresco de réplica solo aplica a copias SQLite')
+        primary = engines[None].url.database
+        replica = engines[REPLICA_BIND].url.database
+    
+    started = time.time()
+    source = sqlite3.connect(primary)
+    target = sqlite3.connect(replica)
+    try:
+        source.backup(target)
+        target.execute(f"CREATE TABLE IF NOT EXISTS {REPLICA_MARKER_TABLE} "
+                       "(id INTEGER PRIMARY KEY, actualizado REAL NOT NULL)")
+        target.execute(f"INSERT OR REPLACE INTO {REPLICA_MARKER_TABLE} (id, actualizado) VALUES (1, ?)",
+                       (started,))
+        target.commit()
+    finally:
+        target.close()
+        source.close()
+
+def gevent_wait_callback(conn, timeout=None):
+    """Callback de espera de psycopg2 que cede el control al hub de gevent.
+    
+    Sin él, psycopg2 bloquea el proceso completo mientras espera al servidor
+    y todas las peticiones (greenlets) del worker quedan detenidas.
+    """
+    from gevent.socket import wait_read, wait_write
+    from psycopg2 import OperationalError, extensions
+    
+    while True:
+        state = conn.poll()
+        if state == extensions.POLL_OK:
+            break
+        elif state == extensions.POLL_READ:
+            wait_read(conn.fileno(), timeout=timeout)
+        elif state == extensions.POLL_WRITE:
+            wait_write(conn.fileno(), timeout=timeout)
+        else:
+            raise OperationalError(f"Resultado inesperado de poll: {state!r}")
+
+def make_psycopg2_green():
+    """Instala gevent_wait_callback en psycopg2. Devuelve False si no está instalado."""
+    try:
+        from psycopg2 import extensions
+    except ImportError:
+        return False
+    extensions.set_wait_callback(gevent_wait_callback)
+    return True
@@ -0,0 +1,83 @@
+# app/utils/pagination.py
+"""Paginación por cursor (keyset): cada página continúa después de la última
+fila de la anterior, sin OFFSET ni COUNT(*)"""
+from datetime import datetime
+from sqlalchemy import tuple_
+
+CURSOR_TIME_FORMAT = '%Y%m%d%H%M%S%f'
+
+class KeysetPage:
+    """Una página de resultados; `next_cursor` es None en la última.
+    `fragments` ({id: texto}) acompaña a los resultados de una búsqueda."""
+    
+    def __init__(self, items, next_cursor, cursor=None, fragments=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.cursor = cursor
+        self.fragments = fragments or {}
+    
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+    
+    @property
+    def is_first(self):
+        return self.cursor is None
+
+def encode_cursor(fecha, row_id):
+    return f"{fecha.strftime(CURSOR_TIME_FORMAT)}.{row_id}"
+
+def decode_cursor(cursor):
+    """(fecha, id) de un cursor; ValueError si no es válido"""
+    fecha, _, row_id = cursor.partition('.')
+    return datetime.strptime(fecha, CURSOR_TIME_FORMAT), int(row_id)
+
+def keyset_paginate(query, date_column, id_column, cursor=None, per_page=20):
+    """Página de `query` en orden descendente por (date_column, id_column),
+    empezando después del cursor. Lee per_page + 1 filas para saber si hay más."""
+    if cursor:
+        query = query.filter(tuple_(date_column, id_column) < decode_cursor(cursor))
+    rows = query.order_by(date_column.desc(), id_column.desc()).limit(per_page + 1).all()
+    items = rows[:per_page]
+    next_cursor = None
+    if len(rows) > per_page:
+        last = items[-1]
+        next_cursor = encode_cursor(getattr(last, date_column.key), getattr(last, id_column.key))
+    return KeysetPage(items, next_cursor, cursor)
+
+def encode_key_cursor(key, row_id):
+    return f"{row_id}.{key}"
+
+def decode_key_cursor(cursor):
+    """(clave, id) de un cursor de keyset_paginate_by_key; ValueError si no es válido"""
+    row_id, separator, key = cursor.partition('.')
+    if not separator:
+        raise ValueError(f"Cursor inválido: {cursor!r}")
+    return key, int(row_id)
+
+def keyset_paginate_by_key(query, key, id_column, cursor=None, per_page=20):
+    """Página de `query` en orden ascendente por (key, id_column), donde `key`
+    es una expresión de texto (por ejemplo lower(nombre)). La clave de la
+    última fila se lee de la base de datos, así el cursor usa la misma
+    comparación que el índice."""
+    if cursor:
+        query = query.filter(tuple_(key, id_column) > decode_key_cursor(cursor))
+    rows = query.add_columns(key).order_by(key, id_column).limit(per_page + 1).all()
+    items = [row[0] for row in rows[:per_page]]
+    next_cursor = None
+    if len(rows) > per_page:
+        last, last_key = rows[per_page - 1]
+        next_cursor = encode_key_cursor(last_key, getattr(last, id_column.key))
+    return KeysetPage(items, next_cursor, cursor)
+
+def encode_rank_cursor(rank, fecha, row_id):
+    """Cursor de un resultado ordenado por relevancia: (puntaje, fecha, id).
+    repr() conserva el puntaje exacto para compararlo en la página siguiente."""
+    return f"{rank!r}~{encode_cursor(fecha, row_id)}"
+
+def decode_rank_cursor(cursor):
+    """(puntaje, fecha, id) de un cursor de encode_rank_cursor; ValueError si no es válido"""
+    rank, separator, rest = cursor.partition('~')
+    if not separator:
+        raise ValueError(f"Cursor inválido: {cursor!r}")
+    return (float(rank),) + decode_cursor(rest)
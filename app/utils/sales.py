@@ -1,12 +1,25 @@
 from app.models import db, Venta, DetalleVenta, Celular, Accesorio, ServicioTV
+from app.utils.archive import sale_models
+from app.utils.client_stats import BRANDED_PRODUCTS, record_client_sale, revert_client_sale
+from app.utils.clients import find_client_by_phone
+from app.utils.database import read_session
+from collections import Counter
 from datetime import datetime
+from sqlalchemy import func
 
 def process_sale(form_data, vendedor_id):
     """Procesa una nueva venta"""
     try:
+        # Cliente registrado: el elegido o, si no, el que tiene ese teléfono
+        cliente_id = form_data.get('cliente_id', type=int)
+        if not cliente_id:
+            cliente = find_client_by_phone(form_data.get('cliente_telefono'))
+            cliente_id = cliente.id if cliente else None
+        
         # Crear venta principal
         venta = Venta(
             vendedor_id=vendedor_id,
+            cliente_id=cliente_id,
             cliente_nombre=form_data['cliente_nombre'],
             cliente_telefono=form_data['cliente_telefono'],
             metodo_pago=form_data['metodo_pago']
@@ -24,6 +37,7 @@ def process_sale(form_data, vendedor_id):
         
         total = 0
         detalles_procesados = []
+        marcas = Counter()  # Unidades por marca, para el resumen del cliente
         
         for producto_id, tipo, cantidad in zip(productos, tipos, cantidades):
             if not producto_id or not cantidad:
@@ -59,6 +73,8 @@ def process_sale(form_data, vendedor_id):
             # Actualizar stock para productos físicos
             if tipo in ['celular', 'accesorio']:
                 producto.stock -= cantidad
+            if tipo in BRANDED_PRODUCTS and producto.marca_id:
+                marcas[producto.marca_id] += cantidad
             
             total += precio_unitario * cantidad
             detalles_procesados.append({
@@ -70,8 +86,9 @@ def process_sale(form_data, vendedor_id):
         if not detalles_procesados:
             return {'success': False, 'message': 'Debe agregar productos válidos a la venta'}
         
-        # Actualizar total de la venta
+        # Actualizar total de la venta y el resumen de compras del cliente
         venta.total = total
+        record_client_sale(venta, marcas)
         db.session.commit()
         
         return {
@@ -141,6 +158,7 @@ def cancel_sale(venta_id):
                         producto.stock += detalle.cantidad
             
             venta.estado = 'cancelada'
+            revert_client_sale(venta)
             # El campo fecha_cancelacion no existe en el modelo, no lo usamos
             db.session.commit()
             
@@ -153,27 +171,30 @@ def cancel_sale(venta_id):
         return {'success': False, 'message': f'Error al cancelar venta: {str(e)}'}
 
 def get_sales_summary(start_date=None, end_date=None):
-    """Obtiene resumen de ventas en un período"""
-    query = Venta.query.filter_by(estado='completada')
-    
-    if start_date:
-        query = query.filter(Venta.fecha_venta >= start_date)
-    if end_date:
-        query = query.filter(Venta.fecha_venta <= end_date)
-    
-    ventas = query.all()
+    """Obtiene resumen de ventas en un período.
     
-    total_ventas = len(ventas)
-    total_ingresos = sum(venta.total for venta in ventas)
-    
-    # Agrupar por método de pago
+    Agrega en la base de datos por método de pago; las ventas archivadas se
+    incluyen solo si el período llega hasta ellas.
+    """
+    session = read_session()
     metodos_pago = {}
-    for venta in ventas:
-        metodo = venta.metodo_pago
-        if metodo not in metodos_pago:
-            metodos_pago[metodo] = {'count': 0, 'total': 0}
-        metodos_pago[metodo]['count'] += 1
-        metodos_pago[metodo]['total'] += venta.total
+    for model in sale_models(start_date, session):
+        query = session.query(model.metodo_pago, func.count(model.id), func.sum(model.total)) \
+            .filter(model.estado == 'completada')
+        if start_date:
+            query = query.filter(model.fecha_venta >= start_date)
+        if end_date:
+            query = query.filter(model.fecha_venta <= end_date)
+        
+        # Agrupar por método de pago
+        for metodo, count, total in query.group_by(model.metodo_pago):
+            if metodo not in metodos_pago:
+                metodos_pago[metodo] = {'count': 0, 'total': 0}
+            metodos_pago[metodo]['count'] += count
+            metodos_pago[metodo]['total'] += total or 0
+    
+    total_ventas = sum(m['count'] for m in metodos_pago.values())
+    total_ingresos = sum(m['total'] for m in metodos_pago.values())
     
     return {
         'total_ventas': total_ventas,
@@ -184,4 +205,4 @@ def get_sales_summary(start_date=None, end_date=None):
             'inicio': start_date,
             'fin': end_date
         }
-    }
\ No newline at end of file
+    }
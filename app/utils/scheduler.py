@@ -0,0 +1,153 @@
+# app/utils/scheduler.py
+"""Cola de trabajo de los técnicos: prioridad de servicios pendientes y asignación por carga"""
+import heapq
+from sqlalchemy import case, event, func, inspect, nulls_last, select, update
+from sqlalchemy.orm import Session
+from app.models import db, Servicio, Usuario, CargaTecnico
+from app.utils.database import keep_previous_values, previous_value
+
+# Estados que cuentan como carga de un técnico
+OPEN_STATES = ('pendiente', 'en_progreso')
+
+# Orden entre tipos con la misma fecha de entrega y antigüedad (menor = antes)
+SERVICE_TYPE_PRIORITY = {'reparación': 0, 'reparacion': 0, 'mantenimiento': 1, 'instalación': 2, 'instalacion': 2}
+
+def priority_order():
+    """ORDER BY de la cola: fecha de entrega estimada (sin fecha al final),
+    antigüedad y tipo de servicio"""
+    type_rank = case(SERVICE_TYPE_PRIORITY, value=func.lower(Servicio.tipo), else_=len(SERVICE_TYPE_PRIORITY))
+    return (nulls_last(Servicio.fecha_entrega_estimada.asc()), Servicio.fecha_recepcion.asc(),
+            type_rank, Servicio.id)
+
+def pending_queue(tecnico_id=None):
+    """Servicios pendientes en orden de prioridad: los de un técnico o, sin
+    técnico, los que aún no tienen asignado"""
+    query = Servicio.query.filter(Servicio.estado == 'pendiente')
+    if tecnico_id is None:
+        query = query.filter(Servicio.tecnico_id.is_(None))
+    else:
+        query = query.filter(Servicio.tecnico_id == tecnico_id)
+    return query.order_by(*priority_order())
+
+def technician_loads():
+    """{tecnico_id: servicios abiertos} de todos los técnicos (0 si no tiene contador)"""
+    rows = db.session.query(Usuario.id, func.coalesce(CargaTecnico.abiertos, 0)) \
+        .outerjoin(CargaTecnico, CargaTecnico.tecnico_id == Usuario.id) \
+        .filter(Usuario.rol == 'tecnico').all()
+    return dict(rows)
+
+def suggest_technician():
+    """Técnico con menos servicios abiertos (None si no hay técnicos)"""
+    loads = technician_loads()
+    if not loads:
+        return None
+    return min(loads, key=lambda tecnico_id: (loads[tecnico_id], tecnico_id))
+
+def assign_pending(limit=None):
+    """Asigna los servicios pendientes sin técnico, en orden de prioridad, al
+    técnico menos cargado en cada momento. Devuelve [(servicio, tecnico_id)]."""
+    heap = [(load, tecnico_id) for tecnico_id, load in technician_loads().items()]
+    if not heap:
+        return []
+    heapq.heapify(heap)
+    query = pending_queue()
+    if limit:
+        query = query.limit(limit)
+    assigned = []
+    for servicio in query.all():
+        load, tecnico_id = heapq.heappop(heap)
+        servicio.tecnico_id = tecnico_id
+        assigned.append((servicio, tecnico_id))
+        heapq.heappush(heap, (load + 1, tecnico_id))
+    db.session.commit()
+    return assigned
+
+def next_job(tecnico_id):
+    """Siguiente trabajo de un técnico: su pendiente más prioritario o, si no
+    tiene, el primero de la cola sin asignar. Devuelve (servicio, asignado)."""
+    servicio = pending_queue(tecnico_id).first()
+    if servicio is not None:
+        return servicio, True
+    return pending_queue().first(), False
+
+def claim_job(servicio_id, tecnico_id):
+    """Asigna un servicio sin técnico. Devuelve False si otro lo tomó antes."""
+    result = db.session.execute(
+        update(Servicio)
+        .where(Servicio.id == servicio_id, Servicio.tecnico_id.is_(None), Servicio.estado == 'pendiente')
+        .values(tecnico_id=tecnico_id)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount:
+        _apply_load_deltas(db.session.connection(), {tecnico_id: 1})
+    db.session.commit()
+    return bool(result.rowcount)
+
+def _open_assignment(servicio):
+    """(tecnico_id, abierto) antes del flush a partir del historial de atributos"""
+    return previous_value(servicio, 'tecnico_id'), previous_value(servicio, 'estado') in OPEN_STATES
+
+def _collect_load_deltas(session):
+    deltas = {}
+    
+    def add(tecnico_id, delta):
+        if tecnico_id is not None:
+            deltas[tecnico_id] = deltas.get(tecnico_id, 0) + delta
+    
+    for servicio in session.new:
+        if isinstance(servicio, Servicio) and servicio.estado in OPEN_STATES:
+            add(servicio.tecnico_id, 1)
+    for servicio in session.dirty:
+        if not isinstance(servicio, Servicio):
+            continue
+        state = inspect(servicio)
+        if not (state.attrs.tecnico_id.history.has_changes() or state.attrs.estado.history.has_changes()):
+            continue
+        old_tecnico, was_open = _open_assignment(servicio)
+        if was_open:
+            add(old_tecnico, -1)
+        if servicio.estado in OPEN_STATES:
+            add(servicio.tecnico_id, 1)
+    for servicio in session.deleted:
+        if isinstance(servicio, Servicio):
+            old_tecnico, was_open = _open_assignment(servicio)
+            if was_open:
+                add(old_tecnico, -1)
+    return {tecnico_id: delta for tecnico_id, delta in deltas.items() if delta}
+
+def _apply_load_deltas(conn, deltas):
+    """Suma los cambios a carga_tecnico con UPDATE atómicos; si falta la fila
+    de un técnico se crea contando sus servicios abiertos"""
+    table = CargaTecnico.__table__
+    for tecnico_id, delta in deltas.items():
+        result = conn.execute(update(table).where(table.c.tecnico_id == tecnico_id)
+                              .values(abiertos=table.c.abiertos + delta))
+        if not result.rowcount:
+            count = conn.execute(select(func.count()).select_from(Servicio.__table__).where(
+                Servicio.__table__.c.tecnico_id == tecnico_id,
+                Servicio.__table__.c.estado.in_(OPEN_STATES))).scalar()
+            conn.execute(table.insert().values(tecnico_id=tecnico_id, abiertos=count))
+
+def _track_workload(session, flush_context):
+    # after_flush: las filas ya están escritas pero el historial sigue disponible
+    deltas = _collect_load_deltas(session)
+    if deltas:
+        _apply_load_deltas(session.connection(), deltas)
+
+def init_workload_tracking():
+    """Mantiene carga_tecnico al guardar servicios (idempotente)"""
+    if not event.contains(Session, 'after_flush', _track_workload):
+        event.listen(Session, 'after_flush', _track_workload)
+        keep_previous_values(Servicio.estado, Servicio.tecnico_id)
+
+def rebuild_technician_loads():
+    """Recalcula carga_tecnico desde cero con una consulta agrupada"""
+    table = CargaTecnico.__table__
+    counts = db.session.query(Servicio.tecnico_id, func.count(Servicio.id)) \
+        .filter(Servicio.tecnico_id.isnot(None), Servicio.estado.in_(OPEN_STATES)) \
+        .group_by(Servicio.tecnico_id).all()
+    db.session.execute(table.delete())
+    if counts:
+        db.session.execute(table.insert(), [{'tecnico_id': t, 'abiertos': n} for t, n in counts])
+    db.session.commit()
+    return dict(counts)
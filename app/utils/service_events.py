@@ -0,0 +1,118 @@
+# app/utils/service_events.py
+"""Historial de servicios técnicos: cambios de estado, notas, diagnósticos y
+cancelaciones como filas de servicio_evento en lugar de texto concatenado"""
+import re
+from datetime import datetime
+from flask import has_request_context
+from flask_login import current_user
+from sqlalchemy import select, update
+from sqlalchemy.orm import joinedload
+from app.models import db, Servicio, ServicioEvento
+from app.utils.backfill import Backfill, register_backfill
+from app.utils.pagination import keyset_paginate
+from app.utils.service_stats import update_finish_date
+
+EVENT_TYPES = ('creacion', 'estado', 'nota', 'diagnostico', 'cancelacion')
+
+# Estados de un servicio técnico (los abiertos están en scheduler.OPEN_STATES)
+SERVICE_STATES = ('pendiente', 'en_progreso', 'completado', 'entregado', 'cancelado')
+
+# Nombres anteriores que pueden llegar de formularios viejos o de datos sin migrar
+LEGACY_STATES = {'en_proceso': 'en_progreso'}
+
+def normalize_state(estado):
+    """Nombre actual del estado. ValueError si no es un estado de servicio."""
+    estado = LEGACY_STATES.get(estado, estado)
+    if estado not in SERVICE_STATES:
+        raise ValueError(f'Estado de servicio inválido: {estado}')
+    return estado
+
+def _current_user_id():
+    if has_request_context() and current_user.is_authenticated:
+        return current_user.id
+    return None
+
+def record_event(servicio, tipo, texto=None, estado_anterior=None, estado_nuevo=None):
+    """Agrega un evento al historial del servicio (se guarda con el próximo commit)"""
+    evento = ServicioEvento(servicio=servicio, tipo=tipo, texto=texto or None, fecha=datetime.utcnow(),
+                            estado_anterior=estado_anterior, estado_nuevo=estado_nuevo,
+                            usuario_id=_current_user_id())
+    db.session.add(evento)
+    return evento
+
+def change_state(servicio, estado, texto=None, tipo='estado'):
+    """Cambia el estado registrando el evento y la fecha de finalización.
+    Sin cambio de estado no hace nada; ValueError si el estado no existe."""
+    if not estado:
+        return None
+    estado = normalize_state(estado)
+    if estado == servicio.estado:
+        return None
+    evento = record_event(servicio, tipo, texto, estado_anterior=servicio.estado, estado_nuevo=estado)
+    servicio.estado = estado
+    update_finish_date(servicio)
+    return evento
+
+def event_json(evento):
+    return {
+        'id': evento.id,
+        'fecha': evento.fecha.isoformat(),
+        'tipo': evento.tipo,
+        'usuario': evento.usuario.nombre if evento.usuario else None,
+        'estado_anterior': evento.estado_anterior,
+        'estado_nuevo': evento.estado_nuevo,
+        'texto': evento.texto,
+    }
+
+def timeline(servicio_id, cursor=None, per_page=20):
+    """Página del historial, del evento más reciente al más antiguo.
+    ValueError si el cursor no es válido."""
+    query = ServicioEvento.query.options(joinedload(ServicioEvento.usuario)) \
+        .filter(ServicioEvento.servicio_id == servicio_id)
+    return keyset_paginate(query, ServicioEvento.fecha, ServicioEvento.id, cursor=cursor, per_page=per_page)
+
+# Línea que cancelar_servicio agregaba a notas_tecnicas antes del historial
+CANCEL_NOTE_RE = re.compile(
+    r'^\[CANCELADO\] (\d{4}-\d{2}-\d{2} \d{2}:\d{2}) - Servicio cancelado(?: - Motivo: (.*))?$')
+
+def split_legacy_notes(notas):
+    """Separa el texto de notas_tecnicas en (notas libres, [(fecha, motivo)] de cancelaciones)"""
+    free, cancellations = [], []
+    for line in notas.splitlines():
+        match = CANCEL_NOTE_RE.match(line.strip())
+        if match:
+            cancellations.append((datetime.strptime(match.group(1), '%Y-%m-%d %H:%M'), match.group(2)))
+        else:
+            free.append(line)
+    return '\n'.join(free).strip(), cancellations
+
+@register_backfill
+class ServiceNotesBackfill(Backfill):
+    """Mueve notas_tecnicas al historial: el texto libre como una nota con la
+    fecha de recepción y cada línea [CANCELADO] como una cancelación con su
+    fecha y motivo. Luego deja notas_tecnicas en NULL."""
+    name = 'servicio-notas-eventos'
+    description = 'Mover las notas técnicas de cada servicio a servicio_evento'
+    table = Servicio.__table__
+    
+    def where(self):
+        return self.table.c.notas_tecnicas.isnot(None)
+    
+    def process(self, conn, ids):
+        servicio = self.table
+        rows = conn.execute(select(servicio.c.id, servicio.c.notas_tecnicas, servicio.c.fecha_recepcion)
+                            .where(servicio.c.id.in_(ids))).all()
+        eventos = []
+        for servicio_id, notas, recepcion in rows:
+            free, cancellations = split_legacy_notes(notas)
+            if free:
+                eventos.append({'servicio_id': servicio_id, 'fecha': recepcion or datetime.utcnow(),
+                                'tipo': 'nota', 'texto': free})
+            for fecha, motivo in cancellations:
+                eventos.append({'servicio_id': servicio_id, 'fecha': fecha, 'tipo': 'cancelacion',
+                                'estado_nuevo': 'cancelado', 'texto': motivo})
+        if eventos:
+            conn.execute(ServicioEvento.__table__.insert(),
+                         [{'estado_nuevo': None, **evento} for evento in eventos])
+        conn.execute(update(servicio).where(servicio.c.id.in_(ids)).values(notas_tecnicas=None))
+        return len(rows)
@@ -0,0 +1,219 @@
+# app/utils/service_search.py
+"""Búsqueda de texto completo en servicios técnicos: FTS5 en SQLite y un
+índice GIN sobre tsvector en PostgreSQL, actualizados al guardar"""
+import re
+from sqlalchemy import DateTime, bindparam, event, inspect, text
+from sqlalchemy.orm import Session
+from app.models import db, Servicio, ServicioEvento
+from app.utils.pagination import decode_rank_cursor, encode_rank_cursor
+
+# Tabla del índice: virtual FTS5 en SQLite, tabla con tsvector en PostgreSQL
+SEARCH_TABLE = 'servicio_busqueda'
+
+# Columnas de servicio que entran en el índice (las notas salen además del historial)
+INDEXED_ATTRIBUTES = ('descripcion', 'notas_tecnicas', 'cliente_nombre', 'cliente_telefono')
+
+# Configuración de texto de PostgreSQL (raíces y palabras vacías en español)
+PG_TEXT_CONFIG = 'spanish'
+
+# Peso de cada columna en el ranking: descripción, notas, nombre, teléfono
+SQLITE_WEIGHTS = (4.0, 2.0, 1.0, 1.0)
+
+SQLITE_CREATE = f"""
+CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5(
+    descripcion, notas, cliente_nombre, cliente_telefono,
+    tokenize = 'unicode61 remove_diacritics 2'
+)
+"""
+
+PG_CREATE = [
+    f"CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} ("
+    "servicio_id INTEGER PRIMARY KEY REFERENCES servicio(id) ON DELETE CASCADE, "
+    "documento TSVECTOR NOT NULL)",
+    f"CREATE INDEX IF NOT EXISTS ix_{SEARCH_TABLE}_documento ON {SEARCH_TABLE} USING GIN (documento)",
+]
+
+# Texto de notas de un servicio: notas_tecnicas antiguas más los eventos con texto
+SQLITE_NOTES = """trim(coalesce(s.notas_tecnicas, '') || ' ' || coalesce(
+    (SELECT group_concat(e.texto, ' ') FROM servicio_evento e
+     WHERE e.servicio_id = s.id AND e.texto IS NOT NULL), ''))"""
+PG_NOTES = """trim(coalesce(s.notas_tecnicas, '') || ' ' || coalesce(
+    (SELECT string_agg(e.texto, ' ') FROM servicio_evento e
+     WHERE e.servicio_id = s.id AND e.texto IS NOT NULL), ''))"""
+
+SQLITE_REINDEX = [
+    f"DELETE FROM {SEARCH_TABLE} WHERE rowid IN :ids",
+    f"""INSERT INTO {SEARCH_TABLE} (rowid, descripcion, notas, cliente_nombre, cliente_telefono)
+    SELECT s.id, s.descripcion, {SQLITE_NOTES}, s.cliente_nombre, s.cliente_telefono
+    FROM servicio s WHERE s.id IN :ids""",
+]
+PG_REINDEX = [
+    f"DELETE FROM {SEARCH_TABLE} WHERE servicio_id IN :ids",
+    f"""INSERT INTO {SEARCH_TABLE} (servicio_id, documento)
+    SELECT s.id,
+        setweight(to_tsvector('{PG_TEXT_CONFIG}', coalesce(s.descripcion, '')), 'A') ||
+        setweight(to_tsvector('{PG_TEXT_CONFIG}', {PG_NOTES}), 'B') ||
+        setweight(to_tsvector('simple', coalesce(s.cliente_nombre, '') || ' ' ||
+                                        coalesce(s.cliente_telefono, '')), 'C')
+    FROM servicio s WHERE s.id IN :ids""",
+]
+
+# Términos de búsqueda: palabras y números (sin operadores de FTS5 ni tsquery)
+TERM_RE = re.compile(r'\w+', re.UNICODE)
+
+def _dialect(bind):
+    return bind.dialect.name
+
+def create_search_index(conn):
+    """Crea el índice de búsqueda si no existe (SQLite o PostgreSQL)"""
+    if _dialect(conn) == 'sqlite':
+        conn.execute(text(SQLITE_CREATE))
+    elif _dialect(conn) == 'postgresql':
+        for statement in PG_CREATE:
+            conn.execute(text(statement))
+
+def reindex_services(conn, ids):
+    """Vuelve a indexar los servicios `ids` (los que ya no existen se quitan)"""
+    statements = {'sqlite': SQLITE_REINDEX, 'postgresql': PG_REINDEX}.get(_dialect(conn))
+    ids = sorted(set(ids))
+    if not statements or not ids:
+        return
+    for statement in statements:
+        conn.execute(text(statement).bindparams(bindparam('ids', expanding=True)), {'ids': ids})
+
+def rebuild_search_index(batch_size=1000):
+    """Reconstruye el índice completo por lotes de servicios. Devuelve los indexados."""
+    with db.engine.begin() as conn:
+        create_search_index(conn)
+        conn.execute(text(f"DELETE FROM {SEARCH_TABLE}"))
+    total = 0
+    after_id = 0
+    while True:
+        with db.engine.begin() as conn:
+            ids = conn.execute(text("SELECT id FROM servicio WHERE id > :after ORDER BY id LIMIT :limit"),
+                               {'after': after_id, 'limit': batch_size}).scalars().all()
+            if not ids:
+                return total
+            reindex_services(conn, ids)
+        total += len(ids)
+        after_id = ids[-1]
+
+def _changed_services(session):
+    ids = set()
+    for obj in session.new:
+        if isinstance(obj, Servicio):
+            ids.add(obj.id)
+        elif isinstance(obj, ServicioEvento) and obj.texto:
+            ids.add(obj.servicio_id)
+    for obj in session.dirty:
+        if isinstance(obj, Servicio):
+            state = inspect(obj)
+            if any(state.attrs[attr].history.has_changes() for attr in INDEXED_ATTRIBUTES):
+                ids.add(obj.id)
+    for obj in session.deleted:
+        if isinstance(obj, Servicio):
+            ids.add(obj.id)
+    ids.discard(None)
+    return ids
+
+def _track_search_index(session, flush_context):
+    # after_flush, como los contadores de app/utils/scheduler.py
+    ids = _changed_services(session)
+    if ids:
+        reindex_services(session.connection(), ids)
+
+def _create_index_after_table(target, connection, **kw):
+    create_search_index(connection)
+
+def _drop_index_before_table(target, connection, **kw):
+    connection.execute(text(f"DROP TABLE IF EXISTS {SEARCH_TABLE}"))
+
+def init_service_search():
+    """Mantiene el índice al guardar servicios y lo crea/borra junto con la
+    tabla servicio en create_all/drop_all (idempotente)"""
+    if not event.contains(Session, 'after_flush', _track_search_index):
+        event.listen(Session, 'after_flush', _track_search_index)
+        event.listen(Servicio.__table__, 'after_create', _create_index_after_table)
+        event.listen(Servicio.__table__, 'before_drop', _drop_index_before_table)
+
+def search_terms(query):
+    """Palabras de la consulta; cada una se busca como prefijo"""
+    return TERM_RE.findall(query or '')
+
+def _match_expression(terms, dialect):
+    if dialect == 'sqlite':
+        return ' '.join(f'"{term}"*' for term in terms)
+    return ' & '.join(f"{term}:*" for term in terms)
+
+def search_services(query, estados=None, tecnico_id=None, desde=None, hasta=None, cursor=None, per_page=20):
+    """Servicios que contienen todas las palabras de `query`, del más al menos
+    relevante (a igual relevancia, los más recientes primero). `hasta` es
+    exclusivo. La página sigue después de `cursor` (puntaje, fecha e id del
+    último resultado anterior), sin OFFSET. Los puntajes dependen de todo el
+    índice: si cambia entre dos páginas, el orden puede variar. Devuelve
+    ([(servicio, fragmento)], cursor siguiente o None). ValueError si el
+    cursor no es válido."""
+    terms = search_terms(query)
+    dialect = _dialect(db.engine)
+    if not terms or dialect not in ('sqlite', 'postgresql'):
+        return [], None
+    
+    filters, binds = [], []
+    params = {'match': _match_expression(terms, dialect), 'limit': per_page + 1}
+    if estados:
+        filters.append("s.estado IN :estados")
+        binds.append(bindparam('estados', expanding=True))
+        params['estados'] = list(estados)
+    if tecnico_id:
+        filters.append("s.tecnico_id = :tecnico_id")
+        params['tecnico_id'] = tecnico_id
+    if desde:
+        filters.append("s.fecha_recepcion >= :desde")
+        binds.append(bindparam('desde', type_=DateTime))
+        params['desde'] = desde
+    if hasta:
+        filters.append("s.fecha_recepcion < :hasta")
+        binds.append(bindparam('hasta', type_=DateTime))
+        params['hasta'] = hasta
+    where = ''.join(f" AND {condition}" for condition in filters)
+    
+    # Después del cursor: peor puntaje, o el mismo y (fecha, id) anterior.
+    # bm25 es menor cuanto más relevante; ts_rank, mayor (real: se compara
+    # en ese tipo para que el puntaje del cursor sea exactamente el mismo).
+    after = ''
+    if cursor:
+        params['rank'], params['fecha'], params['id'] = decode_rank_cursor(cursor)
+        binds.append(bindparam('fecha', type_=DateTime))
+        rank, worse = (':rank', '>') if dialect == 'sqlite' else ('CAST(:rank AS REAL)', '<')
+        after = (f" AND (r.rank {worse} {rank} OR (r.rank = {rank} AND "
+                 "(r.fecha < :fecha OR (r.fecha = :fecha AND r.id < :id))))")
+    
+    if dialect == 'sqlite':
+        weights = ', '.join(str(w) for w in SQLITE_WEIGHTS)
+        sql = f"""SELECT r.id, r.fragmento, r.rank, r.fecha FROM (
+                SELECT s.id AS id, snippet({SEARCH_TABLE}, -1, '[', ']', '…', 12) AS fragmento,
+                       bm25({SEARCH_TABLE}, {weights}) AS rank, s.fecha_recepcion AS fecha
+                FROM {SEARCH_TABLE} JOIN servicio s ON s.id = {SEARCH_TABLE}.rowid
+                WHERE {SEARCH_TABLE} MATCH :match{where}) r
+            WHERE 1 = 1{after}
+            ORDER BY r.rank, r.fecha DESC, r.id DESC
+            LIMIT :limit"""
+    else:
+        sql = f"""SELECT r.id, ts_headline('{PG_TEXT_CONFIG}', r.descripcion, r.q,
+                                'StartSel=[, StopSel=], MaxWords=12, MinWords=4'), r.rank, r.fecha FROM (
+                SELECT s.id AS id, s.descripcion, q, ts_rank(b.documento, q) AS rank, s.fecha_recepcion AS fecha
+                FROM {SEARCH_TABLE} b JOIN servicio s ON s.id = b.servicio_id,
+                     to_tsquery('{PG_TEXT_CONFIG}', :match) q
+                WHERE b.documento @@ q{where}) r
+            WHERE TRUE{after}
+            ORDER BY r.rank DESC, r.fecha DESC, r.id DESC
+            LIMIT :limit"""
+    rows = db.session.execute(text(sql).bindparams(*binds).columns(fecha=DateTime), params).all()
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        _, _, rank, fecha = rows[-1]
+        next_cursor = encode_rank_cursor(rank, fecha, rows[-1][0])
+    servicios = {s.id: s for s in Servicio.query.filter(Servicio.id.in_([r[0] for r in rows]))}
+    return [(servicios[servicio_id], fragment) for servicio_id, fragment, _, _ in rows
+            if servicio_id in servicios], next_cursor
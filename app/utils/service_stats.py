@@ -0,0 +1,182 @@
+# app/utils/service_stats.py
+"""Tiempos de respuesta de servicios técnicos: histogramas por técnico y por
+tipo que se actualizan al guardar cada Servicio, para que el reporte no
+recorra la tabla de servicios"""
+from bisect import bisect_left
+from collections import Counter
+from datetime import datetime, time
+from sqlalchemy import event, inspect, update
+from sqlalchemy.orm import Session
+from app.models import db, Servicio, TiempoServicio, Usuario
+from app.utils.database import keep_previous_values, previous_value
+
+# Estados en los que el servicio ya está terminado (tiene fecha_finalizacion)
+FINISHED_STATES = ('completado', 'entregado')
+
+# Límites superiores (horas) de los cubos del histograma; el último cubo es
+# abierto (más de 720 h). Los percentiles se interpolan dentro de cada cubo.
+TURNAROUND_BUCKETS = (1, 2, 4, 8, 12, 24, 36, 48, 72, 96, 120, 168, 240, 336, 504, 720)
+
+# Cubo con el número de servicios terminados fuera de plazo
+SLA_BUCKET = -1
+
+# Plazo por tipo de servicio cuando no hay fecha de entrega estimada
+SLA_HOURS = {'reparación': 72, 'reparacion': 72, 'mantenimiento': 48, 'instalación': 24, 'instalacion': 24}
+DEFAULT_SLA_HOURS = 72
+
+# Columnas que cambian la contribución de un servicio a los histogramas
+TRACKED_ATTRIBUTES = ('estado', 'tecnico_id', 'tipo', 'fecha_recepcion',
+                      'fecha_entrega_estimada', 'fecha_finalizacion')
+
+def update_finish_date(servicio, now=None):
+    """Fija fecha_finalizacion al terminar un servicio y la borra si se reabre"""
+    if servicio.estado in FINISHED_STATES:
+        if not servicio.fecha_finalizacion:
+            servicio.fecha_finalizacion = now or datetime.utcnow()
+    elif servicio.estado != 'cancelado':
+        servicio.fecha_finalizacion = None
+
+def sla_breached(tipo, recepcion, entrega_estimada, finalizacion):
+    """True si el servicio terminó después de la fecha de entrega estimada
+    (todo ese día) o, sin ella, después del plazo de su tipo"""
+    if entrega_estimada is not None:
+        if isinstance(entrega_estimada, datetime):
+            entrega_estimada = entrega_estimada.date()
+        return finalizacion > datetime.combine(entrega_estimada, time.max)
+    hours = SLA_HOURS.get((tipo or '').lower(), DEFAULT_SLA_HOURS)
+    return (finalizacion - recepcion).total_seconds() > hours * 3600
+
+def _contribution(values):
+    """Filas (dimension, clave, cubo) que suma un servicio con estos valores"""
+    finalizacion = values['fecha_finalizacion']
+    recepcion = values['fecha_recepcion']
+    if finalizacion is None or recepcion is None or values['estado'] == 'cancelado':
+        return []
+    hours = max((finalizacion - recepcion).total_seconds(), 0) / 3600
+    buckets = [bisect_left(TURNAROUND_BUCKETS, hours)]
+    if sla_breached(values['tipo'], recepcion, values['fecha_entrega_estimada'], finalizacion):
+        buckets.append(SLA_BUCKET)
+    keys = [('total', '')]
+    if values['tecnico_id'] is not None:
+        keys.append(('tecnico', str(values['tecnico_id'])))
+    if values['tipo']:
+        keys.append(('tipo', values['tipo']))
+    return [(dimension, clave, cubo) for dimension, clave in keys for cubo in buckets]
+
+def _current_values(servicio):
+    return {attr: getattr(servicio, attr) for attr in TRACKED_ATTRIBUTES}
+
+def _previous_values(servicio):
+    return {attr: previous_value(servicio, attr) for attr in TRACKED_ATTRIBUTES}
+
+def _collect_stat_deltas(session):
+    deltas = Counter()
+    for servicio in session.new:
+        if isinstance(servicio, Servicio):
+            deltas.update(_contribution(_current_values(servicio)))
+    for servicio in session.dirty:
+        if not isinstance(servicio, Servicio):
+            continue
+        state = inspect(servicio)
+        if any(state.attrs[attr].history.has_changes() for attr in TRACKED_ATTRIBUTES):
+            deltas.subtract(_contribution(_previous_values(servicio)))
+            deltas.update(_contribution(_current_values(servicio)))
+    for servicio in session.deleted:
+        if isinstance(servicio, Servicio):
+            deltas.subtract(_contribution(_previous_values(servicio)))
+    return {key: delta for key, delta in deltas.items() if delta}
+
+def _apply_stat_deltas(conn, deltas):
+    """Suma los cambios a tiempo_servicio con UPDATE atómicos (o INSERT si el cubo no existe)"""
+    table = TiempoServicio.__table__
+    for (dimension, clave, cubo), delta in deltas.items():
+        result = conn.execute(update(table).where(table.c.dimension == dimension, table.c.clave == clave,
+                                                  table.c.cubo == cubo)
+                              .values(cantidad=table.c.cantidad + delta))
+        if not result.rowcount:
+            conn.execute(table.insert().values(dimension=dimension, clave=clave, cubo=cubo, cantidad=delta))
+
+def _track_turnaround(session, flush_context):
+    # after_flush, igual que los contadores de carga de app/utils/scheduler.py
+    deltas = _collect_stat_deltas(session)
+    if deltas:
+        _apply_stat_deltas(session.connection(), deltas)
+
+def init_service_stats():
+    """Mantiene tiempo_servicio al guardar servicios (idempotente)"""
+    if not event.contains(Session, 'after_flush', _track_turnaround):
+        event.listen(Session, 'after_flush', _track_turnaround)
+        keep_previous_values(*(getattr(Servicio, attr) for attr in TRACKED_ATTRIBUTES))
+
+def rebuild_service_stats(batch_size=1000):
+    """Recalcula tiempo_servicio desde cero. Devuelve los servicios terminados contados."""
+    columns = [getattr(Servicio, attr) for attr in TRACKED_ATTRIBUTES]
+    counts = Counter()
+    rows = db.session.query(*columns).filter(Servicio.fecha_finalizacion.isnot(None)) \
+        .execution_options(yield_per=batch_size)
+    for row in rows:
+        counts.update(_contribution(dict(zip(TRACKED_ATTRIBUTES, row))))
+    table = TiempoServicio.__table__
+    db.session.execute(table.delete())
+    if counts:
+        db.session.execute(table.insert(), [{'dimension': d, 'clave': k, 'cubo': c, 'cantidad': n}
+                                            for (d, k, c), n in counts.items() if n])
+    db.session.commit()
+    return sum(n for (dimension, _, cubo), n in counts.items() if dimension == 'total' and cubo != SLA_BUCKET)
+
+def percentile(counts, q):
+    """Percentil q (0-1) en horas a partir de las cantidades por cubo,
+    interpolando dentro del cubo. None si no hay datos."""
+    total = sum(counts)
+    if not total:
+        return None
+    target = q * total
+    seen = 0
+    for index, count in enumerate(counts):
+        if count and seen + count >= target:
+            lower = TURNAROUND_BUCKETS[index - 1] if index else 0
+            if index == len(TURNAROUND_BUCKETS):
+                return float(lower)  # cubo abierto: solo se sabe que supera el último límite
+            return lower + (TURNAROUND_BUCKETS[index] - lower) * (target - seen) / count
+        seen += count
+    return float(TURNAROUND_BUCKETS[-1])
+
+def _summary(counts, breached):
+    total = sum(counts)
+    return {
+        'total': total,
+        'p50': percentile(counts, 0.5),
+        'p90': percentile(counts, 0.9),
+        'p99': percentile(counts, 0.99),
+        'fuera_de_plazo': breached,
+        'tasa_incumplimiento': breached / total if total else 0.0,
+    }
+
+def turnaround_report(session=None):
+    """Percentiles de tiempo de respuesta y tasa de incumplimiento del plazo,
+    en total, por técnico y por tipo. Solo lee tiempo_servicio (una fila por
+    cubo), así que no depende del número de servicios."""
+    session = session or db.session
+    histograms = {}
+    breaches = Counter()
+    for dimension, clave, cubo, cantidad in session.query(
+            TiempoServicio.dimension, TiempoServicio.clave, TiempoServicio.cubo, TiempoServicio.cantidad):
+        if cubo == SLA_BUCKET:
+            breaches[(dimension, clave)] += cantidad
+        else:
+            histograms.setdefault((dimension, clave), [0] * (len(TURNAROUND_BUCKETS) + 1))[cubo] += cantidad
+    
+    def rows(dimension):
+        return sorted((clave, _summary(counts, breaches[(dimension, clave)]))
+                      for (dim, clave), counts in histograms.items() if dim == dimension and sum(counts))
+    
+    tecnico_rows = rows('tecnico')
+    names = dict(session.query(Usuario.id, Usuario.nombre)
+                 .filter(Usuario.id.in_([int(clave) for clave, _ in tecnico_rows]))) if tecnico_rows else {}
+    empty = [0] * (len(TURNAROUND_BUCKETS) + 1)
+    return {
+        'total': _summary(histograms.get(('total', ''), empty), breaches[('total', '')]),
+        'tecnicos': [{'tecnico_id': int(clave), 'nombre': names.get(int(clave), f'#{clave}'), **summary}
+                     for clave, summary in tecnico_rows],
+        'tipos': [{'tipo': clave, **summary} for clave, summary in rows('tipo')],
+    }
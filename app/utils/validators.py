@@ -1,139 +1,266 @@
 import re
-from app.models import Celular, Accesorio
+from itertools import chain
+from app.models import db, Categoria, Celular, Accesorio, Marca, Usuario
 
-def validate_product_data(data, product_type):
-    """Valida datos de productos"""
-    errors = []
-    
-    # Validaciones comunes
-    if not data.get('precio'):
-        errors.append('El precio es obligatorio')
-    else:
-        try:
-            precio = float(data['precio'])
-            if precio <= 0:
-                errors.append('El precio debe ser mayor a 0')
-        except ValueError:
-            errors.append('El precio debe ser un número válido')
-    
-    if not data.get('stock'):
-        errors.append('El stock es obligatorio')
+# Patrones compilados una sola vez: en un lote se aplican miles de veces
+EMAIL_RE = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+IMEI_SEPARATORS_RE = re.compile(r'[\s\-]')
+IMEI_RE = re.compile(r'^\d{15}$')
+
+USER_ROLES = ('admin', 'vendedor', 'tecnico')
+
+# Valores por consulta IN al comprobar campos únicos (límite de parámetros de SQLite)
+UNIQUE_QUERY_CHUNK = 5000
+
+def _blank(value):
+    return value is None or str(value).strip() == ''
+
+def _text(data, field):
+    value = data.get(field)
+    return '' if value is None else str(value).strip()
+
+def luhn_valid(digits):
+    """Dígito de control de Luhn (el último dígito del IMEI)"""
+    total = 0
+    for position, digit in enumerate(reversed(digits)):
+        value = int(digit)
+        if position % 2:
+            value = value * 2 - 9 if value > 4 else value * 2
+        total += value
+    return total % 10 == 0
+
+def normalize_imei(imei):
+    """IMEI sin espacios ni guiones, o None si no tiene 15 dígitos"""
+    imei = IMEI_SEPARATORS_RE.sub('', str(imei or ''))
+    return imei if IMEI_RE.match(imei) else None
+
+def _number_checks(data, field, parse, check, check_message):
+    if _blank(data.get(field)):
+        yield field, f'El {field} es obligatorio'
+        return
+    try:
+        value = parse(data[field])
+    except (TypeError, ValueError):
+        kind = 'un número válido' if parse is float else 'un número entero'
+        yield field, f'El {field} debe ser {kind}'
+        return
+    if not check(value):
+        yield field, check_message
+
+def parse_id(value):
+    """Id entero de un campo de referencia (marca_id, categoria_id), o None si no lo es"""
+    try:
+        return int(str(value).strip())
+    except (TypeError, ValueError):
+        return None
+
+def _id_checks(data, field, required_message, invalid_message):
+    if _blank(data.get(field)):
+        yield field, required_message
+    elif parse_id(data[field]) is None:
+        yield field, invalid_message
+
+def _common_product_checks(data):
+    yield from _number_checks(data, 'precio', float, lambda v: v > 0, 'El precio debe ser mayor a 0')
+    yield from _number_checks(data, 'stock', int, lambda v: v >= 0, 'El stock no puede ser negativo')
+    yield from _id_checks(data, 'marca_id', 'La marca es obligatoria', 'La marca no es válida')
+
+def _celular_checks(data, checksum=True):
+    # `checksum`: dígito de control de Luhn. Solo en los lotes: el formulario
+    # debe poder guardar celulares ya registrados con IMEI que no lo cumplen.
+    if _blank(data.get('modelo')):
+        yield 'modelo', 'El modelo es obligatorio'
+    if _blank(data.get('imei')):
+        yield 'imei', 'El IMEI es obligatorio'
     else:
-        try:
-            stock = int(data['stock'])
-            if stock < 0:
-                errors.append('El stock no puede ser negativo')
-        except ValueError:
-            errors.append('El stock debe ser un número entero')
-    
-    if not data.get('marca_id'):
-        errors.append('La marca es obligatoria')
+        imei = IMEI_SEPARATORS_RE.sub('', str(data['imei']))
+        if not IMEI_RE.match(imei):
+            yield 'imei', 'El IMEI debe tener exactamente 15 dígitos'
+        elif checksum and not luhn_valid(imei):
+            yield 'imei', 'El IMEI no es válido (dígito de control incorrecto)'
+    for field, message in (('ram', 'La memoria RAM es obligatoria'),
+                           ('almacenamiento', 'El almacenamiento es obligatorio'),
+                           ('color', 'El color es obligatorio')):
+        if _blank(data.get(field)):
+            yield field, message
+
+def _accesorio_checks(data):
+    for field, message in (('nombre', 'El nombre es obligatorio'),
+                           ('codigo_producto', 'El código de producto es obligatorio')):
+        if _blank(data.get(field)):
+            yield field, message
+    yield from _id_checks(data, 'categoria_id', 'La categoría es obligatoria', 'La categoría no es válida')
+
+def _user_checks(data, is_edit=False):
+    username = _text(data, 'username')
+    if not username:
+        yield 'username', 'El nombre de usuario es obligatorio'
+    elif len(username) < 3:
+        yield 'username', 'El nombre de usuario debe tener al menos 3 caracteres'
+    if _blank(data.get('nombre')):
+        yield 'nombre', 'El nombre completo es obligatorio'
+    if _blank(data.get('rol')):
+        yield 'rol', 'El rol es obligatorio'
+    elif data['rol'] not in USER_ROLES:
+        yield 'rol', 'Rol no válido'
     
-    # Validaciones específicas por tipo
-    if product_type == 'celular':
-        errors.extend(validate_celular_data(data))
-    elif product_type == 'accesorio':
-        errors.extend(validate_accesorio_data(data))
+    # Validar contraseña solo para usuarios nuevos
+    if not is_edit:
+        if not data.get('password'):
+            yield 'password', 'La contraseña es obligatoria'
+        elif len(data['password']) < 6:
+            yield 'password', 'La contraseña debe tener al menos 6 caracteres'
     
+    email = _text(data, 'email')
+    if email and not validate_email(email):
+        yield 'email', 'El formato del email no es válido'
+    telefono = _text(data, 'telefono')
+    if telefono and not validate_phone(telefono):
+        yield 'telefono', 'El formato del teléfono no es válido'
+
+# Comprobaciones de cada registro, sin consultas, por tipo de lote
+RECORD_CHECKS = {
+    'celular': lambda data: chain(_common_product_checks(data), _celular_checks(data)),
+    'accesorio': lambda data: chain(_common_product_checks(data), _accesorio_checks(data)),
+    'usuario': _user_checks,
+}
+# Las mismas para los formularios de un registro, sin el dígito de control del IMEI
+FORM_CHECKS = {
+    **RECORD_CHECKS,
+    'celular': lambda data: chain(_common_product_checks(data), _celular_checks(data, checksum=False)),
+}
+
+# Campos únicos por tipo de lote: (campo, columna, normalización, mensaje si
+# ya existe, mensaje si se repite en el lote). La normalización devuelve None
+# si el valor no tiene el formato esperado (ese error ya se informó).
+UNIQUE_FIELDS = {
+    'celular': (('imei', Celular.imei, normalize_imei,
+                 'Este IMEI ya está registrado', 'Este IMEI está repetido en el lote'),),
+    'accesorio': (('codigo_producto', Accesorio.codigo_producto, lambda value: str(value).strip() or None,
+                   'Este código de producto ya está registrado', 'Este código de producto está repetido en el lote'),),
+    'usuario': (('username', Usuario.username, lambda value: str(value).strip() or None,
+                 'El nombre de usuario ya existe', 'Este nombre de usuario está repetido en el lote'),),
+}
+
+# Referencias por tipo de lote: (campo, columna del id, mensaje si no existe)
+REFERENCE_FIELDS = {
+    'celular': (('marca_id', Marca.id, 'La marca no existe'),),
+    'accesorio': (('marca_id', Marca.id, 'La marca no existe'),
+                  ('categoria_id', Categoria.id, 'La categoría no existe')),
+}
+
+def _error(field, message, **extra):
+    return {'campo': field, 'mensaje': message, **extra}
+
+def _existing_values(column, values):
+    """Valores de `values` que ya están en `column`: una consulta IN por
+    bloque de UNIQUE_QUERY_CHUNK (una sola en lotes normales)"""
+    values = sorted(values)
+    found = set()
+    for start in range(0, len(values), UNIQUE_QUERY_CHUNK):
+        chunk = values[start:start + UNIQUE_QUERY_CHUNK]
+        found.update(value for (value,) in db.session.query(column).filter(column.in_(chunk)))
+    return found
+
+def _check_unique(records, errors, kind):
+    for field, column, normalize, taken, repeated in UNIQUE_FIELDS.get(kind, ()):
+        first_seen = {}
+        for index, data in enumerate(records):
+            value = None if _blank(data.get(field)) else normalize(data[field])
+            if value is None:
+                continue
+            if value in first_seen:
+                errors[index].append(_error(field, repeated, duplicado_de=first_seen[value]))
+            else:
+                first_seen[value] = index
+        for value in _existing_values(column, first_seen):
+            errors[first_seen[value]].append(_error(field, taken))
+
+def _check_references(records, errors, kind):
+    # Una consulta IN por campo para todos los ids del lote
+    for field, column, missing in REFERENCE_FIELDS.get(kind, ()):
+        ids = [None if _blank(data.get(field)) else parse_id(data[field]) for data in records]
+        found = _existing_values(column, {value for value in ids if value is not None})
+        for index, value in enumerate(ids):
+            if value is not None and value not in found:
+                errors[index].append(_error(field, missing))
+
+def validate_batch(records, kind):
+    """Valida una lista de registros (dicts) del tipo `kind` ('celular',
+    'accesorio' o 'usuario'). Devuelve una lista alineada con `records`: por
+    cada registro, sus errores como {'campo', 'mensaje'} (vacía si es válido).
+    Los campos únicos y los ids de marca y categoría se comprueban con una
+    consulta IN por campo para todo el lote; un valor repetido dentro del
+    lote lleva además `duplicado_de`, el índice de su primera aparición."""
+    return _validate(records, kind, RECORD_CHECKS)
+
+def _validate(records, kind, checks):
+    check = checks[kind]
+    errors = [[_error(field, message) for field, message in check(data)] for data in records]
+    _check_unique(records, errors, kind)
+    _check_references(records, errors, kind)
     return errors
 
+def validate_products_batch(records, product_type):
+    """validate_batch para celulares o accesorios"""
+    return validate_batch(records, product_type)
+
+def validate_users_batch(records):
+    """validate_batch para usuarios nuevos"""
+    return validate_batch(records, 'usuario')
+
+def batch_summary(errors):
+    """Resumen de validate_batch para una respuesta JSON: registros válidos
+    y una lista plana de errores con el índice de su registro"""
+    return {
+        'validos': sum(1 for record_errors in errors if not record_errors),
+        'errores': [{'registro': index, **error} for index, record_errors in enumerate(errors)
+                    for error in record_errors],
+    }
+
+def _messages(errors):
+    return [error['mensaje'] for error in errors]
+
+def validate_product_data(data, product_type):
+    """Valida datos de productos"""
+    if product_type in ('celular', 'accesorio'):
+        return _messages(_validate([data], product_type, FORM_CHECKS)[0])
+    return [message for _, message in _common_product_checks(data)]
+
 def validate_celular_data(data):
     """Validaciones específicas para celulares"""
-    errors = []
-    
-    if not data.get('modelo'):
-        errors.append('El modelo es obligatorio')
-    
-    if not data.get('imei'):
-        errors.append('El IMEI es obligatorio')
-    else:
-        # Validar formato IMEI (15 dígitos)
-        imei = data['imei'].replace(' ', '').replace('-', '')
-        if not re.match(r'^\d{15}$', imei):
-            errors.append('El IMEI debe tener exactamente 15 dígitos')
-        else:
-            # Verificar que el IMEI no exista ya en la BD
-            existing = Celular.query.filter_by(imei=imei).first()
-            if existing:
-                errors.append('Este IMEI ya está registrado')
-    
-    # Validar especificaciones
-    if not data.get('ram'):
-        errors.append('La memoria RAM es obligatoria')
-    
-    if not data.get('almacenamiento'):
-        errors.append('El almacenamiento es obligatorio')
-    
-    if not data.get('color'):
-        errors.append('El color es obligatorio')
-    
-    return errors
+    errors = [_error(field, message) for field, message in _celular_checks(data, checksum=False)]
+    _check_unique([data], [errors], 'celular')
+    return _messages(errors)
 
 def validate_accesorio_data(data):
     """Validaciones específicas para accesorios"""
-    errors = []
-    
-    if not data.get('nombre'):
-        errors.append('El nombre es obligatorio')
-    
-    if not data.get('categoria_id'):
-        errors.append('La categoría es obligatoria')
-    
-    if not data.get('codigo_producto'):
-        errors.append('El código de producto es obligatorio')
-    else:
-        # Verificar que el código no exista ya
-        existing = Accesorio.query.filter_by(codigo_producto=data['codigo_producto']).first()
-        if existing:
-            errors.append('Este código de producto ya está registrado')
-    
-    return errors
+    errors = [_error(field, message) for field, message in _accesorio_checks(data)]
+    _check_unique([data], [errors], 'accesorio')
+    return _messages(errors)
 
 def validate_user_data(data, is_edit=False, user_id=None):
     """Valida datos de usuarios"""
-    errors = []
-    
-    if not data.get('username'):
-        errors.append('El nombre de usuario es obligatorio')
-    elif len(data['username']) < 3:
-        errors.append('El nombre de usuario debe tener al menos 3 caracteres')
-    
-    if not data.get('nombre'):
-        errors.append('El nombre completo es obligatorio')
-    
-    if not data.get('rol'):
-        errors.append('El rol es obligatorio')
-    elif data['rol'] not in ['admin', 'vendedor', 'tecnico']:
-        errors.append('Rol no válido')
-    
-    # Validar contraseña solo para usuarios nuevos
-    if not is_edit and not data.get('password'):
-        errors.append('La contraseña es obligatoria')
-    elif not is_edit and len(data['password']) < 6:
-        errors.append('La contraseña debe tener al menos 6 caracteres')
-    
-    # Validar email si se proporciona
-    email = data.get('email', '').strip()
-    if email and not validate_email(email):
-        errors.append('El formato del email no es válido')
-    
-    # Validar teléfono si se proporciona
-    telefono = data.get('telefono', '').strip()
-    if telefono and not validate_phone(telefono):
-        errors.append('El formato del teléfono no es válido')
-    
-    return errors
+    return [message for _, message in _user_checks(data, is_edit)]
 
 def validate_email(email):
     """Valida formato de email"""
-    pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-    return re.match(pattern, email) is not None
+    return EMAIL_RE.match(email) is not None
+
+# Teléfonos: se aceptan con o sin espacios, guiones o paréntesis
+PHONE_SEPARATORS_RE = re.compile(r'[\s\-\(\)]')
+PHONE_RE = re.compile(r'^\+?[\d]{7,15}$')
+
+def normalize_phone(phone):
+    """Teléfono en forma canónica (solo dígitos) o None si no es válido"""
+    phone_clean = PHONE_SEPARATORS_RE.sub('', phone or '')
+    if not PHONE_RE.match(phone_clean):
+        return None
+    return phone_clean.lstrip('+')
 
 def validate_phone(phone):
     """Valida formato de teléfono"""
-    # Acepta números con o sin espacios, guiones o paréntesis
-    phone_clean = re.sub(r'[\s\-\(\)]', '', phone)
-    return re.match(r'^\+?[\d]{7,15}$', phone_clean) is not None
+    return normalize_phone(phone) is not None
 
 def validate_sale_data(data):
     """Valida datos de venta"""
@@ -4,12 +4,161 @@ Script para realizar copias de seguridad de la base de datos
 """
 
 import os
-import shutil
 import datetime
 import sqlite3
 import argparse
+import gzip
+import hashlib
+import json
+import struct
+import sys
+import tempfile
+import threading
+import time
 
-def backup_database(db_path, backup_dir='backups'):
+DEFAULT_DB = os.path.join('instance', 'tienda_celulares.db')
+
+# Copia por pasos: páginas por paso y pausa entre pasos para no acaparar la BD
+BACKUP_PAGES_PER_STEP = 256
+BACKUP_STEP_PAUSE = 0.005
+
+# Backups incrementales: el archivo se parte en bloques de tamaño fijo
+# (múltiplo del tamaño de página de SQLite), identificados por su SHA-256.
+# Cada bloque se guarda una sola vez, comprimido con gzip, y cada snapshot es
+# un manifiesto JSON con la lista de bloques.
+CHUNK_SIZE = 64 * 1024
+CHUNKS_DIR = 'chunks'
+SNAPSHOTS_DIR = 'snapshots'
+SNAPSHOT_TIME_FORMAT = '%Y%m%d_%H%M%S'
+
+# Retención por defecto: una instantánea por hora/día/semana
+DEFAULT_RETENTION = {'hourly': 24, 'daily': 7, 'weekly': 4}
+
+# Verificación: manifiesto de checksums (formato de sha256sum) y tablas cuyo
+# conteo de filas se revisa en cada copia
+CHECKSUMS_FILE = 'checksums.sha256'
+SANITY_TABLES = ('venta', 'detalle_venta', 'celular', 'accesorio', 'servicio_tv')
+
+# Archivado continuo del WAL (recuperación a un punto en el tiempo)
+WAL_ARCHIVE_DIR = 'wal_archive'
+WAL_ARCHIVE_INDEX = 'segments.jsonl'
+WAL_ARCHIVE_INTERVAL = 1.0           # segundos entre lecturas del WAL
+WAL_CHECKPOINT_FRAMES = 1000         # checkpoint propio al superar estos frames
+WAL_BASE_INTERVAL = 24 * 3600        # segundos entre snapshots base
+WAL_KEEP_BASES = 2
+WAL_MAGIC = (0x377f0682, 0x377f0683)
+WAL_HEADER_SIZE = 32
+WAL_FRAME_HEADER_SIZE = 24
+
+class BackupError(Exception):
+    """Error al copiar o verificar una base de datos"""
+
+def print_progress(copied, total):
+    """Muestra el avance de la copia en la terminal"""
+    percent = 100 * copied / total if total else 100
+    end = '\n' if copied >= total else ''
+    print(f"\r   Copiando páginas: {copied}/{total} ({percent:.0f}%)", end=end, flush=True)
+
+def integrity_check(db_path):
+    """Ejecuta PRAGMA integrity_check. Devuelve la lista de problemas (vacía si está bien)."""
+    conn = sqlite3.connect(db_path)
+    try:
+        rows = [row[0] for row in conn.execute('PRAGMA integrity_check')]
+    finally:
+        conn.close()
+    return [] if rows == ['ok'] else rows
+
+def file_sha256(path):
+    """SHA-256 de un archivo, leído por bloques"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def load_checksums(backup_dir):
+    """Checksums registrados en el manifiesto del directorio: {archivo: sha256}"""
+    checksums = {}
+    path = os.path.join(backup_dir, CHECKSUMS_FILE)
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                digest, _, filename = line.rstrip('\n').partition('  ')
+                if filename:
+                    checksums[filename] = digest
+    return checksums
+
+def record_checksum(backup_path):
+    """Agrega el checksum de una copia al manifiesto de su directorio"""
+    digest = file_sha256(backup_path)
+    with open(os.path.join(os.path.dirname(backup_path) or '.', CHECKSUMS_FILE), 'a') as f:
+        f.write(f"{digest}  {os.path.basename(backup_path)}\n")
+        f.flush()
+        os.fsync(f.fileno())
+    return digest
+
+def sanity_checks(db_path):
+    """Consultas de control sobre una copia. Devuelve (conteos, problemas)."""
+    counts = {}
+    problems = []
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        for table in SANITY_TABLES:
+            if table not in tables:
+                problems.append(f"Falta la tabla {table}")
+                continue
+            counts[table] = conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+        if {'venta', 'detalle_venta'} <= tables:
+            orphans = conn.execute(
+                'SELECT COUNT(*) FROM detalle_venta d '
+                'WHERE NOT EXISTS (SELECT 1 FROM venta v WHERE v.id = d.venta_id)'
+            ).fetchone()[0]
+            if orphans:
+                problems.append(f"{orphans} detalles de venta sin venta")
+        if counts.get('detalle_venta') and not counts.get('venta'):
+            problems.append("Hay detalles de venta pero ninguna venta")
+    finally:
+        conn.close()
+    return counts, problems
+
+def copy_pages(source, dest, pages=BACKUP_PAGES_PER_STEP, pause=BACKUP_STEP_PAUSE, progress=None):
+    """Copia `source` sobre `dest` por pasos, cediendo entre un paso y otro"""
+    def on_step(status, remaining, total):
+        if progress:
+            progress(total - remaining, total)
+        if remaining:
+            time.sleep(pause)
+    
+    source.backup(dest, pages=pages, progress=on_step)
+
+def online_backup(source_path, dest_path, pages=BACKUP_PAGES_PER_STEP,
+                  pause=BACKUP_STEP_PAUSE, progress=None):
+    """Copia consistente de una base SQLite en uso con la API de backup de SQLite.
+    
+    Copia `pages` páginas por paso y duerme `pause` segundos entre pasos para
+    que la aplicación pueda seguir escribiendo. En modo WAL mantiene una
+    transacción de lectura abierta: la copia es una instantánea consistente
+    y no se reinicia aunque haya escrituras. Al terminar verifica la copia con
+    PRAGMA integrity_check y la deja en modo DELETE (un solo archivo).
+    """
+    source = sqlite3.connect(source_path, isolation_level=None)
+    dest = sqlite3.connect(dest_path)
+    try:
+        if source.execute('PRAGMA journal_mode').fetchone()[0] == 'wal':
+            source.execute('BEGIN')
+            source.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+        copy_pages(source, dest, pages, pause, progress)
+        dest.execute('PRAGMA journal_mode=DELETE')
+    finally:
+        dest.close()
+        source.close()
+    
+    problems = integrity_check(dest_path)
+    if problems:
+        raise BackupError(f"La copia no pasó integrity_check: {'; '.join(problems[:5])}")
+
+def backup_database(db_path, backup_dir='backups', progress=print_progress):
     """Realiza una copia de seguridad de la base de datos"""
     # Crear directorio de backups si no existe
     if not os.path.exists(backup_dir):
@@ -26,21 +175,610 @@ def backup_database(db_path, backup_dir='backups'):
         print(f"Error: La base de datos {db_path} no existe.")
         return False
     
+    # Copiar a un archivo temporal y publicarlo solo si pasó la verificación
+    partial_path = backup_path + '.partial'
     try:
-        # Verificar que la base de datos es válida
-        conn = sqlite3.connect(db_path)
-        conn.close()
-        
-        # Realizar la copia de seguridad
-        shutil.copy2(db_path, backup_path)
+        online_backup(db_path, partial_path, progress=progress)
+        os.replace(partial_path, backup_path)
+        record_checksum(backup_path)
         print(f"✅ Copia de seguridad creada: {backup_path}")
         return True
-    except sqlite3.Error as e:
+    except (sqlite3.Error, BackupError) as e:
         print(f"Error de SQLite: {e}")
         return False
     except Exception as e:
         print(f"Error al realizar la copia de seguridad: {e}")
         return False
+    finally:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+
+def _chunk_path(backup_dir, digest):
+    return os.path.join(backup_dir, CHUNKS_DIR, digest[:2], f"{digest}.gz")
+
+def _write_atomic(path, data):
+    """Escribe un archivo completo o nada (nombre temporal + os.replace)"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    partial = f"{path}.{os.getpid()}.partial"
+    with open(partial, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(partial, path)
+
+def store_snapshot(snapshot_path, backup_dir, name, created=None):
+    """Guarda un archivo de base de datos como snapshot incremental.
+    
+    Solo se escriben los bloques que no estaban ya en el repositorio.
+    Devuelve el manifiesto y el número de bloques nuevos.
+    """
+    created = created or datetime.datetime.now()
+    chunks = []
+    new_chunks = 0
+    whole = hashlib.sha256()
+    size = 0
+    with open(snapshot_path, 'rb') as f:
+        while True:
+            block = f.read(CHUNK_SIZE)
+            if not block:
+                break
+            size += len(block)
+            whole.update(block)
+            digest = hashlib.sha256(block).hexdigest()
+            chunks.append(digest)
+            path = _chunk_path(backup_dir, digest)
+            if not os.path.exists(path):
+                _write_atomic(path, gzip.compress(block, compresslevel=6))
+                new_chunks += 1
+    
+    manifest = {
+        'name': name,
+        'created': created.isoformat(),
+        'size': size,
+        'sha256': whole.hexdigest(),
+        'chunk_size': CHUNK_SIZE,
+        'chunks': chunks,
+    }
+    manifest_path = os.path.join(backup_dir, SNAPSHOTS_DIR, f"{name}.json")
+    _write_atomic(manifest_path, json.dumps(manifest, indent=1).encode())
+    return manifest, new_chunks
+
+def load_manifests(backup_dir):
+    """Manifiestos de snapshots del repositorio, del más reciente al más antiguo"""
+    snapshots_dir = os.path.join(backup_dir, SNAPSHOTS_DIR)
+    if not os.path.isdir(snapshots_dir):
+        return []
+    manifests = []
+    for filename in os.listdir(snapshots_dir):
+        if filename.endswith('.json'):
+            with open(os.path.join(snapshots_dir, filename)) as f:
+                manifests.append(json.load(f))
+    return sorted(manifests, key=lambda m: (m['created'], m['name']), reverse=True)
+
+def rebuild_snapshot(manifest_path, dest_path):
+    """Reconstruye el archivo de base de datos de un manifiesto verificando los hashes"""
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    backup_dir = os.path.dirname(os.path.dirname(os.path.abspath(manifest_path)))
+    whole = hashlib.sha256()
+    with open(dest_path, 'wb') as out:
+        for digest in manifest['chunks']:
+            with open(_chunk_path(backup_dir, digest), 'rb') as f:
+                block = gzip.decompress(f.read())
+            if hashlib.sha256(block).hexdigest() != digest:
+                raise BackupError(f"Bloque dañado: {digest}")
+            whole.update(block)
+            out.write(block)
+    if whole.hexdigest() != manifest['sha256']:
+        raise BackupError(f"El snapshot {manifest['name']} no coincide con su hash")
+    return manifest
+
+def backup_incremental(db_path, backup_dir='backups', progress=print_progress):
+    """Crea un snapshot incremental (bloques deduplicados y comprimidos)"""
+    if not os.path.exists(db_path):
+        print(f"Error: La base de datos {db_path} no existe.")
+        return None
+    
+    created = datetime.datetime.now()
+    base_name = f"{os.path.splitext(os.path.basename(db_path))[0]}_{created.strftime(SNAPSHOT_TIME_FORMAT)}"
+    name = base_name
+    suffix = 1
+    while os.path.exists(os.path.join(backup_dir, SNAPSHOTS_DIR, f"{name}.json")):
+        suffix += 1
+        name = f"{base_name}_{suffix}"
+    
+    os.makedirs(backup_dir, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=backup_dir) as tmp:
+        snapshot_path = os.path.join(tmp, 'snapshot.db')
+        try:
+            online_backup(db_path, snapshot_path, progress=progress)
+            manifest, new_chunks = store_snapshot(snapshot_path, backup_dir, name, created)
+        except (sqlite3.Error, BackupError) as e:
+            print(f"Error de SQLite: {e}")
+            return None
+    
+    print(f"✅ Snapshot incremental creado: {name} "
+          f"({new_chunks}/{len(manifest['chunks'])} bloques nuevos, "
+          f"{manifest['size'] / (1024 * 1024):.2f} MB)")
+    return manifest
+
+def select_retained(manifests, hourly=24, daily=7, weekly=4):
+    """Nombres de los snapshots a conservar según la política de retención.
+    
+    Se conserva el snapshot más reciente de cada una de las últimas `hourly`
+    horas, `daily` días y `weekly` semanas ISO que tengan snapshots, y siempre
+    el último.
+    """
+    periods = [
+        (hourly, lambda t: t.strftime('%Y%m%d%H')),
+        (daily, lambda t: t.strftime('%Y%m%d')),
+        (weekly, lambda t: '%d-%02d' % t.isocalendar()[:2]),
+    ]
+    newest_first = sorted(manifests, key=lambda m: (m['created'], m['name']), reverse=True)
+    keep = {newest_first[0]['name']} if newest_first else set()
+    for limit, bucket_of in periods:
+        seen = set()
+        for manifest in newest_first:
+            bucket = bucket_of(datetime.datetime.fromisoformat(manifest['created']))
+            if bucket in seen:
+                continue
+            if len(seen) >= limit:
+                break
+            seen.add(bucket)
+            keep.add(manifest['name'])
+    return keep
+
+def collect_garbage(backup_dir, referenced=None):
+    """Elimina los bloques que ningún snapshot referencia. Devuelve cuántos borró."""
+    if referenced is None:
+        referenced = set()
+        for manifest in load_manifests(backup_dir):
+            referenced.update(manifest['chunks'])
+    removed = 0
+    chunks_dir = os.path.join(backup_dir, CHUNKS_DIR)
+    if not os.path.isdir(chunks_dir):
+        return 0
+    for prefix in os.listdir(chunks_dir):
+        for filename in os.listdir(os.path.join(chunks_dir, prefix)):
+            if filename.endswith('.gz') and filename[:-3] not in referenced:
+                os.remove(os.path.join(chunks_dir, prefix, filename))
+                removed += 1
+    return removed
+
+def prune_snapshots(backup_dir='backups', hourly=24, daily=7, weekly=4):
+    """Aplica la política de retención y recoge los bloques huérfanos"""
+    manifests = load_manifests(backup_dir)
+    keep = select_retained(manifests, hourly, daily, weekly)
+    deleted = []
+    for manifest in manifests:
+        if manifest['name'] not in keep:
+            os.remove(os.path.join(backup_dir, SNAPSHOTS_DIR, f"{manifest['name']}.json"))
+            deleted.append(manifest['name'])
+    removed_chunks = collect_garbage(backup_dir)
+    print(f"✅ Retención aplicada: {len(deleted)} snapshots y {removed_chunks} bloques eliminados, "
+          f"{len(keep)} snapshots conservados")
+    return deleted
+
+def wal_checksum(data, s0=0, s1=0, big_endian=False):
+    """Checksum acumulativo del formato WAL de SQLite"""
+    words = struct.unpack(f"{'>' if big_endian else '<'}{len(data) // 4}I", data)
+    for i in range(0, len(words), 2):
+        s0 = (s0 + words[i] + s1) & 0xFFFFFFFF
+        s1 = (s1 + words[i + 1] + s0) & 0xFFFFFFFF
+    return s0, s1
+
+def read_wal_header(f):
+    """Lee y valida la cabecera de un archivo -wal. Devuelve None si no es válida."""
+    f.seek(0)
+    data = f.read(WAL_HEADER_SIZE)
+    if len(data) < WAL_HEADER_SIZE:
+        return None
+    magic, _, page_size, checkpoint_seq, salt1, salt2, c1, c2 = struct.unpack('>8I', data)
+    if magic not in WAL_MAGIC:
+        return None
+    big_endian = bool(magic & 1)
+    if wal_checksum(data[:24], big_endian=big_endian) != (c1, c2):
+        return None
+    return {
+        'page_size': page_size,
+        'checkpoint_seq': checkpoint_seq,
+        'salt': (salt1, salt2),
+        'checksum': (c1, c2),
+        'big_endian': big_endian,
+    }
+
+def read_wal_frames(f, header, first_frame, checksum):
+    """Lee los frames confirmados a partir de `first_frame` (base 1).
+    
+    Se detiene en el primer frame con otra sal o checksum inválido (restos de
+    una generación anterior o un frame a medio escribir) y descarta los frames
+    posteriores al último commit. Devuelve (frames, checksum del último commit).
+    """
+    page_size = header['page_size']
+    frame_size = WAL_FRAME_HEADER_SIZE + page_size
+    start = WAL_HEADER_SIZE + (first_frame - 1) * frame_size
+    # Solo hasta el tamaño actual: no perseguir a un escritor que sigue agregando
+    available = max(0, (os.fstat(f.fileno()).st_size - start) // frame_size)
+    f.seek(start)
+    committed = []
+    pending = []
+    for _ in range(available):
+        frame = f.read(frame_size)
+        if len(frame) < frame_size:
+            break
+        _, commit, salt1, salt2, c1, c2 = struct.unpack('>6I', frame[:WAL_FRAME_HEADER_SIZE])
+        if (salt1, salt2) != header['salt']:
+            break
+        running = wal_checksum(frame[:8], *checksum, header['big_endian'])
+        running = wal_checksum(frame[WAL_FRAME_HEADER_SIZE:], *running, header['big_endian'])
+        if running != (c1, c2):
+            break
+        checksum = running
+        pending.append(frame)
+        if commit:
+            committed.extend(pending)
+            pending = []
+            commit_checksum = checksum
+    if not committed:
+        return [], None
+    return committed, commit_checksum
+
+class WalGapError(BackupError):
+    """El WAL se reinició con frames que no llegaron a archivarse"""
+
+class WalArchiver:
+    """Archiva de forma continua los frames del WAL de una base SQLite.
+    
+    Al arrancar toma un snapshot base (en el repositorio incremental de
+    `archive_dir`) y después copia cada `interval` segundos los frames
+    confirmados del archivo -wal como segmentos comprimidos, anotados en
+    segments.jsonl con la hora en que se vieron. Base + segmentos permiten
+    restaurar la base de datos a cualquier momento con la precisión del
+    intervalo.
+    
+    Para que SQLite no reinicie el WAL con frames sin copiar, el archivador
+    mantiene siempre una transacción de lectura abierta (se renueva en cada
+    lectura) y él mismo hace el checkpoint cuando el WAL crece, con el
+    bloqueo de escritura tomado mientras copia los últimos frames. Si aun así
+    detecta un hueco (p. ej. el WAL se reinició con el archivador detenido)
+    toma un snapshot base nuevo.
+    """
+    
+    def __init__(self, db_path, archive_dir=WAL_ARCHIVE_DIR, interval=WAL_ARCHIVE_INTERVAL,
+                 checkpoint_frames=WAL_CHECKPOINT_FRAMES, base_interval=WAL_BASE_INTERVAL,
+                 keep_bases=WAL_KEEP_BASES):
+        self.db_path = db_path
+        self.wal_path = f"{db_path}-wal"
+        self.archive_dir = archive_dir
+        self.interval = interval
+        self.checkpoint_frames = checkpoint_frames
+        self.base_interval = base_interval
+        self.keep_bases = keep_bases
+        self.base = None
+        self.base_time = None
+        self.header = None
+        self.next_frame = 1
+        self.checksum = None
+        self.reader = None
+        self.checkpointed_frame = None
+        self.stop_event = threading.Event()
+    
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, isolation_level=None, timeout=30)
+        conn.execute('PRAGMA busy_timeout=30000')
+        return conn
+    
+    def _renew_reader(self):
+        """Abre una transacción de lectura nueva antes de cerrar la anterior"""
+        reader = self._connect()
+        reader.execute('BEGIN')
+        reader.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+        if self.reader is not None:
+            self.reader.close()
+        self.reader = reader
+    
+    def _locked(self):
+        """Conexión con el bloqueo de escritura tomado: el WAL no cambia mientras dure"""
+        writer = self._connect()
+        writer.execute('BEGIN IMMEDIATE')
+        return writer
+    
+    def _sync_position(self):
+        """Recorre el WAL actual sin archivarlo (ya está incluido en el snapshot base)"""
+        self.header = None
+        self.next_frame = 1
+        self.checksum = None
+        if not os.path.exists(self.wal_path):
+            return
+        with open(self.wal_path, 'rb') as f:
+            header = read_wal_header(f)
+            if header is None:
+                return
+            frames, checksum = read_wal_frames(f, header, 1, header['checksum'])
+        self.header = header
+        self.next_frame = 1 + len(frames)
+        self.checksum = checksum or header['checksum']
+    
+    def take_base(self):
+        """Snapshot base consistente con la posición actual del WAL"""
+        os.makedirs(self.archive_dir, exist_ok=True)
+        writer = self._locked()
+        try:
+            with tempfile.TemporaryDirectory(dir=self.archive_dir) as tmp:
+                snapshot_path = os.path.join(tmp, 'base.db')
+                online_backup(self.db_path, snapshot_path, pages=-1, pause=0)
+                # Con las escrituras bloqueadas, la hora posterior a la copia
+                # es la del estado que contiene
+                created = datetime.datetime.now()
+                name = f"base_{created.strftime(SNAPSHOT_TIME_FORMAT)}_{created.microsecond:06d}"
+                store_snapshot(snapshot_path, self.archive_dir, name, created)
+            self._sync_position()
+            self._renew_reader()
+        finally:
+            writer.rollback()
+            writer.close()
+        self.base = name
+        self.base_time = time.monotonic()
+        prune_archive(self.archive_dir, self.keep_bases)
+        print(f"✅ Snapshot base del archivo WAL: {name}")
+        return name
+    
+    def _copy_frames(self):
+        """Copia los frames confirmados nuevos. Devuelve cuántos archivó."""
+        if not os.path.exists(self.wal_path):
+            return 0
+        with open(self.wal_path, 'rb') as f:
+            header = read_wal_header(f)
+            if header is None:
+                return 0
+            if self.header is None or header['salt'] != self.header['salt']:
+                # WAL reiniciado: solo es continuo si es la generación siguiente
+                if self.header is not None and header['checkpoint_seq'] != self.header['checkpoint_seq'] + 1:
+                    raise WalGapError("El WAL se reinició más de una vez entre dos lecturas")
+                self.header = header
+                self.next_frame = 1
+                self.checksum = header['checksum']
+            frames, checksum = read_wal_frames(f, header, self.next_frame, self.checksum)
+        if not frames:
+            return 0
+        
+        first_frame = self.next_frame
+        self.next_frame += len(frames)
+        self.checksum = checksum
+        self._write_segment(header, first_frame, frames)
+        return len(frames)
+    
+    def _write_segment(self, header, first_frame, frames):
+        now = datetime.datetime.now()
+        segment = (f"{self.base}_{header['checkpoint_seq']:08d}_{first_frame:08d}.wal.gz")
+        _write_atomic(os.path.join(self.archive_dir, 'segments', segment),
+                      gzip.compress(b''.join(frames), compresslevel=6))
+        entry = {
+            'segment': segment,
+            'base': self.base,
+            'time': now.isoformat(timespec='microseconds'),
+            'page_size': header['page_size'],
+            'checkpoint_seq': header['checkpoint_seq'],
+            'first_frame': first_frame,
+            'frames': len(frames),
+        }
+        with open(os.path.join(self.archive_dir, WAL_ARCHIVE_INDEX), 'a') as f:
+            f.write(json.dumps(entry) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+    
+    def checkpoint(self):
+        """Checkpoint controlado: copia el final del WAL con las escrituras
+        bloqueadas y deja que SQLite lo reinicie en la próxima escritura"""
+        # La mayor parte se copia sin bloquear; con el bloqueo solo queda la cola
+        self._copy_frames()
+        writer = self._locked()
+        try:
+            self._copy_frames()
+            self.reader.close()
+            self.reader = None
+            self._passive_checkpoint()
+            self._renew_reader()
+            self.checkpointed_frame = self.next_frame
+        finally:
+            writer.rollback()
+            writer.close()
+    
+    def _passive_checkpoint(self):
+        conn = self._connect()
+        try:
+            conn.execute('PRAGMA wal_checkpoint(PASSIVE)').fetchone()
+        finally:
+            conn.close()
+    
+    def poll(self):
+        """Una pasada del archivador. Devuelve el número de frames archivados."""
+        if self.base is None or time.monotonic() - self.base_time >= self.base_interval:
+            self.take_base()
+        self._renew_reader()
+        try:
+            copied = self._copy_frames()
+        except WalGapError as e:
+            print(f"⚠️  {e}; se toma un snapshot base nuevo")
+            self.take_base()
+            return 0
+        if self.next_frame - 1 >= self.checkpoint_frames and self.next_frame != self.checkpointed_frame:
+            self.checkpoint()
+        return copied
+    
+    def run(self):
+        """Bucle del demonio hasta que se llame a stop()"""
+        try:
+            while not self.stop_event.is_set():
+                self.poll()
+                self.stop_event.wait(self.interval)
+            self.poll()
+        finally:
+            self.close()
+    
+    def stop(self):
+        self.stop_event.set()
+    
+    def close(self):
+        if self.reader is not None:
+            self.reader.close()
+            self.reader = None
+
+def load_wal_index(archive_dir):
+    """Entradas de segments.jsonl en orden de archivado"""
+    index_path = os.path.join(archive_dir, WAL_ARCHIVE_INDEX)
+    if not os.path.exists(index_path):
+        return []
+    entries = []
+    with open(index_path) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    # Última línea a medio escribir si el proceso murió
+                    break
+    return entries
+
+def prune_archive(archive_dir, keep_bases=WAL_KEEP_BASES):
+    """Conserva las `keep_bases` bases más recientes y sus segmentos"""
+    manifests = load_manifests(archive_dir)
+    keep = {m['name'] for m in manifests[:keep_bases]}
+    for manifest in manifests[keep_bases:]:
+        os.remove(os.path.join(archive_dir, SNAPSHOTS_DIR, f"{manifest['name']}.json"))
+    
+    entries = load_wal_index(archive_dir)
+    kept_entries = [e for e in entries if e['base'] in keep]
+    if len(kept_entries) != len(entries):
+        _write_atomic(os.path.join(archive_dir, WAL_ARCHIVE_INDEX),
+                      ''.join(json.dumps(e) + '\n' for e in kept_entries).encode())
+    segments_dir = os.path.join(archive_dir, 'segments')
+    if os.path.isdir(segments_dir):
+        referenced = {e['segment'] for e in kept_entries}
+        for filename in os.listdir(segments_dir):
+            if filename not in referenced:
+                os.remove(os.path.join(segments_dir, filename))
+    collect_garbage(archive_dir)
+
+def apply_wal_segments(db_path, archive_dir, entries):
+    """Aplica los frames de los segmentos sobre un archivo de base de datos"""
+    db_pages = None
+    with open(db_path, 'r+b') as db:
+        for entry in entries:
+            page_size = entry['page_size']
+            frame_size = WAL_FRAME_HEADER_SIZE + page_size
+            with open(os.path.join(archive_dir, 'segments', entry['segment']), 'rb') as f:
+                data = gzip.decompress(f.read())
+            if len(data) != entry['frames'] * frame_size:
+                raise BackupError(f"Segmento incompleto: {entry['segment']}")
+            for offset in range(0, len(data), frame_size):
+                page_number, commit = struct.unpack('>2I', data[offset:offset + 8])
+                db.seek((page_number - 1) * page_size)
+                db.write(data[offset + WAL_FRAME_HEADER_SIZE:offset + frame_size])
+                if commit:
+                    db_pages = (commit, page_size)
+        if db_pages:
+            db.truncate(db_pages[0] * db_pages[1])
+    
+    # Las páginas del WAL marcan el archivo en modo WAL; la copia queda en DELETE
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute('PRAGMA journal_mode=DELETE')
+    finally:
+        conn.close()
+
+def restore_point_in_time(archive_dir, db_path, until=None, progress=print_progress):
+    """Restaura la base de datos al estado de `until` (o al último archivado)"""
+    manifests = load_manifests(archive_dir)
+    if until is not None:
+        manifests = [m for m in manifests if datetime.datetime.fromisoformat(m['created']) <= until]
+    if not manifests:
+        print("Error: No hay un snapshot base anterior al momento pedido.")
+        return False
+    base = manifests[0]
+    entries = [e for e in load_wal_index(archive_dir) if e['base'] == base['name']
+               and (until is None or datetime.datetime.fromisoformat(e['time']) <= until)]
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        rebuilt_path = os.path.join(tmp, 'pitr.db')
+        try:
+            rebuild_snapshot(os.path.join(archive_dir, SNAPSHOTS_DIR, f"{base['name']}.json"), rebuilt_path)
+            apply_wal_segments(rebuilt_path, archive_dir, entries)
+        except (OSError, sqlite3.Error, BackupError) as e:
+            print(f"Error al reconstruir el punto de restauración: {e}")
+            return False
+        target = entries[-1]['time'] if entries else base['created']
+        print(f"Punto de restauración: {target} (base {base['name']} + {len(entries)} segmentos)")
+        return restore_database(rebuilt_path, db_path, progress)
+
+def verify_backup(path, expected_sha256=None):
+    """Verifica una copia (.db o manifiesto .json de un snapshot).
+    
+    Compara el checksum con el registrado, ejecuta integrity_check y las
+    consultas de control. Se ejecuta en un proceso del pool de verify_backups.
+    """
+    result = {'path': path, 'problems': [], 'warnings': [], 'counts': {}}
+    try:
+        if path.endswith('.json'):
+            # El manifiesto guarda el hash de cada bloque y del archivo completo
+            with tempfile.TemporaryDirectory() as tmp:
+                rebuilt_path = os.path.join(tmp, 'snapshot.db')
+                rebuild_snapshot(path, rebuilt_path)
+                result['problems'] += integrity_check(rebuilt_path)
+                if not result['problems']:
+                    result['counts'], problems = sanity_checks(rebuilt_path)
+                    result['problems'] += problems
+            return result
+        
+        digest = file_sha256(path)
+        if expected_sha256 is None:
+            result['warnings'].append('sin checksum registrado')
+        elif digest != expected_sha256:
+            result['problems'].append('el checksum no coincide con el manifiesto')
+            return result
+        result['problems'] += integrity_check(path)
+        if not result['problems']:
+            result['counts'], problems = sanity_checks(path)
+            result['problems'] += problems
+    except (OSError, sqlite3.Error, BackupError, ValueError) as e:
+        result['problems'].append(str(e))
+    return result
+
+def verify_backups(backup_dir='backups', workers=None):
+    """Verifica todas las copias y snapshots del directorio en un pool de procesos"""
+    from concurrent.futures import ProcessPoolExecutor
+    
+    jobs = []
+    if os.path.isdir(backup_dir):
+        checksums = load_checksums(backup_dir)
+        jobs = [(os.path.join(backup_dir, name), checksums.get(name))
+                for name in sorted(os.listdir(backup_dir)) if name.endswith('.db')]
+    snapshots_dir = os.path.join(backup_dir, SNAPSHOTS_DIR)
+    if os.path.isdir(snapshots_dir):
+        jobs += [(os.path.join(snapshots_dir, name), None)
+                 for name in sorted(os.listdir(snapshots_dir)) if name.endswith('.json')]
+    if not jobs:
+        print("No hay copias de seguridad disponibles.")
+        return []
+    
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(verify_backup, *zip(*jobs)))
+    
+    failed = 0
+    for result in results:
+        name = os.path.relpath(result['path'], backup_dir)
+        if result['problems']:
+            failed += 1
+            print(f"❌ {name}: {'; '.join(result['problems'][:3])}")
+        else:
+            counts = ', '.join(f"{table}={n}" for table, n in result['counts'].items())
+            warnings = f" ⚠️  {'; '.join(result['warnings'])}" if result['warnings'] else ''
+            print(f"✅ {name}: {counts}{warnings}")
+    print(f"\n{len(results) - failed}/{len(results)} copias verificadas en "
+          f"{time.perf_counter() - started:.1f} s")
+    return results
 
 def list_backups(backup_dir='backups'):
     """Lista todas las copias de seguridad disponibles"""
@@ -49,28 +787,56 @@ def list_backups(backup_dir='backups'):
         return
     
     backups = [f for f in os.listdir(backup_dir) if f.endswith('.db')]
+    manifests = load_manifests(backup_dir)
     
-    if not backups:
+    if not backups and not manifests:
         print("No hay copias de seguridad disponibles.")
         return
     
-    print("\nCopias de seguridad disponibles:")
-    for i, backup in enumerate(sorted(backups, reverse=True)):
-        backup_path = os.path.join(backup_dir, backup)
-        size_mb = os.path.getsize(backup_path) / (1024 * 1024)
-        print(f"{i+1}. {backup} ({size_mb:.2f} MB)")
+    if backups:
+        print("\nCopias de seguridad disponibles:")
+        for i, backup in enumerate(sorted(backups, reverse=True)):
+            backup_path = os.path.join(backup_dir, backup)
+            size_mb = os.path.getsize(backup_path) / (1024 * 1024)
+            print(f"{i+1}. {backup} ({size_mb:.2f} MB)")
+    
+    if manifests:
+        print("\nSnapshots incrementales:")
+        for i, manifest in enumerate(manifests):
+            size_mb = manifest['size'] / (1024 * 1024)
+            manifest_path = os.path.join(backup_dir, SNAPSHOTS_DIR, f"{manifest['name']}.json")
+            print(f"{i+1}. {manifest_path} ({size_mb:.2f} MB, {len(manifest['chunks'])} bloques)")
 
-def restore_database(backup_path, db_path):
-    """Restaura una copia de seguridad"""
+def restore_database(backup_path, db_path, progress=print_progress):
+    """Restaura una copia de seguridad (archivo .db o manifiesto .json de un snapshot)"""
+    if backup_path.endswith('.json'):
+        if not os.path.exists(backup_path):
+            print(f"Error: El archivo de backup {backup_path} no existe.")
+            return False
+        with tempfile.TemporaryDirectory() as tmp:
+            rebuilt_path = os.path.join(tmp, 'snapshot.db')
+            try:
+                rebuild_snapshot(backup_path, rebuilt_path)
+            except (OSError, BackupError) as e:
+                print(f"Error al reconstruir el snapshot: {e}")
+                return False
+            return restore_database(rebuilt_path, db_path, progress)
+    
     try:
         # Verificar que el archivo de backup existe
         if not os.path.exists(backup_path):
             print(f"Error: El archivo de backup {backup_path} no existe.")
             return False
         
-        # Verificar que es una base de datos SQLite válida
-        conn = sqlite3.connect(backup_path)
-        conn.close()
+        # Verificar el checksum registrado (si lo hay) y que la base es válida
+        expected = load_checksums(os.path.dirname(backup_path) or '.').get(os.path.basename(backup_path))
+        if expected and file_sha256(backup_path) != expected:
+            print(f"Error: El checksum de {backup_path} no coincide con el manifiesto.")
+            return False
+        problems = integrity_check(backup_path)
+        if problems:
+            print(f"Error: El backup {backup_path} está dañado: {problems[0]}")
+            return False
         
         # Crear una copia de seguridad de la base de datos actual antes de restaurar
         if os.path.exists(db_path):
@@ -82,14 +848,23 @@ def restore_database(backup_path, db_path):
             if not os.path.exists('backups'):
                 os.makedirs('backups')
                 
-            shutil.copy2(db_path, pre_restore_path)
+            online_backup(db_path, pre_restore_path, progress=progress)
+            record_checksum(pre_restore_path)
             print(f"✅ Copia de seguridad previa a la restauración: {pre_restore_path}")
         
-        # Restaurar la base de datos
-        shutil.copy2(backup_path, db_path)
+        # Restaurar la base de datos con la API de backup: las conexiones
+        # abiertas (y el archivo -wal) quedan coherentes, a diferencia de
+        # sobrescribir el archivo.
+        source = sqlite3.connect(backup_path)
+        target = sqlite3.connect(db_path)
+        try:
+            copy_pages(source, target, progress=progress)
+        finally:
+            target.close()
+            source.close()
         print(f"✅ Base de datos restaurada desde: {backup_path}")
         return True
-    except sqlite3.Error as e:
+    except (sqlite3.Error, BackupError) as e:
         print(f"Error de SQLite: {e}")
         return False
     except Exception as e:
@@ -102,25 +877,75 @@ if __name__ == '__main__':
     
     # Comando backup
     backup_parser = subparsers.add_parser('backup', help='Crear una copia de seguridad')
-    backup_parser.add_argument('--db', default='app/tienda_celulares.db', help='Ruta a la base de datos')
+    backup_parser.add_argument('--db', default=DEFAULT_DB, help='Ruta a la base de datos')
     backup_parser.add_argument('--dir', default='backups', help='Directorio para guardar backups')
+    backup_parser.add_argument('--incremental', action='store_true',
+                               help='Snapshot incremental (bloques deduplicados y comprimidos)')
+    
+    # Comando prune
+    prune_parser = subparsers.add_parser('prune', help='Aplicar la retención a los snapshots incrementales')
+    prune_parser.add_argument('--dir', default='backups', help='Directorio de backups')
+    prune_parser.add_argument('--hourly', type=int, default=DEFAULT_RETENTION['hourly'], help='Horas a conservar')
+    prune_parser.add_argument('--daily', type=int, default=DEFAULT_RETENTION['daily'], help='Días a conservar')
+    prune_parser.add_argument('--weekly', type=int, default=DEFAULT_RETENTION['weekly'], help='Semanas a conservar')
     
     # Comando list
     list_parser = subparsers.add_parser('list', help='Listar copias de seguridad')
     list_parser.add_argument('--dir', default='backups', help='Directorio de backups')
     
+    # Comando verify
+    verify_parser = subparsers.add_parser('verify', help='Verificar checksums e integridad de las copias')
+    verify_parser.add_argument('--dir', default='backups', help='Directorio de backups')
+    verify_parser.add_argument('--workers', type=int, default=None,
+                               help='Procesos en paralelo (por defecto, uno por CPU)')
+    
     # Comando restore
     restore_parser = subparsers.add_parser('restore', help='Restaurar una copia de seguridad')
-    restore_parser.add_argument('backup', help='Ruta al archivo de backup')
-    restore_parser.add_argument('--db', default='app/tienda_celulares.db', help='Ruta a la base de datos')
+    restore_parser.add_argument('backup', nargs='?', help='Ruta al archivo de backup (.db o manifiesto .json)')
+    restore_parser.add_argument('--db', default=DEFAULT_DB, help='Ruta a la base de datos')
+    restore_parser.add_argument('--until', type=datetime.datetime.fromisoformat,
+                                help='Restaurar desde el archivo WAL al estado de esta fecha (AAAA-MM-DD HH:MM:SS)')
+    restore_parser.add_argument('--archive', default=WAL_ARCHIVE_DIR, help='Directorio del archivo WAL')
+    
+    # Comando archive
+    archive_parser = subparsers.add_parser('archive', help='Archivar el WAL de forma continua (demonio)')
+    archive_parser.add_argument('--db', default=DEFAULT_DB, help='Ruta a la base de datos')
+    archive_parser.add_argument('--dir', default=WAL_ARCHIVE_DIR, help='Directorio del archivo WAL')
+    archive_parser.add_argument('--interval', type=float, default=WAL_ARCHIVE_INTERVAL,
+                                help='Segundos entre lecturas del WAL')
+    archive_parser.add_argument('--base-interval', type=float, default=WAL_BASE_INTERVAL / 3600,
+                                help='Horas entre snapshots base')
+    archive_parser.add_argument('--keep-bases', type=int, default=WAL_KEEP_BASES,
+                                help='Snapshots base (con sus segmentos) a conservar')
     
     args = parser.parse_args()
     
     if args.command == 'backup':
-        backup_database(args.db, args.dir)
+        if args.incremental:
+            backup_incremental(args.db, args.dir)
+        else:
+            backup_database(args.db, args.dir)
+    elif args.command == 'prune':
+        prune_snapshots(args.dir, args.hourly, args.daily, args.weekly)
+    elif args.command == 'verify':
+        results = verify_backups(args.dir, args.workers)
+        sys.exit(1 if any(r['problems'] for r in results) else 0)
     elif args.command == 'list':
         list_backups(args.dir)
     elif args.command == 'restore':
-        restore_database(args.backup, args.db)
+        if args.until is not None or args.backup is None:
+            restore_point_in_time(args.archive, args.db, args.until)
+        else:
+            restore_database(args.backup, args.db)
+    elif args.command == 'archive':
+        import signal
+        archiver = WalArchiver(args.db, args.dir, interval=args.interval,
+                               base_interval=args.base_interval * 3600, keep_bases=args.keep_bases)
+        signal.signal(signal.SIGTERM, lambda signum, frame: archiver.stop())
+        print(f"Archivando el WAL de {args.db} en {args.dir} (Ctrl+C para detener)")
+        try:
+            archiver.run()
+        except KeyboardInterrupt:
+            pass
     else:
         parser.print_help()
\ No newline at end of file
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Benchmark de la sincronización del catálogo: bytes y tiempo de servidor
+
+Crea una base temporal con un catálogo de prueba, inicia sesión como
+vendedor y compara lo que cuesta poner al día al punto de venta:
+
+  - recargar /ventas/nueva (el catálogo va renderizado en el modal)
+  - sincronización completa (/productos/api/catalogo?desde=0), una vez
+  - sincronización por cambios después de N ventas (?desde=<versión>)
+  - una búsqueda respondida por el servidor (/productos/api/buscar); con la
+    copia local la responde el service worker sin ir a la red
+
+Uso:
+    python benchmarks/catalog_sync.py --productos 2000 --cambios 20
+"""
+
+import argparse
+import gzip
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+
+def seed(db, productos):
+    from werkzeug.security import generate_password_hash
+    from app.models import Accesorio, Categoria, Celular, Marca, Usuario
+    # Nombres propios: create_app ya crea las marcas y categorías iniciales
+    marcas = [Marca(nombre=f'Marca de prueba {i}') for i in range(4)]
+    categoria = Categoria(nombre='Categoría de prueba')
+    db.session.add_all(marcas + [categoria, Usuario(username='caja', password=generate_password_hash('caja'),
+                                                     nombre='Caja', rol='vendedor')])
+    db.session.flush()
+    for i in range(productos):
+        marca = marcas[i % len(marcas)]
+        db.session.add(Celular(modelo=f'Modelo {i}', marca_id=marca.id, precio=100 + i, stock=1 + i % 20,
+                               estado='nuevo', imei=f'IMEI-{i:06d}'))
+        db.session.add(Accesorio(nombre=f'Accesorio {i}', marca_id=marca.id, categoria_id=categoria.id,
+                                 precio=10 + i, stock=1 + i % 30, codigo_producto=f'ACC-{i:05d}'))
+    db.session.commit()
+
+
+def timed_get(client, url, runs):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        response = client.get(url)
+        times.append(time.perf_counter() - start)
+    body = response.get_data()
+    return len(body), len(gzip.compress(body, mtime=0)), statistics.median(times) * 1000
+
+
+def measure(productos, cambios, runs):
+    with tempfile.TemporaryDirectory() as tmp:
+        # Antes de importar la app: Config lee el entorno al importarse
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        os.environ['INIT_DB_ON_STARTUP'] = '1'
+        os.environ['TEMPLATE_CACHE_DIR'] = ''
+        from app import create_app
+        from app.models import Celular, db
+        from app.utils.catalog import current_version
+        app = create_app()
+        with app.app_context():
+            seed(db, productos)
+            version = current_version()
+            # Ventas posteriores a la última sincronización
+            for celular in Celular.query.order_by(Celular.id).limit(cambios):
+                celular.stock -= 1
+                db.session.commit()
+        client = app.test_client()
+        client.post('/login', data={'username': 'caja', 'password': 'caja'})
+        return [
+            ('recarga de /ventas/nueva', timed_get(client, '/ventas/nueva', runs)),
+            ('sincronización completa', timed_get(client, '/productos/api/catalogo?desde=0', runs)),
+            (f'cambios tras {cambios} ventas', timed_get(client, f'/productos/api/catalogo?desde={version}', runs)),
+            ('búsqueda en el servidor', timed_get(client, '/productos/api/buscar?q=modelo 12', runs)),
+        ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Costo de poner al día el catálogo del punto de venta')
+    parser.add_argument('--productos', type=int, default=2000, help='Celulares y accesorios de prueba')
+    parser.add_argument('--cambios', type=int, default=20, help='Ventas desde la última sincronización')
+    parser.add_argument('--runs', type=int, default=5, help='Peticiones por medición')
+    args = parser.parse_args()
+
+    rows = measure(args.productos, args.cambios, args.runs)
+    print(f"Catálogo de {args.productos} celulares y {args.productos} accesorios (mediana de {args.runs})\n")
+    print(f"{'petición':32}{'bytes':>12}{'gzip':>10}{'servidor ms':>14}")
+    for name, (size, compressed, ms) in rows:
+        print(f"{name:32}{size:12d}{compressed:10d}{ms:14.1f}")
+
+
+if __name__ == '__main__':
+    main()
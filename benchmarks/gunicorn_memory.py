@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Benchmark de memoria y arranque de gunicorn con y sin preload_app
+
+Para cada modo (GUNICORN_PRELOAD=0/1) arranca gunicorn con gunicorn_config.py,
+espera a que todos los workers estén listos, hace algunas peticiones de
+calentamiento y lee /proc/<pid>/smaps_rollup del master y de cada worker:
+
+  - RSS: memoria residente total (incluye páginas compartidas)
+  - PSS: memoria proporcional (las páginas compartidas se reparten)
+  - USS: memoria privada de cada proceso
+
+Solo funciona en Linux.
+
+Uso:
+    python benchmarks/gunicorn_memory.py --workers 3
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from startup import ROOT, GUNICORN_CONFIG, _env, _init_schema, _free_port, _wait_ok, _wait_ready
+
+WRAPPER_CONFIG = '''
+exec(open({config!r}).read())
+bind = '127.0.0.1:{port}'
+workers = {workers}
+accesslog = None
+
+_post_worker_init = globals().get('post_worker_init')
+
+def post_worker_init(worker):
+    if _post_worker_init:
+        _post_worker_init(worker)
+    with open({log!r}, 'a') as f:
+        f.write(f"ready {{worker.age}}\\n")
+'''
+
+
+def smaps_rollup(pid):
+    """Devuelve RSS, PSS y USS (kB) de un proceso"""
+    values = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[0].endswith(':') and parts[1].isdigit():
+                values[parts[0][:-1]] = int(parts[1])
+    return {
+        'rss': values.get('Rss', 0),
+        'pss': values.get('Pss', 0),
+        'uss': values.get('Private_Clean', 0) + values.get('Private_Dirty', 0),
+    }
+
+
+def children(pid):
+    with open(f'/proc/{pid}/task/{pid}/children') as f:
+        return [int(p) for p in f.read().split()]
+
+
+def measure(preload, workers, warmup=30):
+    with tempfile.TemporaryDirectory() as tmp:
+        env = _env(os.path.join(tmp, 'bench.db'), init_db=False)
+        env['GUNICORN_PRELOAD'] = '1' if preload else '0'
+        _init_schema(env)
+        port = _free_port()
+        log_path = os.path.join(tmp, 'workers.log')
+        open(log_path, 'w').close()
+        config_path = os.path.join(tmp, 'gunicorn_bench.py')
+        with open(config_path, 'w') as f:
+            f.write(WRAPPER_CONFIG.format(config=GUNICORN_CONFIG, port=port,
+                                          workers=workers, log=log_path))
+
+        url = f'http://127.0.0.1:{port}/login'
+        start = time.time()
+        proc = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', config_path, 'run:app'],
+                                cwd=ROOT, env=env,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            if not _wait_ok(url) or not _wait_ready(log_path, workers):
+                raise RuntimeError('gunicorn no arrancó')
+            cold_start = time.time() - start
+            for _ in range(warmup):
+                _wait_ok(url)
+            master = smaps_rollup(proc.pid)
+            per_worker = [smaps_rollup(pid) for pid in children(proc.pid)]
+        finally:
+            proc.terminate()
+            proc.wait(timeout=30)
+        return cold_start, master, per_worker
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Memoria por worker con y sin preload')
+    parser.add_argument('--workers', type=int, default=3, help='Número de workers')
+    args = parser.parse_args()
+
+    print(f"{'modo':<12} {'arranque':>10} {'master RSS':>11} {'worker RSS':>11} "
+          f"{'worker PSS':>11} {'worker USS':>11} {'total PSS':>10}")
+    for preload in (False, True):
+        cold_start, master, per_worker = measure(preload, args.workers)
+        med = {k: statistics.median(w[k] for w in per_worker) / 1024 for k in ('rss', 'pss', 'uss')}
+        total_pss = (master['pss'] + sum(w['pss'] for w in per_worker)) / 1024
+        mode = 'preload' if preload else 'sin preload'
+        print(f"{mode:<12} {cold_start * 1000:8.0f}ms {master['rss'] / 1024:9.1f}MB "
+              f"{med['rss']:9.1f}MB {med['pss']:9.1f}MB {med['uss']:9.1f}MB {total_pss:8.1f}MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Benchmark de bytes transferidos por página, con y sin compresión
+
+Crea una base temporal con un catálogo de prueba (celulares, accesorios y
+servicios), inicia sesión como admin y pide cada página con
+Accept-Encoding: identity, gzip y br (si el paquete brotli está instalado).
+Muestra los bytes del cuerpo de cada respuesta y los de los archivos
+estáticos locales que la página referencia (con huella: en una visita
+repetida no se vuelven a pedir, por la caché inmutable).
+
+Uso:
+    python benchmarks/page_bytes.py --productos 500
+"""
+
+import argparse
+import os
+import re
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+PAGES = ('/', '/productos/celulares', '/productos/accesorios', '/servicios/tecnicos', '/ventas/',
+         '/clientes/', '/ventas/api/resumen')
+STATIC_RE = re.compile(r'/static/[^"\'\s)]+')
+
+
+def seed(db, productos):
+    from app.models import Accesorio, Categoria, Celular, Cliente, Marca, Servicio
+    # Nombres propios: create_app ya crea las marcas y categorías iniciales
+    marcas = [Marca(nombre=f'Marca de prueba {i}') for i in range(4)]
+    categoria = Categoria(nombre='Categoría de prueba')
+    db.session.add_all(marcas + [categoria])
+    db.session.flush()
+    for i in range(productos):
+        marca = marcas[i % len(marcas)]
+        db.session.add(Celular(modelo=f'Modelo {i}', marca_id=marca.id, precio=100 + i, stock=i % 20,
+                               estado='nuevo', descripcion=f'Celular de prueba {i}',
+                               especificaciones={'ram': '8GB', 'almacenamiento': '128GB', 'color': 'Negro'}))
+        db.session.add(Accesorio(nombre=f'Accesorio {i}', marca_id=marca.id, categoria_id=categoria.id,
+                                 precio=10 + i, stock=i % 30, codigo_producto=f'ACC-{i:05d}'))
+        db.session.add(Cliente(nombre=f'Cliente {i}', telefono=f'555{i:07d}'))
+    for i in range(productos // 5):
+        db.session.add(Servicio(tipo='reparacion', descripcion=f'Pantalla rota del equipo {i}',
+                                cliente_nombre=f'Cliente {i}', cliente_telefono=f'555{i:07d}',
+                                costo=50, estado='pendiente'))
+    db.session.commit()
+
+
+def measure(productos):
+    with tempfile.TemporaryDirectory() as tmp:
+        # Antes de importar la app: Config lee el entorno al importarse
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        os.environ['INIT_DB_ON_STARTUP'] = '1'
+        os.environ['TEMPLATE_CACHE_DIR'] = ''
+        from app import create_app
+        from app.models import db
+        from app.utils.compression import available_encodings
+        encodings = ('identity',) + available_encodings()
+        app = create_app()
+        with app.app_context():
+            seed(db, productos)
+        client = app.test_client()
+        client.post('/login', data={'username': 'admin', 'password': 'admin123'})
+        rows = []
+        for page in PAGES:
+            sizes = {}
+            static = set()
+            for encoding in encodings:
+                response = client.get(page, headers={'Accept-Encoding': encoding})
+                sizes[encoding] = len(response.get_data())
+                if encoding == 'identity':
+                    static = set(STATIC_RE.findall(response.get_data(as_text=True)))
+            static_bytes = {encoding: sum(len(client.get(url, headers={'Accept-Encoding': encoding}).get_data())
+                                          for url in static) for encoding in encodings}
+            rows.append((page, sizes, static_bytes, len(static)))
+    return encodings, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bytes transferidos por página')
+    parser.add_argument('--productos', type=int, default=500, help='Celulares, accesorios y clientes de prueba')
+    args = parser.parse_args()
+
+    encodings, rows = measure(args.productos)
+    print(f"Bytes del cuerpo por página ({args.productos} productos de cada tipo)\n")
+    print(f"{'página':24}" + ''.join(f"{encoding:>12}" for encoding in encodings) + f"{'estáticos ' + encodings[-1]:>20}")
+    totals = dict.fromkeys(encodings, 0)
+    for page, sizes, static_bytes, static_count in rows:
+        for encoding in encodings:
+            totals[encoding] += sizes[encoding]
+        print(f"{page:24}" + ''.join(f"{sizes[e]:12d}" for e in encodings)
+              + f"{static_bytes[encodings[-1]]:16d} ({static_count})")
+    print(f"{'total':24}" + ''.join(f"{totals[e]:12d}" for e in encodings))
+    for encoding in encodings[1:]:
+        print(f"{encoding}: {100 * (1 - totals[encoding] / totals['identity']):.0f}% menos que sin comprimir")
+
+
+if __name__ == '__main__':
+    main()
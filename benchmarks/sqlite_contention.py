@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Benchmark de contención lectura/escritura en SQLite
+
+Compara el perfil 'default' (rollback journal, sin pragmas) con el perfil
+'tuned' (WAL + pragmas de Config.SQLITE_PRAGMAS). Un hilo escribe ventas sin
+pausa mientras varios hilos ejecutan una consulta de reporte; se cuentan
+operaciones por segundo, latencias y errores "database is locked".
+
+Uso:
+    python benchmarks/sqlite_contention.py --readers 4 --seconds 5
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import OperationalError
+
+from app.config import Config
+from app.utils.database import sqlite_pragmas_listener
+
+SCHEMA = """
+CREATE TABLE venta (
+    id INTEGER PRIMARY KEY,
+    fecha_venta DATETIME NOT NULL,
+    total FLOAT NOT NULL,
+    metodo_pago VARCHAR(50)
+)
+"""
+REPORT = text("SELECT metodo_pago, COUNT(*), SUM(total) FROM venta GROUP BY metodo_pago")
+INSERT = text("INSERT INTO venta (fecha_venta, total, metodo_pago) VALUES (CURRENT_TIMESTAMP, :total, :metodo)")
+
+
+def make_engine(path, profile):
+    # timeout=0.1: sin pragmas el escritor/lectores fallan rápido en vez de esperar 5 s
+    engine = create_engine(f'sqlite:///{path}', connect_args={'timeout': 0.1})
+    if profile == 'tuned':
+        event.listen(engine, 'connect', sqlite_pragmas_listener(Config.SQLITE_PRAGMAS))
+    return engine
+
+
+def run(profile, readers, seconds, rows):
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = make_engine(os.path.join(tmp, 'bench.db'), profile)
+        with engine.begin() as conn:
+            conn.execute(text(SCHEMA))
+            conn.execute(INSERT, [{'total': i % 500, 'metodo': ('efectivo', 'tarjeta')[i % 2]}
+                                  for i in range(rows)])
+
+        stop = threading.Event()
+        stats = {'read': [], 'write': [], 'read_errors': 0, 'write_errors': 0}
+        lock = threading.Lock()
+
+        def writer():
+            i = 0
+            while not stop.is_set():
+                t = time.perf_counter()
+                try:
+                    with engine.begin() as conn:
+                        conn.execute(INSERT, {'total': i % 500, 'metodo': 'efectivo'})
+                    with lock:
+                        stats['write'].append(time.perf_counter() - t)
+                except OperationalError:
+                    with lock:
+                        stats['write_errors'] += 1
+                i += 1
+
+        def reader():
+            while not stop.is_set():
+                t = time.perf_counter()
+                try:
+                    with engine.connect() as conn:
+                        conn.execute(REPORT).fetchall()
+                    with lock:
+                        stats['read'].append(time.perf_counter() - t)
+                except OperationalError:
+                    with lock:
+                        stats['read_errors'] += 1
+
+        threads = [threading.Thread(target=writer)] + [threading.Thread(target=reader) for _ in range(readers)]
+        for t in threads:
+            t.start()
+        time.sleep(seconds)
+        stop.set()
+        for t in threads:
+            t.join()
+        engine.dispose()
+        return stats
+
+
+def _p(values, q):
+    if not values:
+        return float('nan')
+    return statistics.quantiles(values, n=100)[q - 1] * 1000 if len(values) > 1 else values[0] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Contención lectura/escritura en SQLite')
+    parser.add_argument('--readers', type=int, default=4, help='Hilos lectores')
+    parser.add_argument('--seconds', type=float, default=5, help='Duración por perfil')
+    parser.add_argument('--rows', type=int, default=50000, help='Filas iniciales')
+    args = parser.parse_args()
+
+    print(f"{'perfil':<8} {'escrituras/s':>12} {'p99 esc.':>9} {'err esc.':>8} "
+          f"{'lecturas/s':>10} {'p99 lect.':>9} {'err lect.':>9}")
+    for profile in ('default', 'tuned'):
+        s = run(profile, args.readers, args.seconds, args.rows)
+        print(f"{profile:<8} {len(s['write']) / args.seconds:12.0f} {_p(s['write'], 99):7.1f}ms "
+              f"{s['write_errors']:8d} {len(s['read']) / args.seconds:10.0f} "
+              f"{_p(s['read'], 99):7.1f}ms {s['read_errors']:9d}")
+
+
+if __name__ == '__main__':
+    main()
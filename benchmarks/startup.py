@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Benchmark de arranque de los workers
+
+Mide, con y sin INIT_DB_ON_STARTUP:
+  - arranque de un worker (import de run.py en un intérprete nuevo), que es
+    lo que paga cada worker al iniciar y en cada reciclaje de max_requests
+  - con gunicorn y gunicorn_config.py: tiempo hasta la primera respuesta
+    (arranque en frío) y latencia de reciclaje (pre_fork -> post_worker_init)
+
+Uso:
+    python benchmarks/startup.py --runs 5 --recycles 3
+"""
+
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+GUNICORN_CONFIG = os.path.join(ROOT, 'gunicorn_config.py')
+
+BOOT_SNIPPET = (
+    "import time; t = time.perf_counter(); import run; "
+    "print(time.perf_counter() - t)"
+)
+
+# Configuración temporal: reutiliza gunicorn_config.py y agrega hooks que
+# registran cuándo se crea cada worker y cuándo queda listo.
+WRAPPER_CONFIG = '''
+import time
+exec(open({config!r}).read())
+bind = '127.0.0.1:{port}'
+workers = 1
+max_requests = {max_requests}
+max_requests_jitter = 0
+accesslog = None
+preload_app = {preload}
+
+_pre_fork = globals().get('pre_fork')
+_post_worker_init = globals().get('post_worker_init')
+
+def _log(event, worker):
+    with open({log!r}, 'a') as f:
+        f.write(f"{{event}} {{worker.age}} {{time.time()}}\\n")
+
+def pre_fork(server, worker):
+    _log('fork', worker)
+    if _pre_fork:
+        _pre_fork(server, worker)
+
+def post_worker_init(worker):
+    if _post_worker_init:
+        _post_worker_init(worker)
+    _log('ready', worker)
+'''
+
+
+def _env(db_path, init_db):
+    env = dict(os.environ)
+    env['DATABASE_URL'] = f'sqlite:///{db_path}'
+    env['INIT_DB_ON_STARTUP'] = '1' if init_db else '0'
+    return env
+
+
+def _init_schema(env):
+    subprocess.run([sys.executable, '-m', 'flask', '--app', 'run', 'init-db'],
+                   cwd=ROOT, env=env, check=True, capture_output=True)
+
+
+def measure_worker_boot(runs, init_db):
+    """Tiempo de importar run.py (construir la app) en un intérprete nuevo"""
+    with tempfile.TemporaryDirectory() as tmp:
+        env = _env(os.path.join(tmp, 'bench.db'), init_db)
+        if not init_db:
+            _init_schema(env)
+        times = []
+        for _ in range(runs):
+            out = subprocess.run([sys.executable, '-c', BOOT_SNIPPET], cwd=ROOT,
+                                 env=env, check=True, capture_output=True, text=True)
+            times.append(float(out.stdout.strip().splitlines()[-1]))
+        return times
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _wait_ok(url, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=5) as resp:
+                if resp.status == 200:
+                    return True
+        except OSError:
+            time.sleep(0.02)
+    return False
+
+
+def _wait_ready(log_path, count, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        with open(log_path) as f:
+            if sum(1 for line in f if line.startswith('ready')) >= count:
+                return True
+        time.sleep(0.05)
+    return False
+
+
+def measure_gunicorn(init_db, recycles, max_requests=20, preload=False):
+    """Arranque en frío y latencia de reciclaje bajo gunicorn_config.py"""
+    with tempfile.TemporaryDirectory() as tmp:
+        env = _env(os.path.join(tmp, 'bench.db'), init_db)
+        if not init_db:
+            _init_schema(env)
+        port = _free_port()
+        log_path = os.path.join(tmp, 'workers.log')
+        config_path = os.path.join(tmp, 'gunicorn_bench.py')
+        with open(config_path, 'w') as f:
+            f.write(WRAPPER_CONFIG.format(config=GUNICORN_CONFIG, port=port, log=log_path,
+                                          max_requests=max_requests, preload=preload))
+
+        url = f'http://127.0.0.1:{port}/login'
+        start = time.time()
+        proc = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', config_path, 'run:app'],
+                                cwd=ROOT, env=env,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            if not _wait_ok(url):
+                raise RuntimeError('gunicorn no respondió')
+            cold_start = time.time() - start
+            # Forzar reciclajes agotando max_requests y esperar a cada worker nuevo
+            for n in range(2, recycles + 2):
+                for _ in range(max_requests):
+                    _wait_ok(url)
+                _wait_ready(log_path, n)
+        finally:
+            proc.terminate()
+            proc.wait(timeout=30)
+
+        events = {}
+        with open(log_path) as f:
+            for line in f:
+                event, age, ts = line.split()
+                events.setdefault(int(age), {})[event] = float(ts)
+        recycle = [e['ready'] - e['fork'] for age, e in sorted(events.items())
+                   if age > 1 and 'ready' in e and 'fork' in e]
+        return cold_start, recycle
+
+
+def _fmt(times):
+    if not times:
+        return 'n/a'
+    ms = [t * 1000 for t in times]
+    return f"mediana {statistics.median(ms):7.1f} ms  (min {min(ms):.1f}, max {max(ms):.1f}, n={len(ms)})"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de arranque de workers')
+    parser.add_argument('--runs', type=int, default=5, help='Arranques de worker por modo')
+    parser.add_argument('--recycles', type=int, default=3, help='Reciclajes bajo gunicorn por modo')
+    parser.add_argument('--skip-gunicorn', action='store_true', help='Solo medir el arranque de worker')
+    args = parser.parse_args()
+
+    for init_db in (True, False):
+        mode = 'INIT_DB_ON_STARTUP=1' if init_db else 'INIT_DB_ON_STARTUP=0'
+        print(f"\n== {mode}")
+        print(f"arranque de worker:   {_fmt(measure_worker_boot(args.runs, init_db))}")
+        if args.skip_gunicorn:
+            continue
+        cold_start, recycle = measure_gunicorn(init_db, args.recycles)
+        print(f"gunicorn en frío:     {cold_start * 1000:7.1f} ms hasta la primera respuesta")
+        print(f"gunicorn reciclaje:   {_fmt(recycle)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Benchmark de la primera petición a cada página (compilación de templates)
+
+Cada medición arranca un intérprete nuevo (como un worker recién creado o
+reciclado por max_requests), construye la app, inicia sesión como admin y
+mide la primera petición a cada página. Modos:
+
+  - sin caché: Jinja compila cada template en la primera petición
+  - caché de bytecode: TEMPLATE_CACHE_DIR ya llena (otro worker la llenó)
+  - precompilado: caché de bytecode + PRECOMPILE_TEMPLATES=1 (la carga se
+    hace al crear la app, antes de atender peticiones)
+
+Uso:
+    python benchmarks/templates.py --runs 5
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+PAGES = ('/', '/productos/celulares', '/productos/accesorios', '/productos/servicios-tv',
+         '/servicios/tecnicos', '/servicios/reportes', '/ventas/',
+         '/ventas/nueva', '/clientes/', '/admin/empleados')
+
+WORKER_SNIPPET = '''
+import json, sys, time
+t = time.perf_counter()
+from app import create_app
+app = create_app()
+boot = time.perf_counter() - t
+client = app.test_client()
+client.post('/login', data={'username': 'admin', 'password': 'admin123'})
+pages = {}
+for page in sys.argv[1:]:
+    t = time.perf_counter()
+    status = client.get(page).status_code
+    pages[page] = (time.perf_counter() - t, status)
+print(json.dumps({'boot': boot, 'pages': pages}))
+'''
+
+MODES = (
+    ('sin caché', {'TEMPLATE_CACHE_DIR': '', 'PRECOMPILE_TEMPLATES': '0'}),
+    ('caché de bytecode', {'PRECOMPILE_TEMPLATES': '0'}),
+    ('precompilado', {'PRECOMPILE_TEMPLATES': '1'}),
+)
+
+
+def run_worker(env):
+    out = subprocess.run([sys.executable, '-c', WORKER_SNIPPET, *PAGES], cwd=ROOT, env=env,
+                         check=True, capture_output=True, text=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def measure(runs):
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        base = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+                    INIT_DB_ON_STARTUP='1', TEMPLATE_CACHE_DIR=os.path.join(tmp, 'jinja_cache'))
+        # Crea la base y llena la caché de bytecode (el primer worker la paga)
+        run_worker(dict(base, PRECOMPILE_TEMPLATES='1'))
+        for mode, overrides in MODES:
+            env = dict(base, **overrides)
+            samples = [run_worker(env) for _ in range(runs)]
+            results[mode] = {
+                'boot': [s['boot'] for s in samples],
+                'pages': {page: [s['pages'][page][0] for s in samples] for page in PAGES},
+                'status': {page: samples[0]['pages'][page][1] for page in PAGES},
+            }
+    return results
+
+
+def _ms(times):
+    return statistics.median(times) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de la primera petición por página')
+    parser.add_argument('--runs', type=int, default=5, help='Workers nuevos por modo')
+    args = parser.parse_args()
+
+    results = measure(args.runs)
+    modes = [mode for mode, _ in MODES]
+    print(f"Primera petición por página (mediana de {args.runs} workers nuevos, ms)\n")
+    print(f"{'página':28}" + ''.join(f"{mode:>20}" for mode in modes))
+    for page in PAGES:
+        print(f"{page:28}" + ''.join(f"{_ms(results[mode]['pages'][page]):20.1f}" for mode in modes))
+    totals = {mode: sum(_ms(times) for times in results[mode]['pages'].values()) for mode in modes}
+    print(f"{'total':28}" + ''.join(f"{totals[mode]:20.1f}" for mode in modes))
+    print(f"{'create_app()':28}" + ''.join(f"{_ms(results[mode]['boot']):20.1f}" for mode in modes))
+    errors = {page: status for page, status in results[modes[0]]['status'].items() if status != 200}
+    if errors:
+        print(f"\nPáginas que no respondieron 200: {errors}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,38 @@
 # Configuración de Gunicorn para producción
+import multiprocessing
+import os
+import sys
 
-# Número de workers (2-4 x núcleos + 1)
-workers = 3
+# Los workers solo construyen la app: el esquema y los datos iniciales se
+# crean una vez con `flask --app run init-db` (fase release del Procfile).
+# Exportar INIT_DB_ON_STARTUP=1 para volver al arranque anterior.
+os.environ.setdefault('INIT_DB_ON_STARTUP', '0')
+
+# Cada worker compila los templates al arrancar (desde la caché de bytecode
+# en instance/jinja_cache) y no en la primera petición de cada página.
+os.environ.setdefault('PRECOMPILE_TEMPLATES', '1')
+
+# Preload: la app se construye una vez en el master y los workers la heredan
+# por fork (copy-on-write). Activar con GUNICORN_PRELOAD=1.
+preload_app = os.environ.get('GUNICORN_PRELOAD', '0') == '1'
+
+# Número de workers (2 x núcleos + 1 por defecto, WEB_CONCURRENCY lo fija)
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
 
 # Tipo de worker
 worker_class = 'gevent'
 
+# Greenlets simultáneos por worker
+worker_connections = int(os.environ.get('WORKER_CONNECTIONS', 1000))
+
+# Pool de conexiones por worker acorde a la concurrencia de greenlets, sin
+# superar DB_MAX_CONNECTIONS (límite del servidor) entre todos los workers.
+# Los greenlets que no consiguen conexión esperan DB_POOL_TIMEOUT segundos.
+if worker_class == 'gevent':
+    db_max_connections = int(os.environ.get('DB_MAX_CONNECTIONS', 100))
+    os.environ.setdefault('DB_POOL_SIZE', str(max(1, min(worker_connections, db_max_connections // workers))))
+    os.environ.setdefault('DB_MAX_OVERFLOW', '0')
+
 # Tiempo máximo de respuesta
 timeout = 60
 
@@ -22,4 +49,18 @@ loglevel = 'info'
 proc_name = 'tienda_celulares'
 
 # Configuración de rendimiento
-keepalive = 2
\ No newline at end of file
+keepalive = 2
+
+def post_fork(server, worker):
+    """Cada worker empieza con pools de conexiones vacíos"""
+    # Solo aplica si la app ya se cargó en el master (preload_app)
+    run = sys.modules.get('run')
+    if run is not None:
+        from app.utils.database import dispose_engines
+        dispose_engines(run.app)
+
+def post_worker_init(worker):
+    """Con workers gevent, psycopg2 debe ceder el hub mientras espera a PostgreSQL"""
+    if worker_class == 'gevent':
+        from app.utils.database import make_psycopg2_green
+        make_psycopg2_green()
@@ -1,16 +1,30 @@
-import os
+#!/usr/bin/env python3
+"""
+Script para migrar la base de datos existente al esquema actual
+"""
+
+import argparse
 import sys
-from flask import Flask
-from app import create_app
-from app.models import db
-from sqlalchemy import text
 
-# Crear la aplicación Flask
-app = create_app()
+# Flask, SQLAlchemy y la app se importan dentro de main(): importar este
+# módulo (o pedir --help) no construye la app ni abre la base de datos.
 
-# Establecer el contexto de la aplicación
-with app.app_context():
+def migrate(db):
+    """Aplica los cambios de esquema pendientes. Devuelve False si alguno falla."""
+    from sqlalchemy import text
+    
+    ok = True
     print("Iniciando migración de la base de datos...")
+    
+    # Crear primero las tablas que faltan (con todas sus columnas e índices):
+    # los pasos siguientes solo completan las tablas que ya existían
+    try:
+        db.create_all()
+        print("Todas las tablas han sido creadas/actualizadas.")
+    except Exception as e:
+        ok = False
+        print(f"Error al crear tablas: {e}")
+    
     try:
         # Verificar si la tabla Cliente existe
         with db.engine.connect() as conn:
@@ -33,6 +47,7 @@ with app.app_context():
                 conn.commit()
                 print("Tabla Cliente creada exitosamente.")
     except Exception as e:
+        ok = False
         print(f"Error al verificar/crear tabla Cliente: {e}")
     
     # Verificar si la columna cliente_id existe en la tabla venta
@@ -43,17 +58,242 @@ with app.app_context():
                 print("Columna cliente_id ya existe en la tabla venta.")
             except Exception:
                 print("Agregando columna cliente_id a la tabla venta...")
+                conn.rollback()
                 conn.execute(text("ALTER TABLE venta ADD COLUMN cliente_id INTEGER REFERENCES cliente(id)"))
                 conn.commit()
                 print("Columna cliente_id agregada exitosamente a la tabla venta.")
     except Exception as e:
+        ok = False
         print(f"Error al verificar/agregar columna cliente_id: {e}")
     
-    print("Migración completada.")
+    # Fecha de finalización de servicios técnicos (tiempos de respuesta)
+    try:
+        with db.engine.connect() as conn:
+            try:
+                conn.execute(text("SELECT fecha_finalizacion FROM servicio LIMIT 1"))
+                print("Columna fecha_finalizacion ya existe en la tabla servicio.")
+            except Exception:
+                print("Agregando columna fecha_finalizacion a la tabla servicio...")
+                conn.rollback()
+                conn.execute(text("ALTER TABLE servicio ADD COLUMN fecha_finalizacion DATETIME"))
+                conn.commit()
+                print("Columna fecha_finalizacion agregada exitosamente a la tabla servicio.")
+    except Exception as e:
+        ok = False
+        print(f"Error al verificar/agregar columna fecha_finalizacion: {e}")
     
-    # Crear tablas que faltan
+    # Email, teléfono normalizado y clave fonética de clientes (búsqueda y duplicados)
+    for column, ddl in (('email', 'VARCHAR(120)'), ('telefono_normalizado', 'VARCHAR(15)'),
+                        ('nombre_fonetico', 'VARCHAR(60)')):
+        try:
+            with db.engine.connect() as conn:
+                try:
+                    conn.execute(text(f"SELECT {column} FROM cliente LIMIT 1"))
+                    print(f"Columna {column} ya existe en la tabla cliente.")
+                except Exception:
+                    print(f"Agregando columna {column} a la tabla cliente...")
+                    conn.rollback()
+                    conn.execute(text(f"ALTER TABLE cliente ADD COLUMN {column} {ddl}"))
+                    conn.commit()
+                    print(f"Columna {column} agregada exitosamente a la tabla cliente.")
+        except Exception as e:
+            ok = False
+            print(f"Error al verificar/agregar columna {column}: {e}")
+    
+    # Índice por fecha de venta (listados y reportes por rango; archivo de ventas)
     try:
-        db.create_all()
-        print("Todas las tablas han sido creadas/actualizadas.")
+        with db.engine.begin() as conn:
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_venta_fecha_venta ON venta (fecha_venta)"))
+        print("Índice ix_venta_fecha_venta verificado.")
     except Exception as e:
-        print(f"Error al crear tablas: {e}")
\ No newline at end of file
+        ok = False
+        print(f"Error al crear el índice ix_venta_fecha_venta: {e}")
+    
+    # Índices de ventas por cliente (historial y resumen de compras)
+    try:
+        with db.engine.begin() as conn:
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_venta_cliente_fecha ON venta (cliente_id, fecha_venta)"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_venta_archivo_cliente_fecha "
+                              "ON venta_archivo (cliente_id, fecha_venta)"))
+        print("Índices de ventas por cliente verificados.")
+    except Exception as e:
+        ok = False
+        print(f"Error al crear los índices de ventas por cliente: {e}")
+    
+    # Índices de los listados de servicios (por técnico, estado y fecha de recepción)
+    try:
+        with db.engine.begin() as conn:
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_servicio_tecnico_estado_fecha "
+                              "ON servicio (tecnico_id, estado, fecha_recepcion)"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_servicio_estado_fecha "
+                              "ON servicio (estado, fecha_recepcion)"))
+        print("Índices de servicio verificados.")
+    except Exception as e:
+        ok = False
+        print(f"Error al crear los índices de servicio: {e}")
+    
+    # Índices del listado de clientes (por nombre y por teléfono normalizado) y
+    # de la detección de duplicados. Las columnas de los clientes existentes se
+    # llenan con los backfills cliente-telefono-normalizado y cliente-nombre-fonetico.
+    try:
+        with db.engine.begin() as conn:
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_cliente_nombre ON cliente (lower(nombre), id)"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_cliente_telefono_normalizado "
+                              "ON cliente (telefono_normalizado)"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_cliente_nombre_fonetico ON cliente (nombre_fonetico)"))
+        print("Índices de cliente verificados.")
+    except Exception as e:
+        ok = False
+        print(f"Error al crear los índices de cliente: {e}")
+    
+    # Versión del último cambio de celulares y accesorios (sincronización del
+    # catálogo). Los productos existentes quedan sin versión: se envían en la
+    # sincronización completa y reciben versión en su próximo cambio.
+    for table in ('celular', 'accesorio'):
+        try:
+            with db.engine.connect() as conn:
+                try:
+                    conn.execute(text(f"SELECT version_catalogo FROM {table} LIMIT 1"))
+                    print(f"Columna version_catalogo ya existe en la tabla {table}.")
+                except Exception:
+                    print(f"Agregando columna version_catalogo a la tabla {table}...")
+                    conn.rollback()
+                    conn.execute(text(f"ALTER TABLE {table} ADD COLUMN version_catalogo INTEGER"))
+                    conn.commit()
+                    print(f"Columna version_catalogo agregada exitosamente a la tabla {table}.")
+            with db.engine.begin() as conn:
+                conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{table}_version_catalogo "
+                                  f"ON {table} (version_catalogo)"))
+        except Exception as e:
+            ok = False
+            print(f"Error al verificar/agregar columna version_catalogo en {table}: {e}")
+    
+    print("Migración completada." if ok else "Migración completada con errores.")
+    
+    # Estado en_proceso (nombre anterior, que usaba el modal de edición) pasa a
+    # en_progreso antes de recalcular los contadores de servicios abiertos
+    try:
+        from app.utils.service_events import LEGACY_STATES
+        with db.engine.begin() as conn:
+            for anterior, actual in LEGACY_STATES.items():
+                result = conn.execute(text("UPDATE servicio SET estado = :actual WHERE estado = :anterior"),
+                                      {'actual': actual, 'anterior': anterior})
+                conn.execute(text("UPDATE servicio_evento SET estado_anterior = :actual "
+                                  "WHERE estado_anterior = :anterior"), {'actual': actual, 'anterior': anterior})
+                conn.execute(text("UPDATE servicio_evento SET estado_nuevo = :actual "
+                                  "WHERE estado_nuevo = :anterior"), {'actual': actual, 'anterior': anterior})
+                print(f"Estado {anterior} renombrado a {actual} en {result.rowcount} servicios.")
+    except Exception as e:
+        ok = False
+        print(f"Error al renombrar estados de servicio: {e}")
+    
+    # Contadores de servicios abiertos por técnico (tabla carga_tecnico)
+    try:
+        from app.utils.scheduler import rebuild_technician_loads
+        loads = rebuild_technician_loads()
+        print(f"Carga de técnicos recalculada ({len(loads)} con servicios abiertos).")
+    except Exception as e:
+        ok = False
+        print(f"Error al recalcular la carga de técnicos: {e}")
+    
+    # Histogramas de tiempos de respuesta (tabla tiempo_servicio)
+    try:
+        from app.utils.service_stats import rebuild_service_stats
+        finished = rebuild_service_stats()
+        print(f"Tiempos de respuesta recalculados ({finished} servicios terminados).")
+    except Exception as e:
+        ok = False
+        print(f"Error al recalcular los tiempos de respuesta: {e}")
+    
+    # Resumen de compras por cliente (tablas cliente_resumen y cliente_marca)
+    try:
+        from app.utils.client_stats import rebuild_client_stats
+        count = rebuild_client_stats()
+        print(f"Resumen de compras recalculado ({count} clientes con compras).")
+    except Exception as e:
+        ok = False
+        print(f"Error al recalcular el resumen de compras: {e}")
+    
+    # Índice de búsqueda de texto de servicios: se llena solo si es nuevo
+    try:
+        from sqlalchemy import inspect
+        from app.utils.service_search import SEARCH_TABLE, rebuild_search_index
+        if inspect(db.engine).has_table(SEARCH_TABLE):
+            print("Índice de búsqueda de servicios ya existe.")
+        else:
+            indexed = rebuild_search_index()
+            print(f"Índice de búsqueda de servicios creado ({indexed} servicios).")
+    except Exception as e:
+        ok = False
+        print(f"Error al crear el índice de búsqueda de servicios: {e}")
+    
+    return ok
+
+def backfill(db, args):
+    """Ejecuta, reanuda o simula un backfill registrado en app/utils/backfill.py"""
+    from app.models import BackfillProgreso
+    from app.utils.backfill import estimate_backfill, load_backfills, reset_checkpoint, run_backfill
+    
+    BACKFILLS = load_backfills()
+    if not args.name:
+        if not BACKFILLS:
+            print("No hay backfills registrados.")
+        for name, cls in sorted(BACKFILLS.items()):
+            print(f"{name}: {cls.description}")
+        return 0
+    if args.name not in BACKFILLS:
+        print(f"Error: No existe el backfill '{args.name}'.")
+        return 1
+    
+    BackfillProgreso.__table__.create(db.engine, checkfirst=True)
+    job = BACKFILLS[args.name](batch_size=args.batch_size, pause=args.pause)
+    if args.dry_run:
+        estimate = estimate_backfill(job, sample_batches=args.sample_batches)
+        print(f"{args.name}: {estimate['rows']} filas pendientes en {estimate['batches']} lotes de {job.batch_size}")
+        print(f"   Muestra: {estimate['sampled_rows']} filas ({estimate['sampled_changed']} cambiarían), "
+              f"{estimate['batch_seconds'] * 1000:.1f} ms por lote")
+        print(f"   Duración estimada: {estimate['estimated_seconds']:.1f} s (pausa de {job.pause} s entre lotes)")
+        print("   Simulación: no se guardó ningún cambio.")
+        return 0
+    
+    if args.restart:
+        reset_checkpoint(args.name)
+    print(f"Ejecutando backfill {args.name}...")
+    state = run_backfill(job)
+    if state.fecha_fin is None:
+        print(f"\nBackfill {args.name} detenido en id {state.ultimo_id}.")
+        return 1
+    print(f"\n✅ Backfill {args.name} completado: {state.procesadas} filas revisadas, "
+          f"{state.modificadas} modificadas.")
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Migración de la base de datos al esquema actual')
+    subparsers = parser.add_subparsers(dest='command')
+    backfill_parser = subparsers.add_parser('backfill', help='Ejecutar un backfill de datos por lotes')
+    backfill_parser.add_argument('name', nargs='?', help='Nombre del backfill (sin nombre, lista los disponibles)')
+    backfill_parser.add_argument('--dry-run', action='store_true',
+                                 help='Estimar la duración con lotes de muestra sin guardar cambios')
+    backfill_parser.add_argument('--sample-batches', type=int, default=3, help='Lotes de muestra en --dry-run')
+    backfill_parser.add_argument('--batch-size', type=int, help='Filas por lote')
+    backfill_parser.add_argument('--pause', type=float, help='Segundos de pausa entre lotes')
+    backfill_parser.add_argument('--restart', action='store_true',
+                                 help='Empezar desde el principio ignorando el punto de control')
+    args = parser.parse_args(argv)
+    
+    from app import create_app
+    from app.models import db
+    
+    # Crear la aplicación Flask (sin blueprints: no se atienden peticiones).
+    # Sin INIT_DB_ON_STARTUP: migrate() crea las tablas que faltan después de
+    # agregar las columnas nuevas.
+    app = create_app(register_blueprints=False, init_database=False)
+    
+    # Establecer el contexto de la aplicación
+    with app.app_context():
+        if args.command == 'backfill':
+            return backfill(db, args)
+        return 0 if migrate(db) else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
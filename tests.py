@@ -3,9 +3,22 @@
 Pruebas unitarias para la aplicación
 """
 
+import datetime
+import os
+import runpy
+import socket
+import subprocess
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
 import unittest
+from unittest import mock
+from sqlalchemy import func, inspect, text
 from app import create_app, db
-from app.models import Usuario, Marca, Categoria, Celular, Accesorio
+from app.config import config, TestingConfig
+from app.models import Usuario, Marca, Categoria, Celular, Accesorio, Venta
 from werkzeug.security import generate_password_hash
 
 class TestApp(unittest.TestCase):
@@ -72,5 +85,1921 @@ class TestApp(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertIn(b'Iniciar Sesi', response.data)  # Redirigido a login
 
+class LazyStartupConfig(TestingConfig):
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///./startup_test.db'
+    INIT_DB_ON_STARTUP = False
+
+class TestStartup(unittest.TestCase):
+    
+    def setUp(self):
+        """Registrar una configuración sin inicialización de la base de datos"""
+        patcher = mock.patch.dict(config, {'lazy_startup': LazyStartupConfig})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.app = create_app('lazy_startup')
+        self.addCleanup(self._drop_all)
+    
+    def _drop_all(self):
+        with self.app.app_context():
+            db.drop_all()
+    
+    def test_create_app_does_not_touch_database(self):
+        """Prueba que create_app no crea tablas cuando INIT_DB_ON_STARTUP está desactivado"""
+        with self.app.app_context():
+            self.assertNotIn('usuario', inspect(db.engine).get_table_names())
+    
+    def test_init_db_command(self):
+        """Prueba que `flask init-db` crea el esquema y los usuarios iniciales"""
+        result = self.app.test_cli_runner().invoke(args=['init-db'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        with self.app.app_context():
+            self.assertIsNotNone(Usuario.query.filter_by(username='admin').first())
+        # Ejecutarlo de nuevo no debe duplicar datos
+        result = self.app.test_cli_runner().invoke(args=['init-db'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        with self.app.app_context():
+            self.assertEqual(Usuario.query.filter_by(username='admin').count(), 1)
+    
+    def test_cli_and_migration_do_not_init_twice(self):
+        """Prueba que init-db y migrate_db inicializan la base una sola vez, sin depender de INIT_DB_ON_STARTUP"""
+        import migrate_db
+        with mock.patch('app.init_db') as init_db:
+            app = create_app('lazy_startup', init_database=True)
+            self.assertTrue(app.config['INIT_DB_ON_STARTUP'])
+            self.assertEqual(app.test_cli_runner().invoke(args=['init-db']).exit_code, 0)
+            self.assertEqual(init_db.call_count, 1)
+            
+            with mock.patch.object(migrate_db, 'migrate', return_value=True) as migrate:
+                self.assertEqual(migrate_db.main([]), 0)
+            migrate.assert_called_once()
+            self.assertEqual(init_db.call_count, 1)
+    
+    def test_migration_on_empty_database(self):
+        """Prueba que migrate_db crea el esquema completo en una base vacía y se puede repetir"""
+        import migrate_db
+        from app.config import Config
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'vacia.db')
+            with mock.patch.object(Config, 'SQLALCHEMY_DATABASE_URI', f'sqlite:///{path}'), \
+                    mock.patch.object(Config, 'TEMPLATE_CACHE_DIR', None):
+                self.assertEqual(migrate_db.main([]), 0)
+                self.assertEqual(migrate_db.main([]), 0)
+            with sqlite3.connect(path) as conn:
+                tables = {name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+                indexes = {name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type='index'")}
+            self.assertTrue({'venta', 'venta_archivo', 'servicio', 'celular', 'accesorio', 'cliente'} <= tables)
+            self.assertIn('ix_venta_archivo_cliente_fecha', indexes)
+
+class TestGunicornConfig(unittest.TestCase):
+    
+    def _load_config(self, **env):
+        with mock.patch.dict(os.environ, env):
+            return runpy.run_path(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gunicorn_config.py'))
+    
+    def test_worker_sizing_from_environment(self):
+        """Prueba que workers, worker_connections y preload se leen del entorno"""
+        cfg = self._load_config(WEB_CONCURRENCY='5', WORKER_CONNECTIONS='64', GUNICORN_PRELOAD='1')
+        self.assertEqual(cfg['workers'], 5)
+        self.assertEqual(cfg['worker_connections'], 64)
+        self.assertTrue(cfg['preload_app'])
+    
+    def test_post_fork_disposes_inherited_pool(self):
+        """Prueba que post_fork deja el pool del worker vacío cuando la app está precargada"""
+        app = create_app('testing', register_blueprints=False)
+        with app.app_context():
+            with db.engine.connect():
+                pass
+            pool = db.engine.pool
+            self.assertEqual(pool.checkedin(), 1)
+        cfg = self._load_config()
+        with mock.patch.dict(sys.modules, {'run': mock.Mock(app=app)}):
+            cfg['post_fork'](None, None)
+        with app.app_context():
+            self.assertIsNot(db.engine.pool, pool)
+            self.assertEqual(db.engine.pool.checkedin(), 0)
+            db.drop_all()
+
+class TestEngineProfile(unittest.TestCase):
+    
+    def test_sqlite_pragmas_applied_on_connect(self):
+        """Prueba que el perfil 'tuned' activa WAL y los pragmas en SQLite"""
+        app = create_app('testing', register_blueprints=False)
+        with app.app_context():
+            self.assertEqual(db.session.execute(text('PRAGMA journal_mode')).scalar(), 'wal')
+            self.assertEqual(db.session.execute(text('PRAGMA foreign_keys')).scalar(), 0)
+            self.assertEqual(db.session.execute(text('PRAGMA busy_timeout')).scalar(), 5000)
+            self.assertEqual(db.session.execute(text('PRAGMA synchronous')).scalar(), 1)  # NORMAL
+            db.session.remove()
+            db.drop_all()
+    
+    def test_pool_options_for_postgresql(self):
+        """Prueba que las opciones de pool solo se aplican a servidores y al perfil 'tuned'"""
+        from app.utils.database import engine_options
+        cfg = {key: getattr(TestingConfig, key) for key in dir(TestingConfig) if key.isupper()}
+        self.assertEqual(engine_options(cfg), {})
+        cfg['SQLALCHEMY_DATABASE_URI'] = 'postgresql://user@localhost/tienda'
+        options = engine_options(cfg)
+        self.assertEqual(options['pool_size'], TestingConfig.DB_POOL_SIZE)
+        self.assertTrue(options['pool_pre_ping'])
+        cfg['DB_ENGINE_PROFILE'] = 'default'
+        self.assertEqual(engine_options(cfg), {})
+
+class ReplicaConfig(TestingConfig):
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///./primary_test.db'
+    REPLICA_DATABASE_URL = 'sqlite:///./replica_test.db'
+    REPLICA_MAX_LAG_SECONDS = 60
+    REPLICA_LAG_CHECK_INTERVAL = 0
+
+class TestReadReplica(unittest.TestCase):
+    
+    def setUp(self):
+        """Base principal y réplica en dos archivos SQLite locales"""
+        patcher = mock.patch.dict(config, {'replica': ReplicaConfig})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # init_app registra el MetaData del bind en `db`, compartido entre apps
+        self.addCleanup(db.metadatas.pop, 'replica', None)
+        self.app = create_app('replica', register_blueprints=False)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        vendedor = Usuario(username='vend', password='x', nombre='Vendedor', rol='vendedor')
+        db.session.add(vendedor)
+        db.session.flush()
+        db.session.add(Venta(vendedor_id=vendedor.id, cliente_nombre='Ana', total=100.0, metodo_pago='efectivo'))
+        db.session.commit()
+        self.vendedor_id = vendedor.id
+    
+    def tearDown(self):
+        from app.utils import database
+        database._replica_status.clear()
+        db.session.remove()
+        db.drop_all()
+        with db.engines['replica'].begin() as conn:
+            for table in reversed(db.metadata.sorted_tables):
+                conn.execute(text(f'DROP TABLE IF EXISTS {table.name}'))
+            conn.execute(text(f'DROP TABLE IF EXISTS {database.REPLICA_MARKER_TABLE}'))
+        self.app_context.pop()
+    
+    def _add_sale_to_primary(self):
+        db.session.add(Venta(vendedor_id=self.vendedor_id, cliente_nombre='Luis', total=50.0, metodo_pago='tarjeta'))
+        db.session.commit()
+    
+    def test_reports_read_from_fresh_replica(self):
+        """Prueba que los reportes leen de la réplica cuando está al día"""
+        from app.utils.database import refresh_sqlite_replica
+        from app.utils.sales import get_sales_summary
+        refresh_sqlite_replica(self.app)
+        self._add_sale_to_primary()
+        with self.app.test_request_context():
+            self.assertEqual(get_sales_summary()['total_ventas'], 1)
+    
+    def test_lagging_replica_falls_back_to_primary(self):
+        """Prueba que una réplica atrasada o sin refrescar no se usa"""
+        from app.utils import database
+        from app.utils.sales import get_sales_summary
+        self._add_sale_to_primary()
+        with self.app.test_request_context():
+            # Réplica nunca refrescada: no tiene la tabla de control
+            self.assertEqual(get_sales_summary()['total_ventas'], 2)
+        database.refresh_sqlite_replica(self.app)
+        with db.engines['replica'].begin() as conn:
+            conn.execute(text(f'UPDATE {database.REPLICA_MARKER_TABLE} SET actualizado = actualizado - 3600'))
+        self._add_sale_to_primary()
+        with self.app.test_request_context():
+            self.assertEqual(get_sales_summary()['total_ventas'], 3)
+
+try:
+    import gevent
+    from psycopg2 import extensions as pg_extensions
+except ImportError:
+    gevent = None
+
+class FakePgConnection:
+    """Conexión psycopg2 simulada: espera datos en un socket antes de terminar la consulta"""
+    
+    def __init__(self):
+        self.client, self.server = socket.socketpair()
+    
+    def fileno(self):
+        return self.client.fileno()
+    
+    def poll(self):
+        self.client.setblocking(False)
+        try:
+            self.client.recv(1)
+            return pg_extensions.POLL_OK
+        except BlockingIOError:
+            return pg_extensions.POLL_READ
+    
+    def close(self):
+        self.client.close()
+        self.server.close()
+
+@unittest.skipIf(gevent is None, 'gevent y psycopg2 no están instalados')
+class TestGeventDatabaseIO(unittest.TestCase):
+    
+    def test_concurrent_requests_overlap_db_waits(self):
+        """Prueba que dos peticiones esperando a PostgreSQL no se bloquean entre sí"""
+        from app.utils.database import gevent_wait_callback
+        delay = 0.3
+        conns = [FakePgConnection(), FakePgConnection()]
+        self.addCleanup(lambda: [c.close() for c in conns])
+        
+        def respond(conn):
+            conn.server.send(b'x')
+        
+        def request(conn):
+            gevent.spawn_later(delay, respond, conn)
+            gevent_wait_callback(conn)
+            return time.perf_counter()
+        
+        start = time.perf_counter()
+        greenlets = [gevent.spawn(request, conn) for conn in conns]
+        gevent.joinall(greenlets, raise_error=True)
+        elapsed = time.perf_counter() - start
+        # Las esperas se solapan: el total es ~1 espera, no 2 seguidas
+        self.assertLess(elapsed, delay * 1.8)
+        self.assertLess(abs(greenlets[0].value - greenlets[1].value), delay / 2)
+    
+    def test_post_worker_init_installs_wait_callback(self):
+        """Prueba que los workers gevent instalan el callback cooperativo de psycopg2"""
+        from app.utils.database import gevent_wait_callback
+        cfg = runpy.run_path(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gunicorn_config.py'))
+        self.addCleanup(pg_extensions.set_wait_callback, None)
+        cfg['post_worker_init'](None)
+        self.assertIs(pg_extensions.get_wait_callback(), gevent_wait_callback)
+    
+    def test_gevent_worker_pool_sized_from_connections(self):
+        """Prueba que el pool se ajusta a worker_connections sin superar el límite del servidor"""
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gunicorn_config.py')
+        with mock.patch.dict(os.environ, {'WEB_CONCURRENCY': '4', 'WORKER_CONNECTIONS': '10',
+                                          'DB_MAX_CONNECTIONS': '100'}):
+            os.environ.pop('DB_POOL_SIZE', None)
+            runpy.run_path(path)
+            self.assertEqual(os.environ['DB_POOL_SIZE'], '10')
+        with mock.patch.dict(os.environ, {'WEB_CONCURRENCY': '4', 'WORKER_CONNECTIONS': '1000',
+                                          'DB_MAX_CONNECTIONS': '100'}):
+            os.environ.pop('DB_POOL_SIZE', None)
+            runpy.run_path(path)
+            self.assertEqual(os.environ['DB_POOL_SIZE'], '25')
+
+class TestOnlineBackup(unittest.TestCase):
+    
+    def setUp(self):
+        """Base SQLite en modo WAL con datos de ventas"""
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = tmp.name
+        self.db_path = os.path.join(self.tmp, 'tienda.db')
+        conn = sqlite3.connect(self.db_path)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('CREATE TABLE venta (id INTEGER PRIMARY KEY, total FLOAT, nota TEXT)')
+        conn.executemany('INSERT INTO venta (total, nota) VALUES (?, ?)',
+                         [(i, 'x' * 200) for i in range(5000)])
+        conn.commit()
+        conn.close()
+    
+    def test_backup_during_writes_is_consistent(self):
+        """Prueba que la copia por pasos es consistente aunque haya escrituras en curso"""
+        import backup
+        stop = threading.Event()
+        
+        def writer():
+            conn = sqlite3.connect(self.db_path, timeout=5)
+            while not stop.is_set():
+                conn.execute('INSERT INTO venta (total, nota) VALUES (1, ?)', ('y' * 200,))
+                conn.commit()
+            conn.close()
+        
+        thread = threading.Thread(target=writer)
+        thread.start()
+        steps = []
+        dest = os.path.join(self.tmp, 'copia.db')
+        try:
+            backup.online_backup(self.db_path, dest, pages=4, pause=0.001,
+                                 progress=lambda copied, total: steps.append((copied, total)))
+        finally:
+            stop.set()
+            thread.join()
+        
+        self.assertGreater(len(steps), 10)
+        self.assertEqual(steps[-1][0], steps[-1][1])
+        self.assertEqual(backup.integrity_check(dest), [])
+        conn = sqlite3.connect(dest)
+        self.assertEqual(conn.execute('PRAGMA journal_mode').fetchone()[0], 'delete')
+        self.assertGreaterEqual(conn.execute('SELECT COUNT(*) FROM venta').fetchone()[0], 5000)
+        conn.close()
+    
+    def test_backup_and_restore(self):
+        """Prueba backup_database y restore_database con la API de backup"""
+        import backup
+        backup_dir = os.path.join(self.tmp, 'backups')
+        self.assertTrue(backup.backup_database(self.db_path, backup_dir, progress=None))
+        [name] = [f for f in os.listdir(backup_dir) if f.endswith('.db')]
+        conn = sqlite3.connect(self.db_path)
+        conn.execute('DELETE FROM venta')
+        conn.commit()
+        conn.close()
+        cwd = os.getcwd()
+        os.chdir(self.tmp)
+        try:
+            self.assertTrue(backup.restore_database(os.path.join(backup_dir, name), self.db_path, progress=None))
+        finally:
+            os.chdir(cwd)
+        conn = sqlite3.connect(self.db_path)
+        self.assertEqual(conn.execute('SELECT COUNT(*) FROM venta').fetchone()[0], 5000)
+        conn.close()
+
+class TestIncrementalBackup(unittest.TestCase):
+    
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = tmp.name
+        self.db_path = os.path.join(self.tmp, 'tienda.db')
+        self.backup_dir = os.path.join(self.tmp, 'backups')
+        conn = sqlite3.connect(self.db_path)
+        conn.execute('CREATE TABLE venta (id INTEGER PRIMARY KEY, total FLOAT, nota TEXT)')
+        conn.executemany('INSERT INTO venta (total, nota) VALUES (?, ?)',
+                         [(i, 'x' * 200) for i in range(5000)])
+        conn.commit()
+        conn.close()
+        # restore_database deja la copia previa en ./backups
+        cwd = os.getcwd()
+        os.chdir(self.tmp)
+        self.addCleanup(os.chdir, cwd)
+    
+    def _chunk_files(self):
+        return [f for _, _, files in os.walk(os.path.join(self.backup_dir, 'chunks')) for f in files]
+    
+    def test_snapshots_share_unchanged_chunks(self):
+        """Prueba que un segundo snapshot solo agrega los bloques modificados"""
+        import backup
+        first = backup.backup_incremental(self.db_path, self.backup_dir, progress=None)
+        conn = sqlite3.connect(self.db_path)
+        conn.execute('UPDATE venta SET total = -1 WHERE id = 1')
+        conn.commit()
+        conn.close()
+        second = backup.backup_incremental(self.db_path, self.backup_dir, progress=None)
+        
+        self.assertGreater(len(first['chunks']), 10)
+        self.assertNotEqual(first['name'], second['name'])
+        new_chunks = set(second['chunks']) - set(first['chunks'])
+        self.assertTrue(0 < len(new_chunks) < len(second['chunks']) // 2)
+        self.assertEqual(len(self._chunk_files()), len(set(first['chunks']) | set(second['chunks'])))
+        self.assertEqual([m['name'] for m in backup.load_manifests(self.backup_dir)],
+                         [second['name'], first['name']])
+    
+    def test_restore_from_manifest(self):
+        """Prueba restaurar un snapshot reconstruido desde sus bloques"""
+        import backup
+        manifest = backup.backup_incremental(self.db_path, self.backup_dir, progress=None)
+        conn = sqlite3.connect(self.db_path)
+        conn.execute('DELETE FROM venta')
+        conn.commit()
+        conn.close()
+        manifest_path = os.path.join(self.backup_dir, 'snapshots', f"{manifest['name']}.json")
+        self.assertTrue(backup.restore_database(manifest_path, self.db_path, progress=None))
+        conn = sqlite3.connect(self.db_path)
+        self.assertEqual(conn.execute('SELECT COUNT(*) FROM venta').fetchone()[0], 5000)
+        conn.close()
+    
+    def test_corrupt_chunk_is_rejected(self):
+        """Prueba que un bloque dañado no se restaura"""
+        import backup, gzip
+        manifest = backup.backup_incremental(self.db_path, self.backup_dir, progress=None)
+        chunk = backup._chunk_path(self.backup_dir, manifest['chunks'][-1])
+        with open(chunk, 'wb') as f:
+            f.write(gzip.compress(b'basura'))
+        manifest_path = os.path.join(self.backup_dir, 'snapshots', f"{manifest['name']}.json")
+        self.assertFalse(backup.restore_database(manifest_path, self.db_path, progress=None))
+        conn = sqlite3.connect(self.db_path)
+        self.assertEqual(conn.execute('SELECT COUNT(*) FROM venta').fetchone()[0], 5000)
+        conn.close()
+    
+    def test_retention_and_garbage_collection(self):
+        """Prueba la retención por hora/día/semana y la limpieza de bloques huérfanos"""
+        import backup, datetime
+        start = datetime.datetime(2024, 3, 1, 12, 0)
+        # Un snapshot cada 6 horas durante 20 días, cada uno con un bloque propio
+        for i in range(80):
+            path = os.path.join(self.tmp, f'snap{i}.db')
+            with open(path, 'wb') as f:
+                f.write(b'comun' * 1000 + str(i).encode())
+            backup.store_snapshot(path, self.backup_dir, f'snap{i:03d}',
+                                  start + datetime.timedelta(hours=6 * i))
+        
+        manifests = backup.load_manifests(self.backup_dir)
+        keep = backup.select_retained(manifests, hourly=2, daily=3, weekly=2)
+        # Las 2 últimas horas, el último de cada uno de los 3 últimos días y de 2 semanas
+        self.assertEqual(keep, {'snap079', 'snap078', 'snap077', 'snap073', 'snap065'})
+        
+        deleted = backup.prune_snapshots(self.backup_dir, hourly=2, daily=3, weekly=2)
+        self.assertEqual(len(deleted), 75)
+        self.assertEqual({m['name'] for m in backup.load_manifests(self.backup_dir)}, keep)
+        self.assertEqual(len(self._chunk_files()), 5)
+
+class TestWalArchive(unittest.TestCase):
+    
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = tmp.name
+        self.db_path = os.path.join(self.tmp, 'tienda.db')
+        self.archive_dir = os.path.join(self.tmp, 'wal_archive')
+        self.conn = sqlite3.connect(self.db_path)
+        self.addCleanup(self.conn.close)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('CREATE TABLE venta (id INTEGER PRIMARY KEY, total FLOAT, nota TEXT)')
+        self.insert(1000)
+        cwd = os.getcwd()
+        os.chdir(self.tmp)
+        self.addCleanup(os.chdir, cwd)
+    
+    def insert(self, rows):
+        for i in range(rows):
+            self.conn.execute('INSERT INTO venta (total, nota) VALUES (?, ?)', (i, 'x' * 200))
+            self.conn.commit()
+    
+    def restored_count(self, until=None):
+        import backup
+        restored = os.path.join(self.tmp, 'restaurada.db')
+        self.assertTrue(backup.restore_point_in_time(self.archive_dir, restored, until, progress=None))
+        self.assertEqual(backup.integrity_check(restored), [])
+        conn = sqlite3.connect(restored)
+        try:
+            return conn.execute('SELECT COUNT(*) FROM venta').fetchone()[0]
+        finally:
+            conn.close()
+    
+    def test_point_in_time_restore_across_checkpoints(self):
+        """Prueba restaurar a momentos intermedios con el WAL reiniciado varias veces"""
+        import backup
+        archiver = backup.WalArchiver(self.db_path, self.archive_dir, checkpoint_frames=50)
+        self.addCleanup(archiver.close)
+        archiver.poll()
+        points = []
+        for _ in range(6):
+            self.insert(100)
+            archiver.poll()
+            points.append(datetime.datetime.now())
+        
+        entries = backup.load_wal_index(self.archive_dir)
+        self.assertGreater(len({e['checkpoint_seq'] for e in entries}), 2)
+        self.assertEqual(len(backup.load_manifests(self.archive_dir)), 1)
+        self.assertEqual(self.restored_count(points[1]), 1200)
+        self.assertEqual(self.restored_count(points[4]), 1500)
+        self.assertEqual(self.restored_count(), 1600)
+    
+    def test_gap_takes_new_base(self):
+        """Prueba que un reinicio del WAL sin archivar provoca un snapshot base nuevo"""
+        import backup
+        archiver = backup.WalArchiver(self.db_path, self.archive_dir)
+        self.addCleanup(archiver.close)
+        archiver.poll()
+        self.insert(10)
+        archiver.poll()
+        # Archivador sin transacción de lectura: el WAL se reinicia dos veces
+        archiver.close()
+        for _ in range(2):
+            self.insert(10)
+            self.conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        self.insert(10)
+        archiver.poll()
+        
+        self.assertEqual(len(backup.load_manifests(self.archive_dir)), 2)
+        self.insert(10)
+        archiver.poll()
+        self.assertEqual(self.restored_count(), 1050)
+
+class TestBackupVerification(unittest.TestCase):
+    
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = tmp.name
+        self.backup_dir = os.path.join(self.tmp, 'backups')
+        os.makedirs(self.backup_dir)
+    
+    def make_backup(self, name, orphan=False):
+        """Copia con las tablas que revisa verify y su checksum registrado"""
+        import backup
+        path = os.path.join(self.backup_dir, name)
+        conn = sqlite3.connect(path)
+        for table in ('venta', 'celular', 'accesorio', 'servicio_tv'):
+            conn.execute(f'CREATE TABLE {table} (id INTEGER PRIMARY KEY)')
+        conn.execute('CREATE TABLE detalle_venta (id INTEGER PRIMARY KEY, venta_id INTEGER)')
+        conn.executemany('INSERT INTO venta (id) VALUES (?)', [(i,) for i in range(1, 11)])
+        conn.executemany('INSERT INTO detalle_venta (venta_id) VALUES (?)', [(i,) for i in range(1, 11)])
+        if orphan:
+            conn.execute('INSERT INTO detalle_venta (venta_id) VALUES (99)')
+        conn.commit()
+        conn.close()
+        backup.record_checksum(path)
+        return path
+    
+    def test_verify_reports_each_backup(self):
+        """Prueba verify sobre copias buenas, alteradas, sin checksum y con huérfanos"""
+        import backup
+        for i in range(4):
+            self.make_backup(f'ok_{i}.db')
+        tampered = self.make_backup('alterada.db')
+        with open(tampered, 'r+b') as f:
+            f.seek(-10, os.SEEK_END)
+            f.write(b'!')
+        self.make_backup('huerfanos.db', orphan=True)
+        unrecorded = os.path.join(self.backup_dir, 'sin_checksum.db')
+        os.rename(self.make_backup('tmp.db'), unrecorded)
+        
+        results = {os.path.basename(r['path']): r for r in backup.verify_backups(self.backup_dir, workers=2)}
+        
+        self.assertEqual(len(results), 7)
+        self.assertEqual(results['ok_0.db']['problems'], [])
+        self.assertEqual(results['ok_0.db']['counts']['detalle_venta'], 10)
+        self.assertEqual(results['alterada.db']['problems'], ['el checksum no coincide con el manifiesto'])
+        self.assertEqual(results['huerfanos.db']['problems'], ['1 detalles de venta sin venta'])
+        self.assertEqual(results['sin_checksum.db']['problems'], [])
+        self.assertEqual(results['sin_checksum.db']['warnings'], ['sin checksum registrado'])
+    
+    def test_restore_refuses_checksum_mismatch(self):
+        """Prueba que restore no sobrescribe la base con una copia alterada"""
+        import backup
+        path = self.make_backup('copia.db')
+        with open(path, 'r+b') as f:
+            f.seek(-10, os.SEEK_END)
+            f.write(b'!')
+        db_path = os.path.join(self.tmp, 'tienda.db')
+        self.assertFalse(backup.restore_database(path, db_path, progress=None))
+        self.assertFalse(os.path.exists(db_path))
+
+class TestBackfill(unittest.TestCase):
+    
+    def setUp(self):
+        from app.utils.backfill import Backfill
+        
+        class NormalizarMetodoPago(Backfill):
+            name = 'normalizar_metodo_pago'
+            table = Venta.__table__
+            batch_size = 40
+            pause = 0
+            
+            def where(self):
+                return Venta.__table__.c.metodo_pago != func.lower(Venta.__table__.c.metodo_pago)
+            
+            def process(self, conn, ids):
+                venta = Venta.__table__
+                return conn.execute(venta.update().where(venta.c.id.in_(ids))
+                                    .values(metodo_pago=func.lower(venta.c.metodo_pago))).rowcount
+        
+        self.backfill_class = NormalizarMetodoPago
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        vendedor = Usuario(username='vendedor', password='x', nombre='Vendedor', rol='vendedor')
+        db.session.add(vendedor)
+        db.session.flush()
+        db.session.add_all(Venta(vendedor_id=vendedor.id, cliente_nombre=f'Cliente {i}',
+                                 metodo_pago='EFECTIVO' if i % 2 else 'tarjeta')
+                           for i in range(200))
+        db.session.commit()
+    
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+    
+    def count_upper(self):
+        return Venta.query.filter(Venta.metodo_pago == 'EFECTIVO').count()
+    
+    def test_resumes_from_checkpoint(self):
+        """Prueba que un backfill interrumpido sigue desde el último lote confirmado"""
+        from app.utils.backfill import run_backfill
+        reports = []
+        state = run_backfill(self.backfill_class(), max_batches=2,
+                             progress=lambda done, total, elapsed: reports.append((done, total)))
+        self.assertIsNone(state.fecha_fin)
+        self.assertEqual(state.procesadas, 80)
+        self.assertEqual(reports, [(40, 100), (80, 100)])
+        self.assertEqual(self.count_upper(), 20)
+        
+        state = run_backfill(self.backfill_class(), progress=None)
+        self.assertIsNotNone(state.fecha_fin)
+        self.assertEqual((state.procesadas, state.modificadas), (100, 100))
+        self.assertEqual(self.count_upper(), 0)
+    
+    def test_dry_run_estimates_without_changes(self):
+        """Prueba que la simulación estima con lotes de muestra y no guarda nada"""
+        from app.utils.backfill import estimate_backfill
+        estimate = estimate_backfill(self.backfill_class(), sample_batches=2)
+        self.assertEqual((estimate['rows'], estimate['batches'], estimate['sampled_rows']), (100, 3, 80))
+        self.assertEqual(estimate['sampled_changed'], 80)
+        self.assertGreater(estimate['estimated_seconds'], 0)
+        self.assertEqual(self.count_upper(), 100)
+
+class TestSalesArchive(unittest.TestCase):
+    
+    def setUp(self):
+        from app.models import DetalleVenta
+        self.app = create_app('testing')
+        self.client = self.app.test_client()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        vendedor = Usuario(username='vendedor', password=generate_password_hash('clave'),
+                           nombre='Vendedor', rol='admin')
+        db.session.add(vendedor)
+        db.session.flush()
+        # Una venta por mes durante 30 meses, la más reciente hace 10 días
+        self.now = datetime.datetime(2024, 6, 15)
+        for i in range(30):
+            venta = Venta(vendedor_id=vendedor.id, cliente_nombre=f'Cliente {i}',
+                          fecha_venta=self.now - datetime.timedelta(days=10 + 30 * (29 - i)),
+                          total=100.0 + i, metodo_pago=('efectivo', 'tarjeta')[i % 2],
+                          estado='cancelada' if i == 3 else 'completada')
+            db.session.add(venta)
+            db.session.flush()
+            db.session.add(DetalleVenta(venta_id=venta.id, tipo_producto='accesorio', producto_id=1,
+                                        cantidad=1, precio_unitario=venta.total))
+        db.session.commit()
+    
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+    
+    def archive(self):
+        from app.utils.archive import archive_sales
+        return archive_sales(12, batch_size=4, pause=0, now=self.now)
+    
+    def test_archive_moves_old_closed_sales(self):
+        """Prueba que se archivan por lotes las ventas cerradas con más de 12 meses"""
+        from app.models import DetalleVenta, VentaArchivo, DetalleVentaArchivo
+        from app.utils.archive import months_ago
+        self.assertEqual(months_ago(datetime.datetime(2024, 3, 31), 1), datetime.datetime(2024, 2, 29))
+        cutoff = months_ago(self.now, 12)
+        old = Venta.query.filter(Venta.fecha_venta < cutoff).count()
+        
+        self.assertEqual(self.archive(), old)
+        self.assertEqual(Venta.query.count(), 30 - old)
+        self.assertEqual(VentaArchivo.query.count(), old)
+        self.assertEqual(DetalleVentaArchivo.query.count(), old)
+        self.assertEqual(DetalleVenta.query.count(), 30 - old)
+        self.assertLess(db.session.query(db.func.max(VentaArchivo.fecha_venta)).scalar(), cutoff)
+        self.assertEqual(self.archive(), 0)
+    
+    def test_reads_include_archive_only_when_needed(self):
+        """Prueba listado, detalle y resumen con ventas archivadas"""
+        from app.models import VentaArchivo
+        from app.utils.archive import paginate_sales, sale_models
+        from app.utils.sales import get_sales_summary
+        before = get_sales_summary()
+        self.archive()
+        
+        with self.app.test_request_context():
+            self.assertEqual(get_sales_summary(), before)
+            recent = self.now - datetime.timedelta(days=90)
+            self.assertEqual(sale_models(recent), [Venta])
+            self.assertEqual(get_sales_summary(recent)['total_ventas'], 3)
+        
+        live = paginate_sales(1, 7)
+        self.assertEqual(live.total, Venta.query.count())
+        self.assertFalse(any(v.archivada for v in live.items))
+        pages = [paginate_sales(page, 7, include_archive=True) for page in range(1, 6)]
+        self.assertEqual(pages[0].total, 30)
+        self.assertEqual(pages[0].pages, 5)
+        names = [venta.cliente_nombre for pagination in pages for venta in pagination.items]
+        self.assertEqual(names, [f'Cliente {i}' for i in range(29, -1, -1)])
+        self.assertFalse(pages[0].items[0].archivada)
+        self.assertTrue(pages[-1].items[-1].archivada)
+        
+        self.client.post('/login', data={'username': 'vendedor', 'password': 'clave'})
+        archived = VentaArchivo.query.first()
+        response = self.client.get(f'/ventas/{archived.id}/detalles')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.get_json()['archivada'])
+        response = self.client.get('/ventas/?desde=2022-01-01&hasta=2022-12-31')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Archivada', response.data)
+        self.assertIn(b'Archivada', self.client.get('/ventas/?archivo=1').data)
+        self.assertEqual(self.client.get('/ventas/999/detalles').status_code, 404)
+        
+        # El listado por defecto no consulta el archivo
+        from sqlalchemy import event
+        statements = []
+        capture = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', capture)
+        try:
+            response = self.client.get('/ventas/')
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', capture)
+        self.assertNotIn(b'Archivada', response.data)
+        self.assertFalse([s for s in statements if 'venta_archivo' in s])
+        summary = self.client.get('/ventas/api/resumen?desde=2024-01-01').get_json()
+        self.assertEqual(summary['total_ventas'], 6)
+
+    def test_archive_listing_merges_by_date(self):
+        """Prueba que una venta abierta antigua queda en su lugar entre las archivadas al incluir el archivo"""
+        from app.utils.archive import paginate_sales
+        abierta = Venta.query.filter_by(cliente_nombre='Cliente 1').one()
+        abierta.estado = 'pendiente'
+        db.session.commit()
+        self.archive()
+        self.assertIsNotNone(db.session.get(Venta, abierta.id))
+        
+        pages = [paginate_sales(page, 7, include_archive=True) for page in range(1, 6)]
+        ventas = [venta for pagination in pages for venta in pagination.items]
+        self.assertEqual([venta.cliente_nombre for venta in ventas], [f'Cliente {i}' for i in range(29, -1, -1)])
+        self.assertEqual([venta.archivada for venta in ventas[-3:]], [True, False, True])
+        self.assertEqual(pages[0].total, 30)
+    
+    def test_delete_client_detaches_archived_sales(self):
+        """Prueba que eliminar un cliente desvincula sus ventas activas y archivadas (también con claves foráneas)"""
+        from app.config import Config
+        from app.models import Cliente, VentaArchivo
+        cliente = Cliente(nombre='Ana')
+        db.session.add(cliente)
+        db.session.flush()
+        for venta in Venta.query.filter(Venta.cliente_nombre.in_(['Cliente 0', 'Cliente 29'])):
+            venta.cliente_id = cliente.id
+        db.session.commit()
+        cliente_id = cliente.id
+        self.archive()
+        self.assertEqual(VentaArchivo.query.filter_by(cliente_id=cliente_id).count(), 1)
+        
+        # Como en PostgreSQL, que siempre verifica las claves foráneas
+        with mock.patch.dict(Config.SQLITE_PRAGMAS, foreign_keys='ON'):
+            app = create_app('testing')
+            client = app.test_client()
+            client.post('/login', data={'username': 'vendedor', 'password': 'clave'})
+            response = client.delete(f'/clientes/{cliente_id}')
+        self.assertEqual(response.status_code, 200)
+        db.session.expire_all()
+        self.assertIsNone(db.session.get(Cliente, cliente_id))
+        self.assertEqual(Venta.query.filter(Venta.cliente_id.isnot(None)).count(), 0)
+        self.assertEqual(VentaArchivo.query.filter(VentaArchivo.cliente_id.isnot(None)).count(), 0)
+        self.assertEqual(VentaArchivo.query.filter_by(cliente_nombre='Cliente 0').count(), 1)
+
+class TestTechnicianScheduler(unittest.TestCase):
+    
+    def setUp(self):
+        self.app = create_app('testing')
+        self.client = self.app.test_client()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.tecnicos = [Usuario(username=f'tecnico{i}', password=generate_password_hash('clave'),
+                                 nombre=f'Técnico {i}', rol='tecnico') for i in range(3)]
+        db.session.add_all(self.tecnicos)
+        db.session.commit()
+    
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+    
+    def servicio(self, tecnico=None, tipo='reparación', dias_entrega=None, estado='pendiente', hace=0):
+        from app.models import Servicio
+        servicio = Servicio(tipo=tipo, descripcion='Pantalla', cliente_nombre='Ana', costo=10.0,
+                            estado=estado, tecnico_id=tecnico.id if tecnico else None,
+                            fecha_recepcion=datetime.datetime(2024, 1, 10) - datetime.timedelta(days=hace),
+                            fecha_entrega_estimada=datetime.datetime(2024, 1, 10) + datetime.timedelta(days=dias_entrega)
+                            if dias_entrega is not None else None)
+        db.session.add(servicio)
+        return servicio
+    
+    def loads(self):
+        from app.models import CargaTecnico
+        db.session.expire_all()
+        return {c.tecnico_id: c.abiertos for c in CargaTecnico.query.all() if c.abiertos}
+    
+    def test_load_counters_follow_changes(self):
+        """Prueba que los contadores de carga siguen altas, cambios de estado, reasignaciones y bajas"""
+        from app.utils.scheduler import rebuild_technician_loads
+        a, b, _ = self.tecnicos
+        s1 = self.servicio(a)
+        s2 = self.servicio(a, estado='en_progreso')
+        s3 = self.servicio(b)
+        self.servicio(b, estado='completado')
+        db.session.commit()
+        self.assertEqual(self.loads(), {a.id: 2, b.id: 1})
+        
+        # Objetos expirados tras el commit: el valor anterior se carga al asignar
+        s1.estado = 'completado'
+        s3.tecnico_id = a.id
+        db.session.commit()
+        self.assertEqual(self.loads(), {a.id: 2})
+        db.session.delete(s2)
+        db.session.commit()
+        self.assertEqual(self.loads(), {a.id: 1})
+        self.assertEqual(rebuild_technician_loads(), {a.id: 1})
+    
+    def test_priority_queue_and_balanced_assignment(self):
+        """Prueba el orden de la cola y el reparto al técnico menos cargado"""
+        from app.utils.scheduler import assign_pending, pending_queue, suggest_technician
+        a, b, c = self.tecnicos
+        self.servicio(a)
+        self.servicio(a)
+        self.servicio(b)
+        late = self.servicio(dias_entrega=5, hace=1)
+        urgent = self.servicio(dias_entrega=1)
+        old_install = self.servicio(tipo='instalación', hace=3)
+        repair = self.servicio(hace=3)
+        db.session.commit()
+        
+        self.assertEqual(pending_queue().all(), [urgent, late, repair, old_install])
+        self.assertEqual(suggest_technician(), c.id)
+        assigned = [tecnico_id for _, tecnico_id in assign_pending()]
+        self.assertEqual(assigned, [c.id, b.id, c.id, a.id])
+        self.assertEqual(self.loads(), {a.id: 3, b.id: 2, c.id: 2})
+    
+    def test_next_job_endpoint(self):
+        """Prueba el siguiente trabajo de un técnico y tomar uno sin asignar"""
+        a = self.tecnicos[0]
+        suggestion = self.servicio(dias_entrega=2)
+        db.session.commit()
+        self.client.post('/login', data={'username': 'tecnico0', 'password': 'clave'})
+        
+        data = self.client.get('/servicios/tecnicos/siguiente').get_json()
+        self.assertFalse(data['asignado'])
+        self.assertEqual(data['servicio']['id'], suggestion.id)
+        self.assertEqual(self.client.post(f'/servicios/tecnicos/{suggestion.id}/tomar').status_code, 200)
+        self.assertEqual(self.client.post(f'/servicios/tecnicos/{suggestion.id}/tomar').status_code, 409)
+        self.assertEqual(self.loads(), {a.id: 1})
+        data = self.client.get('/servicios/tecnicos/siguiente').get_json()
+        self.assertTrue(data['asignado'])
+        self.assertEqual(data['servicio']['id'], suggestion.id)
+
+    def test_edit_modal_state_keeps_load(self):
+        """Prueba que los estados del modal de edición son válidos y no bajan la carga del técnico"""
+        import re
+        from app.utils.service_events import SERVICE_STATES
+        a = self.tecnicos[0]
+        servicio = self.servicio(a)
+        db.session.commit()
+        self.client.post('/login', data={'username': 'tecnico0', 'password': 'clave'})
+        
+        page = self.client.get('/servicios/tecnicos', query_string={'estado': 'todos'}).get_data(as_text=True)
+        modal = re.search(r'<select id="editar-estado".*?</select>', page, re.S).group(0)
+        opciones = re.findall(r'value="([^"]+)"', modal)
+        self.assertIn('en_progreso', opciones)
+        self.assertTrue(set(opciones) <= set(SERVICE_STATES))
+        
+        url = f'/servicios/servicio_tecnico/{servicio.id}'
+        self.assertEqual(self.client.put(url, json={'estado': 'en_progreso'}).status_code, 200)
+        self.assertEqual(self.loads(), {a.id: 1})
+        # Valor que enviaba el modal anterior: se toma como en_progreso
+        self.assertEqual(self.client.put(url, json={'estado': 'en_proceso'}).status_code, 200)
+        self.assertEqual(self.client.put(url, json={'estado': 'cerrado'}).status_code, 400)
+        db.session.expire_all()
+        self.assertEqual(servicio.estado, 'en_progreso')
+        self.assertEqual(self.loads(), {a.id: 1})
+        
+        page = self.client.get('/servicios/tecnicos').get_data(as_text=True)
+        self.assertRegex(page, r'badge\s+bg-info\s*">\s*En Progreso')
+    
+    def test_service_list_keyset_pages(self):
+        """Prueba el listado por cursor: solo abiertos por defecto y sin saltos con fechas repetidas"""
+        from app.routes import servicios as servicios_routes
+        a = self.tecnicos[0]
+        abiertos = [self.servicio(a, hace=i // 2) for i in range(7)]  # fechas repetidas de a pares
+        self.servicio(a, estado='completado')
+        self.servicio(estado='en_progreso')
+        db.session.commit()
+        self.client.post('/login', data={'username': 'tecnico0', 'password': 'clave'})
+        
+        with mock.patch.object(servicios_routes, 'SERVICES_PER_PAGE', 3):
+            ids, cursor = [], None
+            while True:
+                data = self.client.get('/servicios/api/mis-servicios',
+                                       query_string={'despues': cursor} if cursor else {}).get_json()
+                ids += [s['id'] for s in data['servicios']]
+                cursor = data['siguiente']
+                if not cursor:
+                    break
+            expected = sorted(abiertos, key=lambda s: (s.fecha_recepcion, s.id), reverse=True)
+            self.assertEqual(ids, [s.id for s in expected])
+            
+            data = self.client.get('/servicios/api/tecnicos', query_string={'estado': 'todos'}).get_json()
+            self.assertEqual(len(data['servicios']), 3)
+            self.assertEqual(data['filtros'], {'estado': 'todos'})
+            response = self.client.get('/servicios/tecnicos/mis-servicios')
+            self.assertEqual(response.status_code, 200)
+            self.assertIn(b'despues=', response.data)
+        self.assertEqual(self.client.get('/servicios/api/tecnicos?despues=x').status_code, 400)
+    
+    def test_service_list_uses_index(self):
+        """Prueba que el listado de abiertos de un técnico usa el índice compuesto"""
+        from app.models import Servicio
+        from app.utils.scheduler import OPEN_STATES
+        query = Servicio.query.filter(Servicio.tecnico_id == 1, Servicio.estado.in_(OPEN_STATES)) \
+            .order_by(Servicio.fecha_recepcion.desc(), Servicio.id.desc()).limit(15)
+        sql = str(query.statement.compile(dialect=db.engine.dialect, compile_kwargs={'literal_binds': True}))
+        plan = ' '.join(str(row[-1]) for row in db.session.execute(text('EXPLAIN QUERY PLAN ' + sql)))
+        self.assertIn('ix_servicio_tecnico_estado_fecha', plan)
+
+class TestServiceReports(unittest.TestCase):
+    
+    def setUp(self):
+        self.app = create_app('testing')
+        self.client = self.app.test_client()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.tecnicos = [Usuario(username=f'tecnico{i}', password='x', nombre=f'Técnico {i}', rol='tecnico')
+                         for i in range(2)]
+        db.session.add_all(self.tecnicos)
+        db.session.add(Usuario(username='gerente', password=generate_password_hash('clave'),
+                               nombre='Gerente', rol='gerente'))
+        db.session.commit()
+    
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+    
+    def terminar(self, tecnico, horas, tipo='reparación', dias_entrega=None):
+        """Servicio recibido el 10/01/2024 y completado `horas` después"""
+        from app.models import Servicio
+        from app.utils.service_stats import update_finish_date
+        recepcion = datetime.datetime(2024, 1, 10, 9)
+        servicio = Servicio(tipo=tipo, descripcion='Pantalla', cliente_nombre='Ana', costo=10.0,
+                            tecnico_id=tecnico.id, fecha_recepcion=recepcion, estado='completado',
+                            fecha_entrega_estimada=datetime.date(2024, 1, 10) + datetime.timedelta(days=dias_entrega)
+                            if dias_entrega is not None else None)
+        update_finish_date(servicio, now=recepcion + datetime.timedelta(hours=horas))
+        db.session.add(servicio)
+        return servicio
+    
+    def histogram(self):
+        from app.models import TiempoServicio
+        db.session.expire_all()
+        return {(t.dimension, t.clave, t.cubo): t.cantidad for t in TiempoServicio.query.all() if t.cantidad}
+    
+    def test_percentiles_from_buckets(self):
+        """Prueba la interpolación de percentiles dentro de los cubos"""
+        from app.utils.service_stats import TURNAROUND_BUCKETS, percentile
+        counts = [0] * (len(TURNAROUND_BUCKETS) + 1)
+        self.assertIsNone(percentile(counts, 0.5))
+        counts[TURNAROUND_BUCKETS.index(48)] = 10  # 10 servicios entre 36 y 48 h
+        self.assertAlmostEqual(percentile(counts, 0.5), 42)
+        counts[-1] = 1  # uno de más de 720 h
+        self.assertEqual(percentile(counts, 0.99), 720)
+    
+    def test_stats_follow_state_changes(self):
+        """Prueba que los histogramas siguen finalizaciones, reaperturas, reasignaciones y bajas"""
+        from app.utils.service_stats import rebuild_service_stats, turnaround_report
+        a, b = self.tecnicos
+        for horas in (3, 5, 30, 100):
+            self.terminar(a, horas)
+        lento = self.terminar(b, 30, tipo='instalación')
+        vencido = self.terminar(b, 50, dias_entrega=1)  # entrega estimada hasta el 11/01 23:59
+        db.session.commit()
+        
+        report = turnaround_report()
+        self.assertEqual(report['total']['total'], 6)
+        por_tecnico = {t['nombre']: t for t in report['tecnicos']}
+        self.assertEqual(por_tecnico['Técnico 0']['fuera_de_plazo'], 1)  # 100 h > 72 h
+        self.assertEqual(por_tecnico['Técnico 1']['fuera_de_plazo'], 2)  # instalación > 24 h y vencido
+        self.assertEqual(por_tecnico['Técnico 0']['p50'], 8)  # 2.º de 4: fin del cubo 4-8 h
+        self.assertEqual({t['tipo']: t['total'] for t in report['tipos']}, {'reparación': 5, 'instalación': 1})
+        
+        # Objetos expirados tras el commit: el valor anterior se carga al asignar
+        lento.tecnico_id = a.id
+        vencido.estado = 'en_progreso'
+        vencido.fecha_finalizacion = None
+        db.session.commit()
+        report = turnaround_report()
+        self.assertEqual(report['total']['total'], 5)
+        self.assertEqual([t['nombre'] for t in report['tecnicos']], ['Técnico 0'])
+        
+        db.session.delete(lento)
+        db.session.commit()
+        incremental = self.histogram()
+        self.assertEqual(rebuild_service_stats(), 4)
+        self.assertEqual(self.histogram(), incremental)
+    
+    def test_report_page(self):
+        """Prueba el reporte de servicios con conteos por estado y tiempos de respuesta"""
+        from app.models import Servicio
+        self.terminar(self.tecnicos[0], 20)
+        db.session.add(Servicio(tipo='reparación', descripcion='Batería', cliente_nombre='Luis',
+                                costo=5.0, estado='pendiente'))
+        db.session.commit()
+        self.client.post('/login', data={'username': 'gerente', 'password': 'clave'})
+        
+        response = self.client.get('/servicios/reportes')
+        self.assertEqual(response.status_code, 200)
+        html = response.get_data(as_text=True)
+        self.assertIn('Tiempo de Respuesta', html)
+        self.assertIn('Técnico 0', html)
+        self.assertIn('18.0 h', html)  # p50 interpolado en el cubo 12-24 h
+
+class TestServiceEvents(unittest.TestCase):
+    
+    def setUp(self):
+        self.app = create_app('testing')
+        self.client = self.app.test_client()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        db.session.add(Usuario(username='gerente', password=generate_password_hash('clave'),
+                               nombre='Gerente', rol='gerente'))
+        db.session.commit()
+    
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+    
+    def servicio(self, **kwargs):
+        from app.models import Servicio
+        servicio = Servicio(tipo='reparación', descripcion='Pantalla', cliente_nombre='Ana', costo=10.0,
+                            estado='pendiente', fecha_recepcion=datetime.datetime(2024, 1, 10, 9), **kwargs)
+        db.session.add(servicio)
+        db.session.commit()
+        return servicio.id
+    
+    def test_timeline_records_changes(self):
+        """Prueba que estados, notas y cancelaciones quedan en el historial paginado"""
+        from app.models import Servicio
+        servicio_id = self.servicio()
+        self.client.post('/login', data={'username': 'gerente', 'password': 'clave'})
+        
+        self.client.put(f'/servicios/servicio_tecnico/{servicio_id}',
+                        json={'estado': 'en_progreso', 'nota': 'Cambio de pantalla'})
+        self.assertEqual(self.client.post(f'/servicios/tecnicos/{servicio_id}/eventos',
+                                          json={'texto': 'Repuesto pedido'}).status_code, 201)
+        self.client.post(f'/servicios/tecnicos/{servicio_id}/cancelar',
+                         data={'motivo_cancelacion': 'Cliente desistió'})
+        servicio = db.session.get(Servicio, servicio_id)
+        self.assertEqual(servicio.estado, 'cancelado')
+        self.assertIsNone(servicio.notas_tecnicas)
+        
+        eventos, cursor = [], None
+        while True:
+            data = self.client.get(f'/servicios/tecnicos/{servicio_id}/eventos',
+                                   query_string={'por_pagina': 2, **({'despues': cursor} if cursor else {})}).get_json()
+            eventos += data['eventos']
+            cursor = data['siguiente']
+            if not cursor:
+                break
+        self.assertEqual([(e['tipo'], e['estado_nuevo'], e['texto']) for e in eventos], [
+            ('cancelacion', 'cancelado', 'Cliente desistió'),
+            ('nota', None, 'Repuesto pedido'),
+            ('nota', None, 'Cambio de pantalla'),
+            ('estado', 'en_progreso', None),
+        ])
+        self.assertEqual({e['usuario'] for e in eventos}, {'Gerente'})
+        
+        # Al borrar el servicio se borra su historial
+        self.client.delete(f'/servicios/servicio_tecnico/{servicio_id}')
+        from app.models import ServicioEvento
+        self.assertEqual(ServicioEvento.query.count(), 0)
+    
+    def test_legacy_notes_backfill(self):
+        """Prueba que el backfill mueve notas_tecnicas y las cancelaciones concatenadas al historial"""
+        from app.models import Servicio, ServicioEvento
+        from app.utils.backfill import load_backfills, run_backfill
+        notas = ("Pantalla rota\nRevisar batería\n"
+                 "[CANCELADO] 2024-01-12 15:30 - Servicio cancelado - Motivo: Muy caro")
+        con_notas = self.servicio(notas_tecnicas=notas)
+        sin_notas = self.servicio()
+        
+        state = run_backfill(load_backfills()['servicio-notas-eventos'](pause=0), progress=None)
+        self.assertEqual((state.procesadas, state.modificadas), (1, 1))
+        db.session.expire_all()
+        self.assertIsNone(db.session.get(Servicio, con_notas).notas_tecnicas)
+        eventos = ServicioEvento.query.order_by(ServicioEvento.fecha).all()
+        self.assertEqual([(e.servicio_id, e.tipo, e.fecha, e.texto) for e in eventos], [
+            (con_notas, 'nota', datetime.datetime(2024, 1, 10, 9), 'Pantalla rota\nRevisar batería'),
+            (con_notas, 'cancelacion', datetime.datetime(2024, 1, 12, 15, 30), 'Muy caro'),
+        ])
+        self.assertEqual(ServicioEvento.query.filter_by(servicio_id=sin_notas).count(), 0)
+
+class TestServiceSearch(unittest.TestCase):
+    
+    def setUp(self):
+        self.app = create_app('testing')
+        self.client = self.app.test_client()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.tecnico = Usuario(username='tecnico', password=generate_password_hash('clave'),
+                               nombre='Técnico', rol='tecnico')
+        db.session.add(self.tecnico)
+        db.session.commit()
+    
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+    
+    def servicio(self, descripcion, cliente='Ana', telefono='5551234', estado='pendiente', dia=10, tecnico=None):
+        from app.models import Servicio
+        servicio = Servicio(tipo='reparación', descripcion=descripcion, cliente_nombre=cliente,
+                            cliente_telefono=telefono, costo=10.0, estado=estado,
+                            tecnico_id=tecnico.id if tecnico else None,
+                            fecha_recepcion=datetime.datetime(2024, 1, dia))
+        db.session.add(servicio)
+        db.session.commit()
+        return servicio
+    
+    def ids(self, query, **filters):
+        from app.utils.service_search import search_services
+        resultados, _ = search_services(query, **filters)
+        return [servicio.id for servicio, _ in resultados]
+    
+    def test_search_ranking_filters_and_sync(self):
+        """Prueba la búsqueda por síntoma, acentos, prefijos, filtros y el índice al editar"""
+        from app.utils.service_events import record_event
+        pantalla = self.servicio('Pantalla rota, no carga la batería', estado='completado', dia=5)
+        carga = self.servicio('No carga', cliente='Luis Pérez', telefono='5559876', tecnico=self.tecnico)
+        otro = self.servicio('Cambio de carcasa')
+        
+        self.assertEqual(self.ids('no carga'), [carga.id, pantalla.id])  # más relevante la descripción corta
+        self.assertEqual(self.ids('bateria'), [pantalla.id])  # sin acento
+        self.assertEqual(self.ids('perez 55598'), [carga.id])  # nombre y prefijo de teléfono
+        self.assertEqual(self.ids('carga', estados=['pendiente']), [carga.id])
+        self.assertEqual(self.ids('carga', tecnico_id=self.tecnico.id), [carga.id])
+        self.assertEqual(self.ids('carga', desde=datetime.datetime(2024, 1, 1),
+                                  hasta=datetime.datetime(2024, 1, 6)), [pantalla.id])
+        self.assertEqual(self.ids('"; DROP'), [])
+        
+        # Escrituras: edición, notas del historial y borrado
+        otro.descripcion = 'Cambio de carcasa y pantalla'
+        record_event(carga, 'nota', 'Conector dañado')
+        db.session.commit()
+        self.assertIn(otro.id, self.ids('pantalla'))
+        self.assertEqual(self.ids('conector'), [carga.id])
+        db.session.delete(pantalla)
+        db.session.commit()
+        self.assertEqual(self.ids('bateria'), [])
+    
+    def test_search_in_list_and_api(self):
+        """Prueba la búsqueda desde el listado de servicios y su variante JSON"""
+        from app.routes import servicios as servicios_routes
+        for i in range(3):
+            self.servicio(f'Pantalla {i}', tecnico=self.tecnico)
+        self.servicio('Altavoz', tecnico=self.tecnico)
+        self.client.post('/login', data={'username': 'tecnico', 'password': 'clave'})
+        
+        with mock.patch.object(servicios_routes, 'SERVICES_PER_PAGE', 2):
+            data = self.client.get('/servicios/api/mis-servicios', query_string={'q': 'pantalla'}).get_json()
+            self.assertEqual(len(data['servicios']), 2)
+            self.assertIn('[Pantalla]', data['servicios'][0]['fragmento'])
+            data = self.client.get('/servicios/api/mis-servicios',
+                                   query_string={'q': 'pantalla', 'despues': data['siguiente']}).get_json()
+            self.assertEqual(len(data['servicios']), 1)
+            self.assertIsNone(data['siguiente'])
+        response = self.client.get('/servicios/tecnicos', query_string={'q': 'altavoz'})
+        self.assertIn(b'[Altavoz]', response.data)
+        self.assertNotIn(b'Pantalla 0', response.data)
+
+    def test_search_cursor_pages_and_own_list(self):
+        """Prueba que la búsqueda pagina por cursor sin repetir resultados y el listado propio del técnico"""
+        from app.routes import servicios as servicios_routes
+        for dia in (3, 3, 4, 4, 5):
+            self.servicio('Pantalla rota del equipo', tecnico=self.tecnico, dia=dia)
+        self.servicio('Pantalla', tecnico=self.tecnico, estado='en_progreso')
+        self.client.post('/login', data={'username': 'tecnico', 'password': 'clave'})
+        esperado = self.ids('pantalla', per_page=100)
+        
+        with mock.patch.object(servicios_routes, 'SERVICES_PER_PAGE', 2):
+            ids, cursor = [], None
+            while True:
+                data = self.client.get('/servicios/api/mis-servicios',
+                                       query_string={'q': 'pantalla', 'despues': cursor or ''}).get_json()
+                ids += [s['id'] for s in data['servicios']]
+                cursor = data['siguiente']
+                if not cursor:
+                    break
+        self.assertEqual(ids, esperado)
+        self.assertEqual(self.client.get('/servicios/api/mis-servicios',
+                                         query_string={'q': 'pantalla', 'despues': '2'}).status_code, 400)
+        
+        page = self.client.get('/servicios/tecnicos/mis-servicios').get_data(as_text=True)
+        self.assertIn('En Progreso', page)
+        self.assertNotIn('Todos los técnicos', page)
+        self.assertIn(f'<option value="{self.tecnico.id}">Técnico</option>', page)
+    
+class TestClientList(unittest.TestCase):
+    
+    def setUp(self):
+        self.app = create_app('testing')
+        self.client = self.app.test_client()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        db.session.add(Usuario(username='vendedor', password=generate_password_hash('clave'),
+                               nombre='Vendedor', rol='vendedor'))
+        db.session.commit()
+    
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+    
+    def test_phone_normalization_and_search(self):
+        """Prueba el teléfono normalizado y la búsqueda por prefijo de nombre y teléfono"""
+        from app.models import Cliente
+        from app.utils.clients import client_page
+        nombres = ['ana', 'Ana', 'Andrés', 'beto', 'Bea', 'Carla', 'carlos']
+        clientes = [Cliente(nombre=nombre, telefono=f'(555) 100-{i:04d}') for i, nombre in enumerate(nombres)]
+        clientes.append(Cliente(nombre='Dora', telefono='+52 1 555 2000'))
+        clientes.append(Cliente(nombre='Eva', telefono='sin teléfono'))
+        db.session.add_all(clientes)
+        db.session.commit()
+        self.assertEqual(clientes[0].telefono_normalizado, '5551000000')
+        self.assertEqual(clientes[7].telefono_normalizado, '5215552000')
+        self.assertIsNone(clientes[8].telefono_normalizado)
+        clientes[7].telefono = '555-3000'
+        db.session.commit()
+        self.assertEqual(clientes[7].telefono_normalizado, '5553000')
+        
+        def nombres_de(query, per_page=3):
+            found, cursor = [], None
+            while True:
+                page = client_page(query, cursor, per_page=per_page)
+                found += [cliente.nombre for cliente in page.items]
+                cursor = page.next_cursor
+                if not cursor:
+                    return found
+        
+        self.assertEqual(nombres_de(''), ['ana', 'Ana', 'Andrés', 'Bea', 'beto', 'Carla', 'carlos', 'Dora', 'Eva'])
+        self.assertEqual(nombres_de('AN', per_page=1), ['ana', 'Ana', 'Andrés'])
+        self.assertEqual(nombres_de('car'), ['Carla', 'carlos'])
+        self.assertEqual(nombres_de('555 100-000'), ['ana', 'Ana', 'Andrés', 'Bea', 'beto', 'Carla', 'carlos'])
+        self.assertEqual(nombres_de('(555) 3'), ['Dora'])
+        self.assertEqual(nombres_de('zz'), [])
+        with self.assertRaises(ValueError):
+            client_page('', 'x')
+    
+    def test_list_page_index_and_backfill(self):
+        """Prueba el listado paginado, los índices y el backfill de teléfonos existentes"""
+        from app.models import Cliente
+        from app.routes import clientes as clientes_routes
+        from app.utils.backfill import run_backfill
+        from app.utils.clients import ClientPhoneBackfill, client_sort_key, search_clients
+        db.session.add_all([Cliente(nombre=f'Cliente {i:02d}', telefono=f'555-00{i:02d}') for i in range(5)])
+        db.session.commit()
+        self.client.post('/login', data={'username': 'vendedor', 'password': 'clave'})
+        
+        with mock.patch.object(clientes_routes, 'CLIENTS_PER_PAGE', 2):
+            response = self.client.get('/clientes/', query_string={'q': 'cliente'})
+            self.assertIn(b'Cliente 01', response.data)
+            self.assertNotIn(b'Cliente 02', response.data)
+            self.assertIn(b'despues=', response.data)
+        response = self.client.get('/clientes/', query_string={'q': '555 0003'})
+        self.assertIn(b'Cliente 03', response.data)
+        self.assertNotIn(b'Cliente 04', response.data)
+        self.assertEqual(self.client.get('/clientes/?despues=x').status_code, 302)
+        
+        for busqueda, index in (('cli', 'ix_cliente_nombre'), ('555', 'ix_cliente_telefono_normalizado')):
+            query = search_clients(busqueda).order_by(client_sort_key(), Cliente.id).limit(25)
+            sql = str(query.statement.compile(dialect=db.engine.dialect, compile_kwargs={'literal_binds': True}))
+            plan = ' '.join(str(row[-1]) for row in db.session.execute(text('EXPLAIN QUERY PLAN ' + sql)))
+            self.assertIn(index, plan)
+        
+        # Clientes guardados antes de la columna
+        db.session.execute(Cliente.__table__.update().values(telefono_normalizado=None))
+        db.session.commit()
+        state = run_backfill(ClientPhoneBackfill(pause=0), progress=None)
+        self.assertEqual(state.modificadas, 5)
+        db.session.expire_all()
+        self.assertEqual(Cliente.query.filter_by(telefono_normalizado='5550004').one().nombre, 'Cliente 04')
+
+class TestClientDedup(unittest.TestCase):
+    
+    def setUp(self):
+        self.app = create_app('testing')
+        self.client = self.app.test_client()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.gerente = Usuario(username='gerente', password=generate_password_hash('clave'),
+                               nombre='Gerente', rol='gerente')
+        db.session.add(self.gerente)
+        db.session.commit()
+    
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+    
+    def clientes(self, *datos):
+        from app.models import Cliente
+        clientes = [Cliente(nombre=nombre, telefono=telefono) for nombre, telefono in datos]
+        db.session.add_all(clientes)
+        db.session.commit()
+        return clientes
+    
+    def test_blocking_keys_and_groups(self):
+        """Prueba las claves de bloque, los pares candidatos y los grupos de duplicados"""
+        from app.utils.client_dedup import duplicate_groups, duplicate_pairs
+        from app.utils.clients import phonetic_key
+        self.assertEqual(phonetic_key('Xiomara González'), phonetic_key('gonzales  XIOMARA'))
+        self.assertEqual(phonetic_key('Cecilia Vázquez'), phonetic_key('Sesilia Basquez'))
+        juan, juan2, juan3, maria, luis, otro_luis = self.clientes(
+            ('Juan Pérez', '555-111-2222'), ('juan perez', None), ('Juan Peres', '(555) 1112222'),
+            ('María Pérez', '5551112222'),  # misma casa, otra persona
+            ('Luis Gómez', '5553334444'), ('Luis Gomez', '5559998888'))  # mismo nombre, otro teléfono
+        self.assertEqual(juan.nombre_fonetico, juan2.nombre_fonetico)
+        
+        stats = {}
+        pairs = list(duplicate_pairs(stats=stats))
+        self.assertEqual({(a, b) for a, b, _ in pairs},
+                         {(juan.id, juan2.id), (juan.id, juan3.id), (juan2.id, juan3.id)})
+        self.assertEqual(stats['bloques'], 3)
+        self.assertEqual(stats['comparaciones'], 6)  # no 15: solo dentro de cada bloque
+        self.assertEqual(duplicate_groups(pairs), [[juan.id, juan2.id, juan3.id]])
+        list(duplicate_pairs(max_block_size=2, stats=stats))
+        self.assertEqual(stats['omitidos'], [('telefono_normalizado', '5551112222', 3),
+                                             ('nombre_fonetico', 'JN PRS', 3)])
+    
+    def test_merge_moves_sales(self):
+        """Prueba la fusión: ventas y ventas archivadas pasan al cliente que queda"""
+        from app.models import Cliente, VentaArchivo
+        original, copia = self.clientes(('Ana Ruiz', None), ('Ana Ruis', '555 123 4567'))
+        copia.email = 'ana@example.com'
+        db.session.add_all([
+            Venta(vendedor_id=self.gerente.id, cliente_id=copia.id, cliente_nombre='Ana', total=10),
+            Venta(vendedor_id=self.gerente.id, cliente_id=original.id, cliente_nombre='Ana', total=5),
+            VentaArchivo(id=100, vendedor_id=self.gerente.id, cliente_id=copia.id, cliente_nombre='Ana'),
+        ])
+        db.session.commit()
+        self.client.post('/login', data={'username': 'gerente', 'password': 'clave'})
+        
+        data = self.client.get(f'/clientes/{original.id}/duplicados').get_json()
+        self.assertEqual([d['id'] for d in data['duplicados']], [copia.id])
+        response = self.client.post(f'/clientes/{original.id}/fusionar', json={'duplicados': [copia.id]})
+        self.assertEqual(response.get_json(), {'success': True, 'ventas_movidas': 2})
+        
+        db.session.expire_all()
+        self.assertIsNone(db.session.get(Cliente, copia.id))
+        self.assertEqual(Venta.query.filter_by(cliente_id=original.id).count(), 2)
+        self.assertEqual(db.session.get(VentaArchivo, 100).cliente_id, original.id)
+        original = db.session.get(Cliente, original.id)
+        self.assertEqual((original.email, original.telefono_normalizado), ('ana@example.com', '5551234567'))
+        response = self.client.post(f'/clientes/{original.id}/fusionar', json={'duplicados': [copia.id]})
+        self.assertEqual(response.status_code, 404)
+
+class TestClientStats(unittest.TestCase):
+    
+    def setUp(self):
+        from app.models import Accesorio, Celular
+        self.app = create_app('testing')
+        self.client = self.app.test_client()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        db.session.add(Usuario(username='gerente', password=generate_password_hash('clave'),
+                               nombre='Gerente', rol='gerente'))
+        self.samsung, self.xiaomi = Marca(nombre='Samsung'), Marca(nombre='Xiaomi')
+        categoria = Categoria(nombre='Fundas')
+        db.session.add_all([self.samsung, self.xiaomi, categoria])
+        db.session.flush()
+        self.celular = Celular(modelo='A15', marca_id=self.samsung.id, precio=200.0, stock=10)
+        self.funda = Accesorio(nombre='Funda', marca_id=self.xiaomi.id, categoria_id=categoria.id,
+                               precio=10.0, stock=50, codigo_producto='F1')
+        db.session.add_all([self.celular, self.funda])
+        db.session.commit()
+        self.client.post('/login', data={'username': 'gerente', 'password': 'clave'})
+    
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+    
+    def vender(self, telefono, *items):
+        data = {'cliente_nombre': 'Ana', 'cliente_telefono': telefono, 'metodo_pago': 'efectivo',
+                'productos[]': [], 'tipos[]': [], 'cantidades[]': []}
+        for producto, tipo, cantidad in items:
+            data['productos[]'].append(str(producto.id))
+            data['tipos[]'].append(tipo)
+            data['cantidades[]'].append(str(cantidad))
+        self.client.post('/ventas/nueva', data=data)
+        return Venta.query.order_by(Venta.id.desc()).first()
+    
+    def resumen(self, cliente_id):
+        from app.models import ClienteResumen
+        db.session.expire_all()
+        r = db.session.get(ClienteResumen, cliente_id)
+        return (r.compras, r.total_gastado, r.ultima_compra, r.marca_favorita_id)
+    
+    def test_summary_follows_sales_and_cancellations(self):
+        """Prueba que process_sale y cancel_sale mantienen el resumen igual que un recálculo"""
+        from app.models import Cliente
+        from app.utils.client_stats import rebuild_client_stats
+        ana = Cliente(nombre='Ana', telefono='555 123 4567')
+        db.session.add(ana)
+        db.session.commit()
+        
+        primera = self.vender('(555) 123-4567', (self.celular, 'celular', 1), (self.funda, 'accesorio', 1))
+        self.assertEqual(primera.cliente_id, ana.id)
+        segunda = self.vender('5551234567', (self.funda, 'accesorio', 3))
+        self.assertEqual(self.resumen(ana.id), (2, 240.0, segunda.fecha_venta, self.xiaomi.id))
+        self.assertIsNone(self.vender('5550000000', (self.funda, 'accesorio', 1)).cliente_id)
+        
+        self.assertEqual(self.client.post(f'/ventas/{segunda.id}/cancelar').status_code, 204)
+        self.assertEqual(self.resumen(ana.id), (1, 210.0, primera.fecha_venta, self.samsung.id))
+        incremental = self.resumen(ana.id)
+        rebuild_client_stats()
+        self.assertEqual(self.resumen(ana.id), incremental)
+    
+    def test_rfm_ranking_and_history(self):
+        """Prueba el ranking RFM por segmentos y el historial de compras de un cliente"""
+        from app.models import Cliente, ClienteResumen
+        hoy = datetime.datetime(2024, 6, 1)
+        clientes = [Cliente(nombre=f'Cliente {i}') for i in range(5)]
+        db.session.add_all(clientes)
+        db.session.flush()
+        # (días desde la última compra, compras, total)
+        for cliente, (dias, compras, total) in zip(clientes, [(1, 20, 5000), (2, 1, 50), (200, 15, 3000),
+                                                              (300, 1, 20), (30, 5, 500)]):
+            db.session.add(ClienteResumen(cliente_id=cliente.id, compras=compras, total_gastado=total,
+                                          ultima_compra=hoy - datetime.timedelta(days=dias)))
+        db.session.add(Venta(vendedor_id=1, cliente_id=clientes[1].id, cliente_nombre='x', total=50,
+                             fecha_venta=hoy - datetime.timedelta(days=2)))
+        db.session.commit()
+        
+        data = self.client.get('/clientes/rfm').get_json()
+        self.assertEqual([c['id'] for c in data['clientes']][0], clientes[0].id)
+        segmentos = {c['id']: c['segmento'] for c in data['clientes']}
+        self.assertEqual(segmentos, {clientes[0].id: 'campeones', clientes[1].id: 'nuevos',
+                                     clientes[2].id: 'en_riesgo', clientes[3].id: 'perdidos',
+                                     clientes[4].id: 'ocasionales'})
+        data = self.client.get('/clientes/rfm', query_string={'segmento': 'perdidos'}).get_json()
+        self.assertEqual([(c['id'], c['en_segmento']) for c in data['clientes']], [(clientes[3].id, 1)])
+        self.assertEqual(self.client.get('/clientes/rfm?segmento=otro').status_code, 400)
+        
+        data = self.client.get(f'/clientes/{clientes[1].id}/historial').get_json()
+        self.assertEqual(data['resumen']['compras'], 1)
+        self.assertEqual([v['total'] for v in data['ventas']], [50.0])
+        self.assertIsNone(data['siguiente'])
+    
+    def test_history_continues_into_archive(self):
+        """Prueba que el historial del cliente sigue en las ventas archivadas que cuenta el resumen"""
+        from app.models import Cliente, VentaArchivo
+        from app.utils.archive import archive_sales
+        from app.utils.client_stats import rebuild_client_stats, record_client_sale
+        hoy = datetime.datetime(2024, 6, 1)
+        ana = Cliente(nombre='Ana')
+        db.session.add(ana)
+        db.session.flush()
+        for i in range(13):
+            db.session.add(Venta(vendedor_id=1, cliente_id=ana.id, cliente_nombre='Ana', total=10 + i,
+                                 fecha_venta=hoy - datetime.timedelta(days=30 * i)))
+        db.session.commit()
+        rebuild_client_stats()
+        # La más antigua tiene el id más alto y queda activa entre las archivadas
+        self.assertEqual(archive_sales(6, pause=0, now=hoy), 5)
+        
+        ids, archivadas, cursor = [], [], None
+        while True:
+            data = self.client.get(f'/clientes/{ana.id}/historial',
+                                   query_string={'despues': cursor} if cursor else {}).get_json()
+            ids += [v['id'] for v in data['ventas']]
+            archivadas += [v['archivada'] for v in data['ventas']]
+            cursor = data['siguiente']
+            if not cursor:
+                break
+        esperadas = sorted(Venta.query.all() + VentaArchivo.query.all(), key=lambda v: v.fecha_venta, reverse=True)
+        self.assertEqual(ids, [v.id for v in esperadas])
+        self.assertEqual(data['resumen']['compras'], len(ids))
+        self.assertEqual(archivadas, [False] * 7 + [True] * 5 + [False])
+        
+        # El resumen se actualiza con una sola sentencia (INSERT ... ON CONFLICT)
+        nueva = Venta(vendedor_id=1, cliente_id=ana.id, cliente_nombre='Ana', total=100, fecha_venta=hoy)
+        db.session.add(nueva)
+        db.session.flush()
+        record_client_sale(nueva, brands={})
+        db.session.commit()
+        self.assertEqual(self.resumen(ana.id)[:2], (14, sum(10 + i for i in range(13)) + 100.0))
+
+class TestSaleClientLinking(unittest.TestCase):
+    
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        vendedor = Usuario(username='vendedor', password='x', nombre='Vendedor', rol='vendedor')
+        db.session.add(vendedor)
+        db.session.commit()
+        self.vendedor_id = vendedor.id
+    
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+    
+    def test_links_by_phone_then_name_and_creates_missing_clients(self):
+        """Prueba que el backfill asocia ventas por teléfono y nombre, crea los clientes que faltan una sola vez y actualiza el resumen"""
+        from app.models import Cliente, ClienteResumen, VentaArchivo
+        from app.utils.backfill import load_backfills, run_backfill
+        ana = Cliente(nombre='Ana Ruiz', telefono='555 123 4567')
+        pedro = Cliente(nombre='Pedro Gómez')
+        db.session.add_all([ana, pedro])
+        db.session.flush()
+        inicio = datetime.datetime(2023, 1, 1)
+        ventas = [('Ana R.', '(555) 123-4567'), ('ANA RUIZ', None), ('Pedro Gomez', '555 987 6543'),
+                  ('Luis Paz', '555-111-2222'), ('Consumidor final', None), ('Luis Paz', '5551112222'),
+                  ('Pedro Gómez', '0000000'), ('Marta Díaz', None), ('marta diaz', None)]
+        db.session.add_all(Venta(vendedor_id=self.vendedor_id, cliente_nombre=nombre, cliente_telefono=telefono,
+                                 fecha_venta=inicio + datetime.timedelta(days=i), total=10.0)
+                           for i, (nombre, telefono) in enumerate(ventas))
+        db.session.add(VentaArchivo(id=100, vendedor_id=self.vendedor_id, cliente_nombre='Luis Paz',
+                                    cliente_telefono='555 111 2222', fecha_venta=inicio, total=5.0,
+                                    estado='completada'))
+        db.session.commit()
+        
+        backfills = load_backfills()
+        state = run_backfill(backfills['venta-cliente'](batch_size=2, pause=0), progress=None)
+        self.assertEqual((state.procesadas, state.modificadas), (9, 8))
+        run_backfill(backfills['venta-archivo-cliente'](pause=0), progress=None)
+        db.session.expire_all()
+        
+        vinculos = [v.cliente_id for v in Venta.query.order_by(Venta.id)]
+        self.assertEqual(vinculos[:4], [ana.id, ana.id, pedro.id, vinculos[3]])
+        self.assertEqual((vinculos[4], vinculos[5], vinculos[6]), (None, vinculos[3], pedro.id))
+        self.assertEqual(vinculos[7], vinculos[8])
+        luis = db.session.get(Cliente, vinculos[3])
+        self.assertEqual((luis.nombre, luis.telefono_normalizado, luis.nombre_fonetico),
+                         ('Luis Paz', '5551112222', 'LS PS'))
+        self.assertEqual(Cliente.query.count(), 4)
+        self.assertEqual(db.session.get(VentaArchivo, 100).cliente_id, luis.id)
+        resumen = db.session.get(ClienteResumen, luis.id)
+        self.assertEqual((resumen.compras, resumen.total_gastado, resumen.primera_compra), (3, 25.0, inicio))
+        self.assertEqual(db.session.get(ClienteResumen, pedro.id).compras, 2)
+
+class TestBatchValidation(unittest.TestCase):
+    
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        marca = Marca(nombre='Samsung')
+        db.session.add(marca)
+        db.session.flush()
+        db.session.add_all([Celular(modelo='A15', marca_id=marca.id, precio=200.0, stock=1, imei='490154203237518'),
+                            Usuario(username='vendedor', password='x', nombre='Vendedor', rol='vendedor')])
+        db.session.commit()
+        self.marca_id = marca.id
+    
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+    
+    def celular(self, imei, **extra):
+        return {'modelo': 'A25', 'marca_id': self.marca_id, 'precio': 250, 'stock': 0, 'imei': imei,
+                'ram': '6GB', 'almacenamiento': '128GB', 'color': 'Negro', **extra}
+    
+    def test_batch_errors_per_record(self):
+        """Prueba los errores por registro: Luhn, IMEI existente, repetidos en el lote y campos faltantes"""
+        from app.utils.validators import batch_summary, validate_products_batch, validate_users_batch
+        errores = validate_products_batch([
+            self.celular('356938035643809'),
+            self.celular('356938035643808'),
+            self.celular('49015420-3237518'),
+            self.celular('3569 3803 5643 809', precio='caro'),
+            self.celular('12345', ram=''),
+        ], 'celular')
+        self.assertEqual(errores[0], [])
+        self.assertEqual([e['campo'] for e in errores[1]], ['imei'])
+        self.assertIn('dígito de control', errores[1][0]['mensaje'])
+        self.assertEqual(errores[2], [{'campo': 'imei', 'mensaje': 'Este IMEI ya está registrado'}])
+        self.assertEqual([(e['campo'], e.get('duplicado_de')) for e in errores[3]], [('precio', None), ('imei', 0)])
+        self.assertEqual([e['campo'] for e in errores[4]], ['imei', 'ram'])
+        resumen = batch_summary(errores)
+        self.assertEqual(resumen['validos'], 1)
+        self.assertEqual(resumen['errores'][0]['registro'], 1)
+        
+        usuarios = validate_users_batch([
+            {'username': 'vendedor', 'nombre': 'Otro', 'rol': 'vendedor', 'password': 'secreta'},
+            {'username': 'tecnico1', 'nombre': 'Técnico', 'rol': 'tecnico', 'password': 'secreta'},
+            {'username': 'tecnico1', 'nombre': 'Técnico', 'rol': 'jefe', 'password': '123'},
+        ])
+        self.assertEqual([[e['campo'] for e in errores] for errores in usuarios],
+                         [['username'], [], ['rol', 'password', 'username']])
+        
+        from app.utils.validators import validate_product_data
+        self.assertEqual(validate_product_data(self.celular('490154203237518'), 'celular'),
+                         ['Este IMEI ya está registrado'])
+        # El formulario no exige el dígito de control (IMEI ya registrados que no lo cumplen)
+        self.assertEqual(validate_product_data(self.celular('356938035643808'), 'celular'), [])
+    
+    def test_invalid_and_missing_references(self):
+        """Prueba que marca y categoría deben ser ids enteros existentes, informados por registro"""
+        from app.utils.validators import validate_products_batch
+        errores = validate_products_batch([
+            self.celular('356938035643809', marca_id='abc'),
+            self.celular('356938035643817', marca_id=self.marca_id + 100),
+            self.celular('356938035643825', marca_id=f' {self.marca_id} '),
+        ], 'celular')
+        self.assertEqual(errores, [[{'campo': 'marca_id', 'mensaje': 'La marca no es válida'}],
+                                   [{'campo': 'marca_id', 'mensaje': 'La marca no existe'}], []])
+        
+        accesorio = {'nombre': 'Funda', 'marca_id': self.marca_id, 'precio': 10, 'stock': 5}
+        errores = validate_products_batch([dict(accesorio, categoria_id='x', codigo_producto='F1'),
+                                           dict(accesorio, categoria_id=999, codigo_producto='F2')], 'accesorio')
+        self.assertEqual(errores, [[{'campo': 'categoria_id', 'mensaje': 'La categoría no es válida'}],
+                                   [{'campo': 'categoria_id', 'mensaje': 'La categoría no existe'}]])
+    
+    def test_import_command_validates_whole_batch(self):
+        """Prueba que flask import-records no guarda nada si un registro falla y guarda el lote válido"""
+        import csv
+        runner = self.app.test_cli_runner()
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'celulares.csv')
+            
+            def escribir(*imeis):
+                with open(path, 'w', newline='', encoding='utf-8') as f:
+                    writer = csv.DictWriter(f, fieldnames=list(self.celular('').keys()))
+                    writer.writeheader()
+                    writer.writerows(self.celular(imei) for imei in imeis)
+            
+            escribir('356938035643809', '356938035643808')
+            result = runner.invoke(args=['import-records', path, '--tipo', 'celular'])
+            self.assertNotEqual(result.exit_code, 0)
+            self.assertIn('Registro 2: imei', result.output)
+            self.assertEqual(Celular.query.count(), 1)
+            
+            escribir('356938035643809', '3569 3803 5643 817')
+            result = runner.invoke(args=['import-records', path, '--tipo', 'celular', '--validar'])
+            self.assertIn('2 registros válidos', result.output)
+            self.assertEqual(Celular.query.count(), 1)
+            result = runner.invoke(args=['import-records', path, '--tipo', 'celular'])
+            self.assertEqual(result.exit_code, 0, result.output)
+            self.assertIn('2 registros importados', result.output)
+            self.assertEqual(sorted(c.imei for c in Celular.query.filter(Celular.modelo == 'A25')),
+                             ['356938035643809', '356938035643817'])
+            
+            # Un id de marca que no es un número se informa por registro, sin traceback
+            escribir('356938035643825')
+            with open(path, encoding='utf-8') as f:
+                contenido = f.read().replace(f',{self.marca_id},', ',abc,')
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(contenido)
+            result = runner.invoke(args=['import-records', path, '--tipo', 'celular'])
+            self.assertEqual(result.exit_code, 1)
+            self.assertIsInstance(result.exception, SystemExit)
+            self.assertIn('Registro 1: marca_id: La marca no es válida', result.output)
+    
+    def test_one_query_per_unique_field(self):
+        """Prueba que un lote de miles de registros hace una sola consulta por campo único o referencia"""
+        from sqlalchemy import event
+        from app.utils.validators import luhn_valid, validate_products_batch
+        imeis = []
+        base = 356938035600000
+        while len(imeis) < 3000:
+            base += 1
+            if luhn_valid(str(base)):
+                imeis.append(str(base))
+        statements = []
+        
+        def count(conn, cursor, statement, *args):
+            statements.append(statement)
+        
+        event.listen(db.engine, 'before_cursor_execute', count)
+        try:
+            errores = validate_products_batch([self.celular(imei) for imei in imeis], 'celular')
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count)
+        self.assertEqual(len(statements), 2)  # IMEI y marca
+        self.assertTrue(all(not e for e in errores))
+
+class TestTemplateCache(unittest.TestCase):
+    
+    def test_bytecode_cache_shared_between_apps(self):
+        """Prueba que la precompilación llena la caché de bytecode y otra app la reutiliza sin compilar"""
+        from app.utils.templates import init_template_cache, precompile_templates
+        with tempfile.TemporaryDirectory() as cache_dir:
+            primera = create_app('testing')
+            primera.config['TEMPLATE_CACHE_DIR'] = cache_dir
+            init_template_cache(primera)
+            compilados, _ = precompile_templates(primera)
+            self.assertGreater(compilados, 10)
+            self.assertEqual(len(os.listdir(cache_dir)), compilados)
+            
+            segunda = create_app('testing')
+            segunda.config['TEMPLATE_CACHE_DIR'] = cache_dir
+            init_template_cache(segunda)
+            with mock.patch.object(segunda.jinja_env, 'compile', side_effect=AssertionError('compiló')):
+                self.assertEqual(precompile_templates(segunda)[0], compilados)
+            self.assertIn('celulares.html', {name for _, name in segunda.jinja_env.cache.keys()})
+
+class TestCompressionAndAssets(unittest.TestCase):
+    
+    def setUp(self):
+        self.app = create_app('testing')
+        self.client = self.app.test_client()
+        
+        @self.app.route('/_prueba/<int:n>')
+        def prueba(n):
+            return {'items': [{'id': i, 'nombre': f'Producto {i}'} for i in range(n)]}
+    
+    def test_compresses_text_above_threshold(self):
+        """Prueba gzip/brotli según Accept-Encoding y que las respuestas chicas no se comprimen"""
+        import gzip
+        import json
+        from app.utils.compression import available_encodings, choose_encoding
+        grande = self.client.get('/_prueba/500', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(grande.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', grande.headers['Vary'])
+        self.assertEqual(len(json.loads(gzip.decompress(grande.get_data()))['items']), 500)
+        self.assertLess(int(grande.headers['Content-Length']), 5000)
+        
+        chica = self.client.get('/_prueba/2', headers={'Accept-Encoding': 'gzip'})
+        self.assertNotIn('Content-Encoding', chica.headers)
+        self.assertNotIn('Content-Encoding', self.client.get('/_prueba/500').headers)
+        
+        self.assertEqual(choose_encoding('gzip;q=0, deflate'), None)
+        self.assertEqual(choose_encoding('*'), available_encodings()[0])
+        self.assertEqual(choose_encoding('br;q=0, gzip'), 'gzip')
+    
+    def test_fingerprinted_static_files_are_immutable(self):
+        """Prueba las URL con huella, la caché inmutable, los 304 con ETag comprimido y el fallback a la CDN"""
+        from flask import url_for
+        from app.utils.assets import VENDOR_ASSETS
+        with self.app.test_request_context():
+            manifest = url_for('static', filename='manifest.json')
+            sw = url_for('static', filename='sw.js')
+            bootstrap = self.app.jinja_env.globals['vendor_url']('bootstrap/css/bootstrap.min.css')
+        self.assertRegex(manifest, r'^/static/manifest\.[0-9a-f]{10}\.json$')
+        self.assertEqual(sw, '/static/sw.js')
+        self.assertEqual(bootstrap, VENDOR_ASSETS['bootstrap/css/bootstrap.min.css'])
+        
+        response = self.client.get(manifest)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertIn('"name"', response.get_data(as_text=True))
+        viejo = self.client.get('/static/manifest.0123456789.json')
+        self.assertEqual((viejo.status_code, viejo.headers['Cache-Control']), (200, 'no-cache'))
+        self.assertEqual(self.client.get('/static/no-existe.0123456789.js').status_code, 404)
+        
+        comprimido = self.client.get('/static/sw.js', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(comprimido.headers['Content-Encoding'], 'gzip')
+        self.assertTrue(comprimido.headers['ETag'].startswith('W/'))
+        repetido = self.client.get('/static/sw.js', headers={'Accept-Encoding': 'gzip',
+                                                             'If-None-Match': comprimido.headers['ETag']})
+        self.assertEqual(repetido.status_code, 304)
+        
+        from app.utils.assets import StaticAssets, vendor_url
+        with tempfile.TemporaryDirectory() as folder:
+            os.makedirs(os.path.join(folder, 'vendor', 'jquery'))
+            with open(os.path.join(folder, 'vendor', 'jquery', 'jquery.min.js'), 'w') as f:
+                f.write('/* jquery */')
+            self.app.extensions['static_assets'] = StaticAssets(folder)
+            with self.app.test_request_context():
+                self.assertRegex(vendor_url('jquery/jquery.min.js'),
+                                 r'^/static/vendor/jquery/jquery\.min\.[0-9a-f]{10}\.js$')
+
+    def test_service_worker_precaches_same_origin_assets(self):
+        """Prueba que la lista de precarga del service worker solo tiene URL locales con la huella de las páginas"""
+        from app.utils.assets import StaticAssets
+        data = self.client.get('/sw-precache.json').get_json()
+        self.assertTrue(data['urls'])
+        self.assertTrue(all(url.startswith('/static/') for url in data['urls']))
+        self.assertRegex(data['urls'][0], r'^/static/manifest\.[0-9a-f]{10}\.json$')
+        with open(os.path.join(self.app.static_folder, 'sw.js')) as f:
+            self.assertNotIn('https://', f.read())
+        
+        with tempfile.TemporaryDirectory() as folder:
+            for name in ('vendor/jquery/jquery.min.js', 'vendor/fontawesome/webfonts/fa-solid-900.woff2'):
+                os.makedirs(os.path.join(folder, os.path.dirname(name)), exist_ok=True)
+                with open(os.path.join(folder, name), 'w') as f:
+                    f.write('/* local */')
+            self.app.extensions['static_assets'] = StaticAssets(folder)
+            urls = self.client.get('/sw-precache.json').get_json()['urls']
+            self.assertRegex(urls[2], r'^/static/vendor/jquery/jquery\.min\.[0-9a-f]{10}\.js$')
+            self.assertIn('/static/vendor/fontawesome/webfonts/fa-solid-900.woff2', urls)
+            self.assertEqual(len(urls), 4)
+
+class TestCatalogSync(unittest.TestCase):
+    
+    def setUp(self):
+        self.app = create_app('testing')
+        self.client = self.app.test_client()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        db.session.add(Usuario(username='vendedor', password=generate_password_hash('clave'),
+                               nombre='Vendedor', rol='vendedor'))
+        self.marca = Marca(nombre='Samsung')
+        self.categoria = Categoria(nombre='Fundas')
+        db.session.add_all([self.marca, self.categoria])
+        db.session.commit()
+    
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+    
+    def test_changes_since_version(self):
+        """Prueba que cada cambio de producto sube la versión y que desde=N devuelve solo lo posterior, con las bajas"""
+        from app.utils.catalog import catalog_changes, current_version
+        a54 = Celular(modelo='Galaxy A54', marca_id=self.marca.id, precio=350.0, stock=5)
+        s23 = Celular(modelo='Galaxy S23', marca_id=self.marca.id, precio=800.0, stock=2)
+        funda = Accesorio(nombre='Funda A54', marca_id=self.marca.id, categoria_id=self.categoria.id,
+                          precio=15.0, stock=10, codigo_producto='FUN-A54')
+        db.session.add_all([a54, s23, funda])
+        db.session.commit()
+        self.assertEqual((a54.version_catalogo, funda.version_catalogo, current_version()), (1, 1, 1))
+        
+        completo = catalog_changes(0)
+        self.assertTrue(completo['completo'])
+        self.assertEqual((len(completo['celulares']), len(completo['accesorios'])), (2, 1))
+        self.assertEqual(completo['marcas'][str(self.marca.id)], 'Samsung')
+        
+        a54.stock -= 1
+        db.session.commit()
+        s23.precio = s23.precio  # Sin cambios: no sube la versión
+        db.session.commit()
+        db.session.delete(funda)
+        db.session.commit()
+        self.assertEqual(current_version(), 3)
+        
+        cambios = catalog_changes(1)
+        self.assertFalse(cambios['completo'])
+        self.assertEqual([(c['id'], c['stock'], c['version']) for c in cambios['celulares']], [(a54.id, 4, 2)])
+        self.assertEqual((cambios['accesorios'], cambios['bajas']), ([], [{'tipo': 'accesorio', 'id': 1}]))
+        self.assertEqual(catalog_changes(3)['celulares'], [])
+        self.assertTrue(catalog_changes(99)['completo'])
+    
+    def test_sync_and_lookup_endpoints(self):
+        """Prueba las rutas de sincronización y de búsqueda (con sesión) y la cabecera del service worker"""
+        db.session.add_all([
+            Celular(modelo='Galaxy A54', marca_id=self.marca.id, precio=350.0, stock=5),
+            Celular(modelo='Galaxy A14', marca_id=self.marca.id, precio=180.0, stock=0),
+            Accesorio(nombre='Funda Galaxy', marca_id=self.marca.id, categoria_id=self.categoria.id,
+                      precio=15.0, stock=10, codigo_producto='FUN-A54'),
+        ])
+        db.session.commit()
+        self.assertEqual(self.client.get('/productos/api/catalogo').status_code, 302)
+        self.client.post('/login', data={'username': 'vendedor', 'password': 'clave'})
+        
+        response = self.client.get('/productos/api/catalogo?desde=0')
+        self.assertEqual(response.json['version'], 1)
+        self.assertEqual(len(response.json['celulares']), 2)
+        self.assertIn('no-store', response.headers['Cache-Control'])
+        self.assertEqual(self.client.get('/productos/api/catalogo?desde=1').json['celulares'], [])
+        
+        productos = self.client.get('/productos/api/buscar?q=galaxy').json['productos']
+        self.assertEqual([(p['tipo'], p['nombre']) for p in productos],
+                         [('celular', 'Samsung Galaxy A54'), ('accesorio', 'Funda Galaxy')])
+        productos = self.client.get('/productos/api/buscar?q=samsung fun-a5').json['productos']
+        self.assertEqual([p['nombre'] for p in productos], ['Funda Galaxy'])
+        
+        sw = self.client.get('/static/sw.js')
+        self.assertEqual(sw.headers['Service-Worker-Allowed'], '/')
+
+
+# Presupuesto de import (ms, tiempo acumulado de `python -X importtime`) de
+# los scripts de línea de comandos. Se puede escalar con IMPORT_TIME_BUDGET_SCALE
+# en máquinas lentas.
+IMPORT_TIME_BUDGETS_MS = {
+    'backup': 150,
+    'migrate_db': 150,
+    'run_migrations': 150,
+    'app.seed': 150,
+}
+
+# Módulos que ningún script debe cargar solo por ser importado
+HEAVY_MODULES = ('flask', 'flask_sqlalchemy', 'sqlalchemy', 'gevent', 'psycopg2', 'app.routes')
+
+class TestImportTime(unittest.TestCase):
+    
+    def _importtime(self, module):
+        """Devuelve {módulo: tiempo acumulado en µs} al importar `module` en un intérprete nuevo"""
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True
+        )
+        times = {}
+        for line in result.stderr.splitlines():
+            if not line.startswith('import time:') or '|' not in line:
+                continue
+            _, cumulative, name = line.split('|')
+            if cumulative.strip().isdigit():
+                times[name.strip()] = int(cumulative)
+        return times
+    
+    def test_entry_points_import_budget(self):
+        """Prueba que los scripts se importan dentro de su presupuesto y sin dependencias pesadas"""
+        scale = float(os.environ.get('IMPORT_TIME_BUDGET_SCALE', '1'))
+        for module, budget_ms in IMPORT_TIME_BUDGETS_MS.items():
+            with self.subTest(module=module):
+                times = self._importtime(module)
+                elapsed_ms = times[module] / 1000
+                self.assertLessEqual(elapsed_ms, budget_ms * scale,
+                                     f'{module} tardó {elapsed_ms:.1f} ms en importarse')
+                heavy = [name for name in times
+                         if any(name == m or name.startswith(m + '.') for m in HEAVY_MODULES)]
+                self.assertEqual(heavy, [], f'{module} importa dependencias pesadas')
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file